@@ -0,0 +1,223 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("validate-timetable")
+@click.option("--from-date", required=True, help="First day of the term")
+@click.option("--to-date", required=True, help="Last day of the term")
+@pass_context
+def validate_timetable(context, from_date, to_date):
+	"Check all batches of a term for classroom and teacher conflicts"
+	import frappe
+	
+	from smspro.sms_pro.api.timetable import validate_timetable
+	
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	
+	try:
+		result = validate_timetable(from_date, to_date)
+	finally:
+		frappe.destroy()
+	
+	if result["status"] != "success":
+		click.secho(result["message"], fg="red")
+		raise SystemExit(1)
+	
+	for conflict in result["conflicts"]:
+		click.echo(
+			f"{conflict.resource.title()} {conflict.value} on {conflict.weekday}: "
+			f"{conflict.batch_name} overlaps {conflict.conflicting_batch_name}"
+		)
+	
+	click.secho(result["message"], fg="yellow" if result["conflicts"] else "green")
+	
+	if result["conflicts"]:
+		raise SystemExit(1)
+
+
+@click.command("notification-stub")
+@click.option("--port", default=8765, type=int, help="Port to listen on")
+@click.option("--fail-rate", default=0.0, type=float, help="Share of requests answered with 503")
+def notification_stub(port, fail_rate):
+	"Run a local stub SMS provider for testing the notification gateway"
+	from smspro.sms_pro.notification_gateway import run_stub_provider
+	
+	run_stub_provider(port=port, fail_rate=fail_rate)
+
+
+@click.command("find-duplicate-students")
+@click.option("--output", help="Write merge suggestions to this CSV file")
+@click.option("--threshold", default=None, type=float, help="Minimum match score (0-1)")
+@pass_context
+def find_duplicate_students(context, output=None, threshold=None):
+	"Sweep all students for likely duplicates and suggest merges"
+	import csv
+	import sys
+	from contextlib import nullcontext
+	
+	import frappe
+	
+	from smspro.sms_pro.doctype.student.student_duplicates import DUPLICATE_THRESHOLD, find_duplicate_students
+	
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	
+	try:
+		suggestions = find_duplicate_students(threshold if threshold is not None else DUPLICATE_THRESHOLD)
+	finally:
+		frappe.destroy()
+	
+	fields = ["keep", "keep_name", "merge", "merge_name", "score", "reasons"]
+	with open(output, "w", newline="", encoding="utf-8-sig") if output else nullcontext(sys.stdout) as f:
+		writer = csv.DictWriter(f, fieldnames=fields)
+		writer.writeheader()
+		writer.writerows(suggestions)
+	
+	click.secho(f"{len(suggestions)} merge suggestions", fg="yellow" if suggestions else "green", err=True)
+
+
+@click.command("replica-status")
+@pass_context
+def replica_status(context):
+	"Check the read replica's replication state and lag"
+	import frappe
+	
+	from smspro.sms_pro.replica import check_replica
+	
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	
+	try:
+		if not frappe.conf.read_from_replica or not frappe.conf.replica_host:
+			click.secho("No read replica configured (read_from_replica, replica_host)", fg="yellow")
+			return
+		
+		host = frappe.conf.replica_host
+		status = check_replica()
+	finally:
+		frappe.destroy()
+	
+	lag = "unknown" if status["lag"] is None else f"{status['lag']}s"
+	if status["healthy"]:
+		click.secho(f"Replica {host} healthy, lag {lag}", fg="green")
+	else:
+		click.secho(f"Replica unhealthy ({status['reason']}), lag {lag}, reads use the primary", fg="red")
+		raise SystemExit(1)
+
+
+@click.command("reprice-enrollments")
+@click.option("--course", required=True, help="Course to reprice")
+@click.option("--fee", default=None, type=float, help="New course fee (defaults to the course's current fee)")
+@click.option("--batch", help="Only enrollments of this batch")
+@click.option("--output", help="Write the diff to this CSV file")
+@click.option("--apply", "apply_changes", is_flag=True, default=False, help="Write the new fees, without it this is a dry run")
+@pass_context
+def reprice_enrollments(context, course, fee=None, batch=None, output=None, apply_changes=False):
+	"Apply a course fee change to its active enrollments and open invoices"
+	import csv
+	import sys
+	from contextlib import nullcontext
+
+	import frappe
+
+	from smspro.sms_pro.doctype.student_enrollment.enrollment_repricing import (
+		DIFF_FIELDS,
+		reprice_enrollments,
+	)
+	
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	
+	try:
+		diff = reprice_enrollments(course, fee, batch, dry_run=not apply_changes)
+	finally:
+		frappe.destroy()
+	
+	with open(output, "w", newline="", encoding="utf-8-sig") if output else nullcontext(sys.stdout) as f:
+		writer = csv.DictWriter(f, fieldnames=DIFF_FIELDS, extrasaction="ignore")
+		writer.writeheader()
+		writer.writerows(diff)
+	
+	if apply_changes:
+		click.secho(f"{len(diff)} enrollments repriced", fg="green", err=True)
+	else:
+		click.secho(f"Dry run: {len(diff)} enrollments would be repriced, pass --apply to write", fg="yellow", err=True)
+
+
+@click.command("load-test")
+@click.argument("scenario", type=click.Choice(["registration", "attendance"]))
+@click.option("--url", default="http://localhost:8000", help="Base URL of the running bench")
+@click.option("--users", default=100, type=int, help="Concurrent clients")
+@click.option("--duration", default=60, type=int, help="Seconds to run")
+@click.option("--ramp-up", default=5, type=int, help="Seconds over which clients start")
+@click.option("--students", default=500, type=int, help="Students to seed")
+@click.option("--batches", default=4, type=int, help="Batches to seed")
+@click.option("--output", help="Write the report to this JSON file")
+@click.option("--cleanup", is_flag=True, default=False, help="Delete the load-test records afterwards")
+@pass_context
+def load_test(context, scenario, url, users, duration, ramp_up, students, batches, output=None, cleanup=False):
+	"Drive concurrent clients through a busy-hour scenario and check invariants"
+	import json
+	
+	import frappe
+	
+	from smspro.sms_pro.load_test import LoadTestRun, check_invariants, delete_load_test_data, seed_site
+	
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	
+	try:
+		seed = seed_site(scenario, students=students, batches=batches)
+		click.echo(f"Seeded {len(seed.students)} students and {len(seed.batches)} batches, running {users} clients for {duration}s")
+		
+		report = LoadTestRun(url, site, seed, users=users, duration=duration, ramp_up=ramp_up).run()
+		
+		# Start a new transaction to see the clients' writes
+		frappe.db.commit()
+		report["invariants"] = check_invariants()
+		
+		if cleanup:
+			delete_load_test_data()
+	finally:
+		frappe.destroy()
+	
+	click.echo(f"{'operation':<20}{'requests':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  outcomes")
+	for operation, stats in report["operations"].items():
+		outcomes = ", ".join(f"{outcome} {count}" for outcome, count in sorted(stats["outcomes"].items()))
+		click.echo(
+			f"{operation:<20}{stats['requests']:>10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}  {outcomes}"
+		)
+	
+	click.echo(
+		f"{report['throughput']} req/s, error rate {report['error_rate']:.2%}, "
+		f"deadlocks {report['totals'].get('deadlock', 0)}, lock timeouts {report['totals'].get('lock_timeout', 0)}"
+	)
+	
+	violations = 0
+	for name, rows in report["invariants"].items():
+		if rows:
+			click.secho(f"{name}: {len(rows)}", fg="yellow" if name == "stale_enrollment_counts" else "red")
+			if name != "stale_enrollment_counts":
+				violations += len(rows)
+	
+	if output:
+		with open(output, "w") as f:
+			json.dump(report, f, indent=1, default=str)
+	
+	if violations:
+		raise SystemExit(1)
+
+
+commands = [
+	validate_timetable,
+	notification_stub,
+	find_duplicate_students,
+	replica_status,
+	reprice_enrollments,
+	load_test
+]
@@ -140,6 +140,13 @@ app_license = "mit"
 # 	}
 # }
 
+doc_events = {
+	"Payment Entry": {
+		"on_submit": "smspro.sms_pro.doctype.sms_payment_ledger.sms_payment_ledger.make_ledger_entries",
+		"on_cancel": "smspro.sms_pro.doctype.sms_payment_ledger.sms_payment_ledger.reverse_ledger_entries"
+	}
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -192,12 +199,12 @@ app_license = "mit"
 # Request Events
 # ----------------
 # before_request = ["smspro.utils.before_request"]
-# after_request = ["smspro.utils.after_request"]
+after_request = ["smspro.sms_pro.replica.close_replica"]
 
 # Job Events
 # ----------
 # before_job = ["smspro.utils.before_job"]
-# after_job = ["smspro.utils.after_job"]
+after_job = ["smspro.sms_pro.replica.close_replica"]
 
 # User Data Protection
 # --------------------
@@ -239,10 +246,23 @@ app_license = "mit"
 
 # Reports
 # ------------------
-scheduled_events = {
+scheduler_events = {
 	"daily": [
-		"smspro.api.payment.send_payment_reminders"
-	]
+		"smspro.sms_pro.doctype.receivables_aging_snapshot.receivables_aging_snapshot.rebuild_aging_snapshot",
+		"smspro.sms_pro.api.dashboard.record_kpi_snapshot",
+		"smspro.sms_pro.doctype.attendance_archive.attendance_archive.archive_completed_batches",
+		"smspro.sms_pro.api.risk.compute_risk_scores",
+		"smspro.sms_pro.api.payment.send_payment_reminders"
+	],
+	"hourly": [
+		"smspro.sms_pro.notification_gateway.retry_notifications"
+	],
+	"cron": {
+		# After the evening classes
+		"30 21 * * *": [
+			"smspro.sms_pro.doctype.absence_notice.absence_notice.send_absence_digests"
+		]
+	}
 }
 
 # Include API files
@@ -253,6 +273,7 @@ include_js = [
 # Reports
 reports = [
 	"SMS Pro:Student Payment Report",
-	"SMS Pro:Attendance Report"
+	"SMS Pro:Attendance Report",
+	"SMS Pro:Receivables Aging"
 ]
 
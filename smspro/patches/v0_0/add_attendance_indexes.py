@@ -0,0 +1,6 @@
+import frappe
+
+
+def execute():
+	"""Add the batch and date index to sites migrated before it existed"""
+	frappe.db.add_index("Attendance", ["batch", "attendance_date"])
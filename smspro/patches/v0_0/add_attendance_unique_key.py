@@ -0,0 +1,6 @@
+import frappe
+
+
+def execute():
+	"""Add the unique key on student, batch and date to sites migrated before it existed"""
+	frappe.db.add_unique("Attendance", ["student", "batch", "attendance_date"])
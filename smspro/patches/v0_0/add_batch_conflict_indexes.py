@@ -0,0 +1,7 @@
+import frappe
+
+
+def execute():
+	"""Add the teacher and classroom indexes of the conflict check to sites migrated before they existed"""
+	frappe.db.add_index("Batch", ["teacher", "start_date"])
+	frappe.db.add_index("Batch", ["classroom", "start_date"])
@@ -0,0 +1,20 @@
+import frappe
+
+from smspro.sms_pro.doctype.student_search_token.student_search_token import (
+	get_block_keys,
+	update_search_tokens,
+)
+
+
+def execute():
+	"""Index duplicate-detection blocking keys for existing students"""
+	frappe.reload_doc("sms_pro", "doctype", "student_search_token")
+	
+	students = frappe.get_all(
+		"Student",
+		fields=["name", "first_name", "last_name", "date_of_birth", "phone_number", "parent_phone",
+				"search_name", "search_key"]
+	)
+	
+	for student in students:
+		update_search_tokens(student.name, student.search_key, get_block_keys(student))
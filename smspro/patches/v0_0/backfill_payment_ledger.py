@@ -0,0 +1,28 @@
+import frappe
+
+from smspro.sms_pro.doctype.sms_payment_ledger.sms_payment_ledger import add_ledger_entry, get_ledger_rows
+
+
+def execute():
+	"""Record existing submitted Payment Entries in the SMS Payment Ledger"""
+	frappe.reload_doc("sms_pro", "doctype", "sms_payment_ledger")
+	
+	if not frappe.db.table_exists("Payment Entry"):
+		return
+	
+	payment_entries = frappe.db.sql("""
+		SELECT DISTINCT per.parent
+		FROM `tabPayment Entry Reference` per
+		JOIN `tabPayment Entry` pe ON pe.name = per.parent
+		WHERE per.reference_doctype IN ('Fee Invoice', 'Student Enrollment')
+		AND pe.docstatus = 1
+	""", pluck=True)
+	
+	recorded = set(frappe.get_all("SMS Payment Ledger", pluck="payment_entry", distinct=True))
+	
+	for name in payment_entries:
+		if name in recorded:
+			continue
+		
+		for row in get_ledger_rows(frappe.get_doc("Payment Entry", name)):
+			add_ledger_entry(row)
@@ -0,0 +1,27 @@
+import frappe
+
+from smspro.sms_pro.doctype.student_search_token.student_search_token import (
+	get_search_fields,
+	update_search_tokens,
+)
+
+
+def execute():
+	"""Fill search_name and search_key and index the tokens of existing students"""
+	frappe.reload_doc("sms_pro", "doctype", "student")
+	frappe.reload_doc("sms_pro", "doctype", "student_search_token")
+	
+	students = frappe.get_all(
+		"Student",
+		fields=["name", "student_id", "first_name", "last_name", "phone_number", "parent_phone"]
+	)
+	
+	for student in students:
+		search_name, search_key = get_search_fields(student)
+		frappe.db.set_value(
+			"Student",
+			student.name,
+			{"search_name": search_name, "search_key": search_key},
+			update_modified=False
+		)
+		update_search_tokens(student.name, search_key)
@@ -0,0 +1,31 @@
+import frappe
+
+
+def execute():
+	"""Keep the latest mark per student, batch and date before the unique key is added"""
+	if not frappe.db.table_exists("Attendance"):
+		return
+	
+	duplicates = frappe.db.sql("""
+		SELECT student, batch, attendance_date
+		FROM `tabAttendance`
+		GROUP BY student, batch, attendance_date
+		HAVING COUNT(*) > 1
+	""", as_dict=True)
+	
+	has_notices = frappe.db.table_exists("Absence Notice")
+	
+	for row in duplicates:
+		names = frappe.db.sql("""
+			SELECT name
+			FROM `tabAttendance`
+			WHERE student = %(student)s AND batch = %(batch)s AND attendance_date = %(attendance_date)s
+			ORDER BY modified DESC, name DESC
+		""", row, pluck=True)
+		
+		stale = names[1:]
+		frappe.db.delete("Attendance", {"name": ["in", stale]})
+		
+		# Pending notices are keyed by attendance, sent ones are kept as history
+		if has_notices:
+			frappe.db.delete("Absence Notice", {"attendance": ["in", stale], "notified": 0})
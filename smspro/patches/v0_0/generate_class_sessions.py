@@ -0,0 +1,9 @@
+import frappe
+
+
+def execute():
+	"""Generate Class Session rows for existing batches"""
+	frappe.reload_doc("sms_pro", "doctype", "class_session")
+	
+	for name in frappe.get_all("Batch", filters={"status": ["!=", "Cancelled"]}, pluck="name"):
+		frappe.get_doc("Batch", name).sync_class_sessions()
@@ -0,0 +1,118 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import re
+
+import frappe
+from frappe import _
+from frappe.utils import getdate
+
+from smspro.sms_pro.doctype.attendance_archive.attendance_archive import get_attendance_source
+
+# One character per cell, "." is a scheduled date without a mark
+STATUS_CODES = {
+	"Present": "P",
+	"Absent": "A",
+	"Late": "L",
+	"Excused": "E"
+}
+NO_MARK = "."
+
+
+@frappe.whitelist()
+def get_attendance_matrix(batch, from_date=None, to_date=None, encoding="rle"):
+	"""
+	Get a batch's attendance as a compact student x date matrix for heatmaps
+	
+	Each student row is a string with one status code per date ("PPAL.P"),
+	run-length encoded by default ("2P1A1L1.1P").
+	
+	Args:
+		batch: Batch name
+		from_date: First date (defaults to the batch start date)
+		to_date: Last date (defaults to the batch end date)
+		encoding: "rle" or "packed"
+	"""
+	try:
+		if encoding not in ("rle", "packed"):
+			frappe.throw(_("Encoding must be rle or packed"))
+		
+		batch_doc = frappe.db.get_value("Batch", batch, ["start_date", "end_date"], as_dict=True)
+		if not batch_doc:
+			frappe.throw(_("Batch {0} not found").format(batch))
+		
+		from_date = getdate(from_date or batch_doc.start_date)
+		to_date = getdate(to_date or batch_doc.end_date or getdate())
+		values = {"batch": batch, "from_date": from_date, "to_date": to_date}
+		
+		# Every mark of the batch in range, in one read on the (batch, attendance_date) index
+		marks = frappe.db.sql(f"""
+			SELECT a.student, a.student_name, a.attendance_date, a.status
+			FROM {get_attendance_source(from_date, batch)} a
+			WHERE a.batch = %(batch)s
+			AND a.attendance_date BETWEEN %(from_date)s AND %(to_date)s
+			AND a.docstatus != 2
+		""", values)
+		
+		sessions = frappe.db.sql_list("""
+			SELECT session_date
+			FROM `tabClass Session`
+			WHERE batch = %(batch)s
+			AND session_date BETWEEN %(from_date)s AND %(to_date)s
+			AND status = 'Scheduled'
+		""", values)
+		
+		enrolled = frappe.db.sql("""
+			SELECT student, student_name
+			FROM `tabStudent Enrollment`
+			WHERE batch = %(batch)s
+			AND status = 'Active'
+		""", values)
+		
+		# Axes: scheduled or marked dates, enrolled or marked students
+		dates = sorted(set(sessions) | {mark[2] for mark in marks})
+		students = dict(enrolled)
+		for student, student_name, _date, _status in marks:
+			students.setdefault(student, student_name)
+		students = sorted(students.items(), key=lambda s: (s[1] or "", s[0]))
+		
+		date_index = {date: i for i, date in enumerate(dates)}
+		student_index = {student: i for i, (student, _name) in enumerate(students)}
+		
+		grid = [[NO_MARK] * len(dates) for _student in students]
+		for student, _name, attendance_date, status in marks:
+			grid[student_index[student]][date_index[attendance_date]] = STATUS_CODES.get(status, NO_MARK)
+		
+		rows = ["".join(cells) for cells in grid]
+		if encoding == "rle":
+			rows = [encode_rle(row) for row in rows]
+		
+		return {
+			"status": "success",
+			"data": {
+				"batch": batch,
+				"encoding": encoding,
+				"codes": {code: status for status, code in STATUS_CODES.items()},
+				"students": [student for student, _name in students],
+				"student_names": [name for _student, name in students],
+				"dates": [str(date) for date in dates],
+				"rows": rows
+			}
+		}
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Attendance Matrix Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
+
+
+def encode_rle(row):
+	"""Run-length encode a row of codes: "PPPA.." becomes "3P1A2." """
+	return "".join(f"{len(run.group(0))}{run.group(1)}" for run in re.finditer(r"(.)\1*", row))
+
+
+def decode_rle(encoded):
+	"""Expand a run-length encoded row back to one code per date"""
+	return "".join(code * int(count) for count, code in re.findall(r"(\d+)(\D)", encoded))
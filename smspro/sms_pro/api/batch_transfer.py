@@ -0,0 +1,254 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.utils import getdate, now_datetime, today
+
+from smspro.sms_pro.api.prepared_report import invalidate_prepared_reports
+from smspro.sms_pro.api.roster import clear_batch_roster_cache
+from smspro.sms_pro.doctype.student_enrollment.student_enrollment import update_batch_enrollment_count
+
+
+@frappe.whitelist()
+def transfer_enrollments(source_batch, target_batch, enrollments=None, transfer_date=None):
+	"""
+	Move active enrollments from one batch to another in a single transaction
+	
+	Enrollments, their open fee invoices and their attendance from the
+	transfer date on are moved with set-based updates. Source marks on dates
+	the target batch already has a mark for are deleted and counted in
+	`dropped_attendance`. Capacity is checked once against the target and
+	each batch is recounted once.
+	
+	Args:
+		source_batch: Batch the students leave
+		target_batch: Batch the students join
+		enrollments: List of Student Enrollment names (defaults to all active)
+		transfer_date: First date attended in the target batch (defaults to today)
+	"""
+	try:
+		moved, dropped_attendance = move_enrollments(source_batch, target_batch, enrollments, transfer_date)
+		
+		return {
+			"status": "success",
+			"moved": moved,
+			"dropped_attendance": dropped_attendance,
+			"message": _("{0} enrollments moved from {1} to {2}").format(len(moved), source_batch, target_batch)
+		}
+	
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error(frappe.get_traceback(), "Batch Transfer Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
+
+
+@frappe.whitelist()
+def merge_batches(source_batch, target_batch, transfer_date=None):
+	"""
+	Merge a batch into another in a single transaction
+	
+	All active enrollments are moved as in `transfer_enrollments`, the
+	source's remaining class sessions are cancelled and it is marked Cancelled.
+	
+	Args:
+		source_batch: Batch to merge and close
+		target_batch: Batch that takes over the students
+		transfer_date: First date attended in the target batch (defaults to today)
+	"""
+	try:
+		transfer_date = getdate(transfer_date or today())
+		moved, dropped_attendance = move_enrollments(source_batch, target_batch, None, transfer_date)
+		
+		frappe.db.sql("""
+			UPDATE `tabClass Session`
+			SET status = 'Cancelled', modified = %(now)s, modified_by = %(user)s
+			WHERE batch = %(batch)s
+			AND session_date >= %(transfer_date)s
+			AND status = 'Scheduled'
+		""", {"batch": source_batch, "transfer_date": transfer_date, "now": now_datetime(), "user": frappe.session.user})
+		
+		frappe.db.set_value("Batch", source_batch, "status", "Cancelled")
+		
+		return {
+			"status": "success",
+			"moved": moved,
+			"dropped_attendance": dropped_attendance,
+			"message": _("{0} merged into {1}, {2} enrollments moved").format(source_batch, target_batch, len(moved))
+		}
+	
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error(frappe.get_traceback(), "Batch Merge Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
+
+
+def move_enrollments(source_batch, target_batch, enrollments=None, transfer_date=None):
+	"""
+	Move active enrollments between batches
+	
+	Returns the moved enrollment names and the number of source attendance
+	marks dropped because the target batch already had a mark on that date.
+	Enrollment names do not carry the batch, so moved enrollments never block
+	a later enrollment in the source batch.
+	"""
+	frappe.has_permission("Student Enrollment", "write", throw=True)
+	
+	if source_batch == target_batch:
+		frappe.throw(_("Source and target batch must be different"))
+	
+	transfer_date = getdate(transfer_date or today())
+	enrollments = frappe.parse_json(enrollments) if isinstance(enrollments, str) else enrollments
+	
+	# Lock the target like StudentEnrollment.is_batch_available does, so
+	# concurrent transfers and enrollments are checked against one count
+	target = frappe.db.sql("""
+		SELECT name, batch_name, course, capacity, class_time, start_date, status
+		FROM `tabBatch`
+		WHERE name = %s
+		FOR UPDATE
+	""", target_batch, as_dict=True)
+	
+	if not target:
+		frappe.throw(_("Batch {0} not found").format(target_batch))
+	target = target[0]
+	
+	if target.status in ("Completed", "Cancelled"):
+		frappe.throw(_("Cannot transfer students into a {0} batch").format(target.status.lower()))
+	
+	source_course = frappe.db.get_value("Batch", source_batch, "course")
+	if source_course != target.course:
+		frappe.throw(_("Both batches must belong to the same course"))
+	
+	conditions = ""
+	values = {"source": source_batch, "target": target_batch}
+	if enrollments:
+		conditions = "AND name IN %(enrollments)s"
+		values["enrollments"] = tuple(enrollments)
+	
+	moving = frappe.db.sql(f"""
+		SELECT name, student
+		FROM `tabStudent Enrollment`
+		WHERE batch = %(source)s
+		AND status = 'Active'
+		{conditions}
+		FOR UPDATE
+	""", values, as_dict=True)
+	
+	if enrollments and len(moving) != len(set(enrollments)):
+		missing = set(enrollments) - {row.name for row in moving}
+		frappe.throw(_("Not active in batch {0}: {1}").format(source_batch, ", ".join(sorted(missing))))
+	
+	if not moving:
+		return [], 0
+	
+	values["enrollments"] = tuple(row.name for row in moving)
+	values["students"] = tuple(row.student for row in moving)
+	
+	# One duplicate check and one capacity check for the whole set
+	already_enrolled = frappe.db.sql_list("""
+		SELECT student
+		FROM `tabStudent Enrollment`
+		WHERE batch = %(target)s
+		AND status = 'Active'
+		AND student IN %(students)s
+	""", values)
+	
+	if already_enrolled:
+		frappe.throw(_("Already enrolled in batch {0}: {1}").format(target_batch, ", ".join(already_enrolled)))
+	
+	if target.capacity:
+		enrolled = frappe.db.count("Student Enrollment", {"batch": target_batch, "status": "Active"})
+		if enrolled + len(moving) > target.capacity:
+			frappe.throw(_("Batch {0} has {1} available slots, {2} students to transfer").format(
+				target_batch, max(0, target.capacity - enrolled), len(moving)
+			))
+	
+	values.update({
+		"batch_name": target.batch_name,
+		"class_time": target.class_time,
+		"start_date": target.start_date,
+		"transfer_date": transfer_date,
+		"now": now_datetime(),
+		"user": frappe.session.user
+	})
+	
+	# Enrollments, keeping the enrollment date inside the target batch
+	frappe.db.sql("""
+		UPDATE `tabStudent Enrollment`
+		SET
+			batch = %(target)s,
+			batch_name = %(batch_name)s,
+			enrollment_date = CASE
+				WHEN %(start_date)s IS NOT NULL AND enrollment_date < %(start_date)s THEN %(start_date)s
+				ELSE enrollment_date
+			END,
+			modified = %(now)s,
+			modified_by = %(user)s
+		WHERE name IN %(enrollments)s
+	""", values)
+	
+	# Open invoices, fees are unchanged as the course is the same
+	frappe.db.sql("""
+		UPDATE `tabFee Invoice`
+		SET batch = %(target)s, batch_name = %(batch_name)s, modified = %(now)s, modified_by = %(user)s
+		WHERE student_enrollment IN %(enrollments)s
+		AND batch = %(source)s
+		AND status NOT IN ('Paid', 'Cancelled')
+	""", values)
+	
+	# Attendance from the transfer date on, skipping dates already marked in the target
+	frappe.db.sql("""
+		UPDATE `tabAttendance` a
+		LEFT JOIN `tabAttendance` t
+			ON t.student = a.student AND t.batch = %(target)s AND t.attendance_date = a.attendance_date
+		SET
+			a.batch = %(target)s,
+			a.batch_name = %(batch_name)s,
+			a.class_time = COALESCE(%(class_time)s, a.class_time),
+			a.modified = %(now)s,
+			a.modified_by = %(user)s
+		WHERE a.batch = %(source)s
+		AND a.student IN %(students)s
+		AND a.attendance_date >= %(transfer_date)s
+		AND t.name IS NULL
+	""", values)
+	
+	frappe.db.sql("""
+		UPDATE `tabAbsence Notice` n
+		JOIN `tabAttendance` a ON a.name = n.attendance
+		SET n.batch = a.batch, n.batch_name = a.batch_name
+		WHERE n.batch = %(source)s
+		AND a.batch = %(target)s
+	""", values)
+	
+	# What is left in the source from the transfer date on clashed with a target mark
+	dropped = frappe.db.sql_list("""
+		SELECT name
+		FROM `tabAttendance`
+		WHERE batch = %(source)s
+		AND student IN %(students)s
+		AND attendance_date >= %(transfer_date)s
+	""", values)
+	
+	if dropped:
+		frappe.db.delete("Absence Notice", {"attendance": ["in", dropped], "notified": 0})
+		frappe.db.delete("Attendance", {"name": ["in", dropped]})
+	
+	# One recount per batch
+	update_batch_enrollment_count(source_batch)
+	update_batch_enrollment_count(target_batch)
+	
+	clear_batch_roster_cache(source_batch)
+	clear_batch_roster_cache(target_batch)
+	
+	invalidate_prepared_reports("Student Enrollment")
+	invalidate_prepared_reports("Attendance")
+	
+	return list(values["enrollments"]), len(dropped)
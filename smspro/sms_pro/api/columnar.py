@@ -0,0 +1,62 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+
+from smspro.sms_pro.columnar import columnar_response, to_columnar
+
+# Doc methods are answered through run_doc_method with the stock encoder,
+# these doctypes' enrollments can be fetched here with orjson and gzip instead
+ENROLLMENT_DOCTYPES = ("Batch", "Course")
+
+
+@frappe.whitelist()
+def get_report_data(report_name, filters=None, compress=None):
+	"""
+	Run an SMS Pro script report and return its rows as column arrays
+	
+	Args:
+		report_name: Name of the report
+		filters: Report filters (dict or JSON)
+		compress: Gzip the response when the client accepts it
+	"""
+	report = frappe.get_doc("Report", report_name)
+	
+	if report.module != "SMS Pro" or report.report_type != "Script Report":
+		frappe.throw(_("Report {0} is not an SMS Pro script report").format(report_name))
+	
+	if not report.is_permitted():
+		frappe.throw(_("Not permitted to run {0}").format(report_name), frappe.PermissionError)
+	
+	module = frappe.scrub(report_name)
+	execute = frappe.get_attr(f"smspro.sms_pro.report.{module}.{module}.execute")
+	
+	result = execute(frappe._dict(frappe.parse_json(filters) if filters else {}))
+	columns, data = result[0], result[1]
+	chart = result[3] if len(result) > 3 else None
+	
+	return columnar_response({
+		"result": to_columnar(data, columns),
+		"columns": columns,
+		"chart": chart
+	}, compress)
+
+
+@frappe.whitelist()
+def get_enrollments(doctype, name, compress=None):
+	"""
+	Get the enrollments of a Batch or Course as column arrays
+	
+	Args:
+		doctype: Batch or Course
+		name: Name of the batch or course
+		compress: Gzip the response when the client accepts it
+	"""
+	if doctype not in ENROLLMENT_DOCTYPES:
+		frappe.throw(_("Enrollments cannot be fetched for {0}").format(doctype))
+	
+	doc = frappe.get_doc(doctype, name)
+	doc.check_permission("read")
+	
+	return columnar_response(doc.get_enrollments(format="columnar"), compress)
@@ -3,42 +3,72 @@
 
 import frappe
 from frappe import _
+from frappe.utils import add_days, add_months, get_first_day, getdate, today
+
+from smspro.sms_pro.jobs import scheduled_job
+from smspro.sms_pro.replica import read_only
+
+KPI_FIELDS = ["active_students", "active_courses", "active_batches", "active_enrollments",
+	"total_revenue", "total_paid", "total_outstanding", "collection_rate"]
+
+# Daily KPI rows older than this are averaged into weekly rows
+KPI_DAILY_RETENTION_DAYS = 90
+
+# Weekly KPI rows older than this are averaged into monthly rows
+KPI_WEEKLY_RETENTION_MONTHS = 12
+
+
+def get_kpi_values():
+	"""Get the current dashboard KPIs"""
+	# Get total students
+	total_students = frappe.db.count("Student", {"status": "Active"})
+	
+	# Get total courses
+	total_courses = frappe.db.count("Course", {"status": "Active"})
+	
+	# Get total batches
+	total_batches = frappe.db.count("Batch", {"status": "Active"})
+	
+	# Get total enrollments
+	total_enrollments = frappe.db.count("Student Enrollment", {"status": "Active"})
+	
+	# Get financial data
+	financial_data = frappe.db.sql("""
+		SELECT 
+			SUM(total_fee) as total_revenue,
+			SUM(paid_amount) as total_paid,
+			SUM(outstanding_amount) as total_outstanding
+		FROM `tabStudent Enrollment`
+		WHERE docstatus != 2
+	""", as_dict=True)[0]
+	
+	total_revenue = financial_data.total_revenue or 0
+	total_paid = financial_data.total_paid or 0
+	total_outstanding = financial_data.total_outstanding or 0
+	
+	# Calculate collection rate
+	collection_rate = (total_paid / total_revenue * 100) if total_revenue > 0 else 0
+	
+	return frappe._dict({
+		"active_students": total_students,
+		"active_courses": total_courses,
+		"active_batches": total_batches,
+		"active_enrollments": total_enrollments,
+		"total_revenue": total_revenue,
+		"total_paid": total_paid,
+		"total_outstanding": total_outstanding,
+		"collection_rate": round(collection_rate, 2)
+	})
 
 
 @frappe.whitelist(allow_guest=True)
+@read_only()
 def get_dashboard_data():
 	"""
 	Get dashboard data for SMS Pro
 	"""
 	try:
-		# Get total students
-		total_students = frappe.db.count("Student", {"status": "Active"})
-		
-		# Get total courses
-		total_courses = frappe.db.count("Course", {"status": "Active"})
-		
-		# Get total batches
-		total_batches = frappe.db.count("Batch", {"status": "Active"})
-		
-		# Get total enrollments
-		total_enrollments = frappe.db.count("Student Enrollment", {"status": "Active"})
-		
-		# Get financial data
-		financial_data = frappe.db.sql("""
-			SELECT 
-				SUM(total_fee) as total_revenue,
-				SUM(paid_amount) as total_paid,
-				SUM(outstanding_amount) as total_outstanding
-			FROM `tabStudent Enrollment`
-			WHERE docstatus != 2
-		""", as_dict=True)[0]
-		
-		total_revenue = financial_data.total_revenue or 0
-		total_paid = financial_data.total_paid or 0
-		total_outstanding = financial_data.total_outstanding or 0
-		
-		# Calculate collection rate
-		collection_rate = (total_paid / total_revenue * 100) if total_revenue > 0 else 0
+		kpis = get_kpi_values()
 		
 		# Get payment status distribution
 		payment_status_data = frappe.db.sql("""
@@ -84,16 +114,16 @@ def get_dashboard_data():
 			"status": "success",
 			"data": {
 				"statistics": {
-					"total_students": total_students,
-					"total_courses": total_courses,
-					"total_batches": total_batches,
-					"total_enrollments": total_enrollments
+					"total_students": kpis.active_students,
+					"total_courses": kpis.active_courses,
+					"total_batches": kpis.active_batches,
+					"total_enrollments": kpis.active_enrollments
 				},
 				"financial": {
-					"total_revenue": total_revenue,
-					"total_paid": total_paid,
-					"total_outstanding": total_outstanding,
-					"collection_rate": round(collection_rate, 2)
+					"total_revenue": kpis.total_revenue,
+					"total_paid": kpis.total_paid,
+					"total_outstanding": kpis.total_outstanding,
+					"collection_rate": kpis.collection_rate
 				},
 				"payment_status_distribution": payment_status_distribution,
 				"recent_enrollments": recent_enrollments,
@@ -110,6 +140,7 @@ def get_dashboard_data():
 
 
 @frappe.whitelist()
+@read_only()
 def get_revenue_chart_data(months=6):
 	"""
 	Get revenue chart data for the specified number of months
@@ -156,6 +187,7 @@ def get_revenue_chart_data(months=6):
 
 
 @frappe.whitelist()
+@read_only()
 def get_course_popularity_data():
 	"""
 	Get course popularity data for charts
@@ -184,3 +216,106 @@ def get_course_popularity_data():
 			"status": "error",
 			"message": str(e)
 		}
+
+
+@scheduled_job()
+def record_kpi_snapshot():
+	"""
+	Record today's KPIs and downsample old snapshots (daily via scheduler)
+	"""
+	snapshot_date = getdate(today())
+	kpis = get_kpi_values()
+	
+	frappe.db.delete("SMS KPI Snapshot", {"resolution": "Daily", "snapshot_date": snapshot_date})
+	
+	snapshot = frappe.new_doc("SMS KPI Snapshot")
+	snapshot.snapshot_date = snapshot_date
+	snapshot.resolution = "Daily"
+	snapshot.sample_count = 1
+	snapshot.update(kpis)
+	snapshot.insert(ignore_permissions=True)
+	
+	downsample_kpi_snapshots(snapshot_date)
+
+
+def downsample_kpi_snapshots(as_of=None):
+	"""Average old daily rows into weeks and old weekly rows into months"""
+	as_of = getdate(as_of or today())
+	
+	# Only whole weeks (starting Monday) and whole months are rolled up
+	daily_cutoff = add_days(as_of, -KPI_DAILY_RETENTION_DAYS)
+	daily_cutoff = add_days(daily_cutoff, -daily_cutoff.weekday())
+	weekly_cutoff = get_first_day(add_months(as_of, -KPI_WEEKLY_RETENTION_MONTHS))
+	
+	rollup_kpi_snapshots(
+		"Daily", "Weekly", daily_cutoff,
+		"DATE_SUB(snapshot_date, INTERVAL WEEKDAY(snapshot_date) DAY)"
+	)
+	rollup_kpi_snapshots(
+		"Weekly", "Monthly", weekly_cutoff,
+		"DATE_FORMAT(snapshot_date, '%%Y-%%m-01')"
+	)
+
+
+def rollup_kpi_snapshots(source, target, cutoff, period_sql):
+	"""Replace source rows before cutoff with one averaged target row per period"""
+	averages = ", ".join(f"ROUND(SUM({f} * sample_count) / SUM(sample_count), 2)" for f in KPI_FIELDS)
+	
+	frappe.db.sql(f"""
+		INSERT INTO `tabSMS KPI Snapshot` (
+			creation, modified, owner, modified_by, docstatus,
+			snapshot_date, resolution, sample_count, {", ".join(KPI_FIELDS)}
+		)
+		SELECT
+			NOW(), NOW(), 'Administrator', 'Administrator', 0,
+			{period_sql} as period, %(target)s, SUM(sample_count), {averages}
+		FROM `tabSMS KPI Snapshot`
+		WHERE resolution = %(source)s
+		AND snapshot_date < %(cutoff)s
+		GROUP BY period
+		ON DUPLICATE KEY UPDATE modified = NOW()
+	""", {"source": source, "target": target, "cutoff": cutoff})
+	
+	frappe.db.delete("SMS KPI Snapshot", {"resolution": source, "snapshot_date": ["<", cutoff]})
+
+
+@frappe.whitelist()
+@read_only()
+def get_kpi_trend(from_date=None, to_date=None, metrics=None):
+	"""
+	Get KPI time series for trend charts
+	
+	Args:
+		from_date: Start of the range (defaults to one year ago)
+		to_date: End of the range (defaults to today)
+		metrics: List (or JSON list) of KPI fields, defaults to all
+	"""
+	try:
+		to_date = getdate(to_date or today())
+		from_date = getdate(from_date or add_months(to_date, -12))
+		
+		metrics = frappe.parse_json(metrics) if metrics else KPI_FIELDS
+		metrics = [m for m in metrics if m in KPI_FIELDS]
+		
+		snapshots = frappe.get_all(
+			"SMS KPI Snapshot",
+			filters={"snapshot_date": ["between", [from_date, to_date]]},
+			fields=["snapshot_date", "resolution", *metrics],
+			order_by="snapshot_date ASC"
+		)
+		
+		return {
+			"status": "success",
+			"data": {
+				"labels": [str(s.snapshot_date) for s in snapshots],
+				"resolution": [s.resolution for s in snapshots],
+				"series": {metric: [s.get(metric) for s in snapshots] for metric in metrics}
+			}
+		}
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "KPI Trend Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
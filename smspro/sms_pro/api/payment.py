@@ -4,6 +4,15 @@
 import frappe
 from frappe import _
 from frappe.model.document import Document
+from frappe.utils import date_diff, flt, getdate
+
+from smspro.sms_pro.columnar import columnar_response, to_columnar
+from smspro.sms_pro.doctype.sms_payment_ledger.sms_payment_ledger import get_payment_totals
+from smspro.sms_pro.jobs import scheduled_job
+from smspro.sms_pro.replica import read_only
+
+# Overdue invoices per chunk of the daily reminder job
+PAYMENT_REMINDER_CHUNK_SIZE = 500
 
 
 @frappe.whitelist()
@@ -57,12 +66,11 @@ def create_payment_entry_for_invoice(invoice_name, paid_amount, payment_date=Non
 		if reference_no:
 			payment_entry.reference_no = reference_no
 		
+		# Submitting records the payment in the SMS Payment Ledger,
+		# which updates the invoice payment status
 		payment_entry.insert()
 		payment_entry.submit()
 		
-		# Update invoice payment status
-		update_invoice_payment_status(invoice_name)
-		
 		return {
 			"status": "success",
 			"payment_entry": payment_entry.name,
@@ -85,15 +93,9 @@ def update_invoice_payment_status(invoice_name):
 	try:
 		invoice = frappe.get_doc("Fee Invoice", invoice_name)
 		
-		# Get total paid amount from Payment Entries
-		total_paid = frappe.db.sql("""
-			SELECT SUM(pe.paid_amount)
-			FROM `tabPayment Entry` pe
-			JOIN `tabPayment Entry Reference` per ON pe.name = per.parent
-			WHERE per.reference_doctype = 'Fee Invoice'
-			AND per.reference_name = %s
-			AND pe.docstatus = 1
-		""", (invoice_name,), as_list=True)[0][0] or 0
+		# Get total paid amount and last payment date from the payment ledger
+		totals = get_payment_totals(fee_invoice=invoice_name)
+		total_paid = totals.total_paid
 		
 		# Update invoice
 		invoice.paid_amount = total_paid
@@ -109,19 +111,8 @@ def update_invoice_payment_status(invoice_name):
 			invoice.payment_status = "Partially Paid"
 		
 		# Update last payment date
-		last_payment = frappe.db.sql("""
-			SELECT pe.posting_date
-			FROM `tabPayment Entry` pe
-			JOIN `tabPayment Entry Reference` per ON pe.name = per.parent
-			WHERE per.reference_doctype = 'Fee Invoice'
-			AND per.reference_name = %s
-			AND pe.docstatus = 1
-			ORDER BY pe.posting_date DESC
-			LIMIT 1
-		""", (invoice_name,), as_list=True)
-		
-		if last_payment:
-			invoice.last_payment_date = last_payment[0][0]
+		if totals.last_payment_date:
+			invoice.last_payment_date = totals.last_payment_date
 		
 		invoice.save()
 		
@@ -192,9 +183,13 @@ def update_enrollment_payment_status(enrollment_name):
 
 
 @frappe.whitelist()
-def get_payment_summary(student=None, batch=None, course=None):
+@read_only()
+def get_payment_summary(student=None, batch=None, course=None, format=None, compress=None):
 	"""
 	Get payment summary for students, batches, or courses
+	
+	Pass format="columnar" to get enrollments as column arrays encoded with
+	orjson, and compress=1 to gzip the response.
 	"""
 	try:
 		filters = {}
@@ -227,7 +222,7 @@ def get_payment_summary(student=None, batch=None, course=None):
 			"Unpaid": len([e for e in enrollments if e.payment_status == "Unpaid"])
 		}
 		
-		return {
+		result = {
 			"status": "success",
 			"enrollments": enrollments,
 			"summary": {
@@ -240,6 +235,12 @@ def get_payment_summary(student=None, batch=None, course=None):
 			}
 		}
 		
+		if format == "columnar":
+			result["enrollments"] = to_columnar(enrollments)
+			return columnar_response(result, compress)
+		
+		return result
+		
 	except Exception as e:
 		frappe.log_error(frappe.get_traceback(), "Payment Summary Error")
 		return {
@@ -249,55 +250,108 @@ def get_payment_summary(student=None, batch=None, course=None):
 
 
 @frappe.whitelist()
-def send_payment_reminders():
+def get_student_statement(student, from_date=None, to_date=None):
 	"""
-	Send payment reminders for overdue invoices
-	This function is called daily via scheduler
+	Get a student's account statement from the payment ledger
+	
+	Args:
+		student: Student
+		from_date: Statement start (payments before it form the opening balance)
+		to_date: Statement end
 	"""
 	try:
-		# Get overdue invoices
-		overdue_invoices = frappe.get_all(
+		from_date = getdate(from_date) if from_date else None
+		to_date = getdate(to_date) if to_date else None
+		
+		invoices = frappe.get_all(
 			"Fee Invoice",
-			filters={
-				"status": "Overdue",
-				"outstanding_amount": [">", 0]
-			},
-			fields=["name", "student", "student_name", "outstanding_amount", "due_date"]
+			filters={"student": student, "status": ["!=", "Cancelled"]},
+			fields=["name", "course_name", "batch_name", "invoice_date", "due_date",
+					"total_amount", "paid_amount", "outstanding_amount", "status"],
+			order_by="invoice_date ASC"
 		)
 		
-		sent_count = 0
+		conditions = ["student = %(student)s"]
+		if to_date:
+			conditions.append("posting_date <= %(to_date)s")
+		
+		ledger = frappe.db.sql(f"""
+			SELECT name, entry_type, payment_entry, posting_date, amount, fee_invoice,
+				student_enrollment, mode_of_payment, reference_no
+			FROM `tabSMS Payment Ledger`
+			WHERE {" AND ".join(conditions)}
+			ORDER BY posting_date ASC, creation ASC
+		""", {"student": student, "to_date": to_date}, as_dict=True)
+		
+		opening_paid = sum(flt(e.amount) for e in ledger if from_date and e.posting_date < from_date)
+		entries = [e for e in ledger if not from_date or e.posting_date >= from_date]
+		
+		total_invoiced = sum(flt(inv.total_amount) for inv in invoices)
+		total_paid = sum(flt(e.amount) for e in ledger)
 		
+		return {
+			"status": "success",
+			"student": student,
+			"invoices": invoices,
+			"entries": entries,
+			"summary": {
+				"total_invoiced": total_invoiced,
+				"opening_paid": opening_paid,
+				"period_paid": total_paid - opening_paid,
+				"total_paid": total_paid,
+				"balance": max(0, total_invoiced - total_paid)
+			}
+		}
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Student Statement Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
+
+
+@frappe.whitelist()
+@scheduled_job(chunk_size=PAYMENT_REMINDER_CHUNK_SIZE)
+def send_payment_reminders(job):
+	"""
+	Send payment reminders for overdue invoices
+	This function is called daily via scheduler
+	
+	Invoices are processed in chunks under the job runner, a call that runs
+	out of time re-enqueues itself and resumes after the last invoice.
+	"""
+	from smspro.sms_pro.mailer import queue_emails
+	from smspro.sms_pro.notification_gateway import is_channel_enabled, send_notifications
+	
+	today = getdate()
+	sms_enabled = is_channel_enabled("SMS")
+	
+	sent_count = 0
+	sms_count = 0
+	for overdue_invoices in job.chunks(get_overdue_invoices):
+		# Invoices already reminded today
+		reminded = set(frappe.db.sql_list("""
+			SELECT reference_name
+			FROM `tabCommunication`
+			WHERE reference_doctype = 'Fee Invoice'
+			AND reference_name IN %s
+			AND subject LIKE %s
+			AND creation >= %s
+		""", (tuple(invoice.name for invoice in overdue_invoices), "%Payment Reminder%", today)))
+		
+		messages = []
 		for invoice in overdue_invoices:
-			# Get student email
-			student_email = frappe.get_value("Student", invoice.student, "email")
-			
-			if not student_email:
-				continue
-			
-			# Check if reminder was sent today
-			today = frappe.utils.today()
-			existing_reminder = frappe.db.exists(
-				"Communication",
-				{
-					"reference_doctype": "Fee Invoice",
-					"reference_name": invoice.name,
-					"subject": ["like", "%Payment Reminder%"],
-					"creation": ["like", f"{today}%"]
-				}
-			)
-			
-			if existing_reminder:
+			if invoice.name in reminded or not invoice.email:
 				continue
 			
-			# Send reminder
-			communication = frappe.new_doc("Communication")
-			communication.communication_type = "Communication"
-			communication.communication_medium = "Email"
-			communication.subject = f"Payment Reminder - Invoice {invoice.name}"
-			communication.sent_or_received = "Sent"
-			communication.sender = "Administrator"
-			communication.recipients = student_email
-			communication.content = f"""
+			messages.append({
+				"recipient": invoice.email,
+				"sender": "Administrator",
+				"subject": f"Payment Reminder - Invoice {invoice.name}",
+				"reference_doctype": "Fee Invoice",
+				"reference_name": invoice.name,
+				"content": f"""
 			Dear {invoice.student_name},
 			
 			This is a friendly reminder that payment for invoice {invoice.name} is overdue.
@@ -306,7 +360,7 @@ def send_payment_reminders():
 			- Invoice Number: {invoice.name}
 			- Outstanding Amount: ₫{invoice.outstanding_amount:,.0f}
 			- Due Date: {invoice.due_date}
-			- Days Overdue: {(frappe.utils.today() - invoice.due_date).days} days
+			- Days Overdue: {date_diff(today, invoice.due_date)} days
 			
 			Please make payment at your earliest convenience to avoid any late fees.
 			
@@ -315,22 +369,50 @@ def send_payment_reminders():
 			Best regards,
 			SMS Pro Team
 			"""
-			communication.insert()
-			communication.send()
-			
-			sent_count += 1
-		
-		frappe.logger().info(f"Sent {sent_count} payment reminders")
+			})
 		
-		return {
-			"status": "success",
-			"reminders_sent": sent_count,
-			"message": f"Sent {sent_count} payment reminders"
-		}
+		# Delivery happens in background batches over pooled SMTP connections
+		sent_count += queue_emails(messages)
 		
-	except Exception as e:
-		frappe.log_error(frappe.get_traceback(), "Payment Reminder Error")
-		return {
-			"status": "error",
-			"message": str(e)
-		}
+		# Parents read SMS, one per invoice per day
+		if sms_enabled:
+			sms_count += send_notifications([
+				{
+					"channel": "SMS",
+					"recipient": invoice.phone,
+					"student": invoice.student,
+					"message": (
+						f"SMS Pro: Hoc phi {invoice.student_name} hoa don {invoice.name} "
+						f"con no {invoice.outstanding_amount:,.0f}d, qua han tu {invoice.due_date}."
+					),
+					"reference_doctype": "Fee Invoice",
+					"reference_name": invoice.name,
+					"idempotency_key": f"payment_reminder:{invoice.name}:{today}"
+				}
+				for invoice in overdue_invoices if invoice.phone
+			])
+	
+	frappe.logger().info(f"Queued {sent_count} payment reminders and {sms_count} SMS")
+	
+	return {
+		"status": "success",
+		"reminders_sent": sent_count,
+		"sms_sent": sms_count,
+		"message": f"Queued {sent_count} payment reminders and {sms_count} SMS"
+	}
+
+
+def get_overdue_invoices(cursor, limit):
+	"""Get overdue invoices after `cursor` in name order, with the student email and phone"""
+	return frappe.db.sql("""
+		SELECT
+			fi.name, fi.student, fi.student_name, fi.outstanding_amount, fi.due_date,
+			s.email, IFNULL(NULLIF(s.parent_phone, ''), s.phone_number) as phone
+		FROM `tabFee Invoice` fi
+		JOIN `tabStudent` s ON s.name = fi.student
+		WHERE fi.status = 'Overdue'
+		AND fi.outstanding_amount > 0
+		AND fi.name > %(cursor)s
+		ORDER BY fi.name
+		LIMIT %(limit)s
+	""", {"cursor": cursor or "", "limit": limit}, as_dict=True)
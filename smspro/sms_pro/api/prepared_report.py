@@ -0,0 +1,216 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+"""
+Prepared mode for SMS Pro script reports
+
+With the "Prepared" filter checked, a report answers from a cached result
+for the same filters when there is one. Otherwise it queues a background
+run and shows a progress message until the result is ready. Results are
+cached per report under a version number. A change to a doctype the report
+reads bumps the version once the transaction commits, so stale results are
+never served again and expire on their own.
+"""
+
+import hashlib
+import json
+
+import frappe
+from frappe import _
+from frappe.utils import getdate, now_datetime, pretty_date
+
+# Reports with a prepared mode, with the doctypes whose changes invalidate them
+PREPARED_REPORTS = {
+	"Student Payment Report": {
+		"module": "smspro.sms_pro.report.student_payment_report.student_payment_report",
+		"doctypes": ("Student Enrollment", "SMS Payment Ledger")
+	},
+	"Attendance Report": {
+		"module": "smspro.sms_pro.report.attendance_report.attendance_report",
+		"doctypes": ("Attendance",)
+	}
+}
+
+PREPARED_RESULT_TTL = 6 * 60 * 60
+
+# A run that has not finished by then is considered lost and queued again
+PREPARED_RUN_TTL = 30 * 60
+
+
+def get_prepared_result(report_name, filters, columns):
+	"""
+	Get a report's cached result as execute() returns it, or queue a run
+	
+	Args:
+		report_name: Report with a prepared mode
+		filters: Report filters, including the prepared flag
+		columns: Report columns, shown while the result is being prepared
+	"""
+	filters = normalize_filters(filters)
+	key = get_result_key(report_name, filters)
+	
+	result = frappe.cache.get_value(key)
+	if result:
+		message = _("Prepared {0}, refreshed automatically when records change").format(
+			pretty_date(result["prepared_on"])
+		)
+		return result["columns"], result["data"], message, result["chart"]
+	
+	status = queue_prepared_report(report_name, filters, key)
+	return columns, [], get_status_message(status), None
+
+
+@frappe.whitelist()
+def get_prepared_report(report_name, filters=None):
+	"""
+	Get the prepared result of a report, queueing a run when there is none
+	
+	Args:
+		report_name: Student Payment Report or Attendance Report
+		filters: Report filters (dict or JSON)
+	"""
+	try:
+		if report_name not in PREPARED_REPORTS:
+			frappe.throw(_("Report {0} has no prepared mode").format(report_name))
+		
+		if not frappe.get_doc("Report", report_name).is_permitted():
+			frappe.throw(_("Not permitted to run {0}").format(report_name), frappe.PermissionError)
+		
+		filters = normalize_filters(frappe.parse_json(filters) if filters else {})
+		key = get_result_key(report_name, filters)
+		
+		result = frappe.cache.get_value(key)
+		if result:
+			return {
+				"status": "success",
+				"state": "Ready",
+				"data": result
+			}
+		
+		status = queue_prepared_report(report_name, filters, key)
+		return {
+			"status": "success",
+			"state": status["status"],
+			"message": get_status_message(status)
+		}
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Prepared Report Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
+
+
+def queue_prepared_report(report_name, filters, key):
+	"""Queue a background run for the filters unless one is already running"""
+	if frappe.cache.set(frappe.cache.make_key(f"{key}:running"), 1, nx=True, ex=PREPARED_RUN_TTL):
+		status = {"status": "Queued", "queued_on": now_datetime()}
+		frappe.cache.set_value(f"{key}:status", status, expires_in_sec=PREPARED_RUN_TTL)
+		
+		frappe.enqueue(
+			"smspro.sms_pro.api.prepared_report.run_prepared_report",
+			queue="long",
+			report_name=report_name,
+			filters=filters,
+			key=key,
+			user=frappe.session.user
+		)
+		return status
+	
+	return frappe.cache.get_value(f"{key}:status") or {"status": "Queued", "queued_on": now_datetime()}
+
+
+def run_prepared_report(report_name, filters, key, user):
+	"""Background job: run a report and cache its result"""
+	status = frappe.cache.get_value(f"{key}:status") or {}
+	status.update({"status": "Running", "started_on": now_datetime()})
+	frappe.cache.set_value(f"{key}:status", status, expires_in_sec=PREPARED_RUN_TTL)
+	
+	try:
+		execute = frappe.get_attr(f"{PREPARED_REPORTS[report_name]['module']}.execute")
+		result = execute(frappe._dict(filters))
+		
+		frappe.cache.set_value(key, {
+			"columns": result[0],
+			"data": result[1],
+			"chart": result[3] if len(result) > 3 else None,
+			"prepared_on": now_datetime()
+		}, expires_in_sec=PREPARED_RESULT_TTL)
+		frappe.cache.delete_value(f"{key}:status")
+		
+		frappe.publish_realtime(
+			"msgprint",
+			_("{0} is ready, refresh the report to view it").format(report_name),
+			user=user
+		)
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Prepared Report Error")
+		status.update({"status": "Failed", "error": str(e)})
+		frappe.cache.set_value(f"{key}:status", status, expires_in_sec=PREPARED_RUN_TTL)
+	
+	finally:
+		frappe.cache.delete(frappe.cache.make_key(f"{key}:running"))
+
+
+def get_status_message(status):
+	if status["status"] == "Failed":
+		return _("Preparing the report failed: {0}. Refresh to try again.").format(status.get("error"))
+	
+	if status["status"] == "Running":
+		return _("Preparing the report in the background, started {0}.").format(pretty_date(status["started_on"]))
+	
+	return _("The report is queued for preparation, you will be notified when it is ready.")
+
+
+def normalize_filters(filters):
+	"""Drop empty filters and the prepared flag, and format dates, so equal filters share a result"""
+	normalized = {}
+	
+	for key, value in (filters or {}).items():
+		if key == "prepared" or value in (None, "", 0, "0", []):
+			continue
+		
+		if key.endswith("_date"):
+			value = str(getdate(value))
+		
+		normalized[key] = value
+	
+	return dict(sorted(normalized.items()))
+
+
+def get_result_key(report_name, filters):
+	digest = hashlib.sha1(json.dumps(filters, sort_keys=True, default=str).encode()).hexdigest()[:16]
+	return f"smspro:prepared_report:{frappe.scrub(report_name)}:{get_version(report_name)}:{digest}"
+
+
+def get_version(report_name):
+	return int(frappe.cache.get(get_version_key(report_name)) or 0)
+
+
+def get_version_key(report_name):
+	return frappe.cache.make_key(f"smspro:prepared_report_version:{frappe.scrub(report_name)}")
+
+
+def invalidate_prepared_reports(doctype):
+	"""Mark the prepared results built from `doctype` stale once the current transaction commits"""
+	stale = frappe.flags.smspro_stale_doctypes
+	if stale is None:
+		stale = frappe.flags.smspro_stale_doctypes = set()
+		frappe.db.after_commit.add(flush_invalidations)
+		frappe.db.after_rollback.add(discard_invalidations)
+	
+	stale.add(doctype)
+
+
+def flush_invalidations():
+	stale = frappe.flags.pop("smspro_stale_doctypes", None) or set()
+	
+	for report_name, report in PREPARED_REPORTS.items():
+		if stale.intersection(report["doctypes"]):
+			frappe.cache.incr(get_version_key(report_name))
+
+
+def discard_invalidations():
+	frappe.flags.pop("smspro_stale_doctypes", None)
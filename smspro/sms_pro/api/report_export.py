@@ -0,0 +1,160 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import csv
+
+import frappe
+from frappe import _
+from frappe.utils import cstr, now_datetime
+
+# Reports that can be exported, with their module and the doctype that grants access
+EXPORTABLE_REPORTS = {
+	"Student Payment Report": (
+		"smspro.sms_pro.report.student_payment_report.student_payment_report",
+		"Student Enrollment"
+	),
+	"Attendance Report": (
+		"smspro.sms_pro.report.attendance_report.attendance_report",
+		"Attendance"
+	)
+}
+
+EXPORT_STATUS_TTL = 24 * 60 * 60
+
+
+@frappe.whitelist()
+def export_report(report_name, filters=None, file_format="csv"):
+	"""
+	Queue a streaming CSV or XLSX export of a script report
+	
+	Args:
+		report_name: Student Payment Report or Attendance Report
+		filters: Report filters (dict or JSON)
+		file_format: "csv" or "xlsx"
+	"""
+	try:
+		if report_name not in EXPORTABLE_REPORTS:
+			frappe.throw(_("Report {0} cannot be exported").format(report_name))
+		
+		if file_format not in ("csv", "xlsx"):
+			frappe.throw(_("File format must be csv or xlsx"))
+		
+		if not frappe.has_permission(EXPORTABLE_REPORTS[report_name][1], "report"):
+			frappe.throw(_("Not permitted to export {0}").format(report_name), frappe.PermissionError)
+		
+		export_id = frappe.generate_hash(length=10)
+		set_export_status(export_id, "Queued")
+		
+		frappe.enqueue(
+			"smspro.sms_pro.api.report_export.run_report_export",
+			queue="long",
+			export_id=export_id,
+			report_name=report_name,
+			filters=frappe.parse_json(filters) if filters else {},
+			file_format=file_format,
+			user=frappe.session.user
+		)
+		
+		return {
+			"status": "success",
+			"export_id": export_id,
+			"message": _("Export of {0} queued").format(report_name)
+		}
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Report Export Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
+
+
+@frappe.whitelist()
+def get_export_status(export_id):
+	"""Get the status and file of a report export"""
+	status = frappe.cache.get_value(get_status_key(export_id))
+	
+	if not status:
+		return {"status": "error", "message": _("Export {0} not found").format(export_id)}
+	
+	return {"status": "success", "data": status}
+
+
+def run_report_export(export_id, report_name, filters, file_format="csv", user=None):
+	"""Background job: stream report rows into a file, one row in memory at a time"""
+	try:
+		set_export_status(export_id, "Running", user=user)
+		
+		module = frappe.get_module(EXPORTABLE_REPORTS[report_name][0])
+		columns = module.get_columns()
+		
+		file_name = f"{frappe.scrub(report_name)}-{now_datetime().strftime('%Y%m%d-%H%M%S')}-{export_id}.{file_format}"
+		path = frappe.get_site_path("private", "files", file_name)
+		
+		writer = write_xlsx if file_format == "xlsx" else write_csv
+		row_count = writer(path, report_name, columns, module.iter_data(filters))
+		
+		file_doc = frappe.get_doc({
+			"doctype": "File",
+			"file_name": file_name,
+			"file_url": f"/private/files/{file_name}",
+			"is_private": 1
+		}).insert(ignore_permissions=True)
+		
+		set_export_status(export_id, "Completed", rows=row_count, file_url=file_doc.file_url, user=user)
+	
+	except Exception:
+		frappe.log_error(frappe.get_traceback(), "Report Export Error")
+		set_export_status(export_id, "Failed", user=user)
+
+
+def write_csv(path, report_name, columns, rows):
+	fieldnames = [c["fieldname"] for c in columns]
+	count = 0
+	
+	with open(path, "w", newline="", encoding="utf-8-sig") as f:
+		writer = csv.writer(f)
+		writer.writerow([c["label"] for c in columns])
+		
+		for row in rows:
+			writer.writerow([cstr(row.get(field)) for field in fieldnames])
+			count += 1
+	
+	return count
+
+
+def write_xlsx(path, report_name, columns, rows):
+	from openpyxl import Workbook
+	
+	fieldnames = [c["fieldname"] for c in columns]
+	count = 0
+	
+	# Write-only workbooks stream rows to disk instead of keeping cells in memory
+	workbook = Workbook(write_only=True)
+	sheet = workbook.create_sheet(report_name[:31])
+	sheet.append([c["label"] for c in columns])
+	
+	for row in rows:
+		sheet.append([row.get(field) for field in fieldnames])
+		count += 1
+	
+	workbook.save(path)
+	return count
+
+
+def get_status_key(export_id):
+	return f"smspro:report_export:{export_id}"
+
+
+def set_export_status(export_id, status, rows=None, file_url=None, user=None):
+	data = {"export_id": export_id, "status": status}
+	
+	if rows is not None:
+		data["rows"] = rows
+	if file_url:
+		data["file_url"] = file_url
+	
+	frappe.cache.set_value(get_status_key(export_id), data, expires_in_sec=EXPORT_STATUS_TTL)
+	
+	if user:
+		frappe.publish_realtime("smspro_report_export", data, user=user)
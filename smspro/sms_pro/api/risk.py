@@ -0,0 +1,247 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import json
+
+import frappe
+from frappe.utils import add_days, cint, getdate, now_datetime, today
+
+from smspro.sms_pro.jobs import scheduled_job
+
+# Attendance considered by the score, the recent half is compared with the prior half
+RISK_WINDOW_DAYS = 56
+
+# Feature weights, each feature is scaled to 0-1 first
+RISK_WEIGHTS = {
+	"absence": 0.3,
+	"trend": 0.15,
+	"streak": 0.2,
+	"balance": 0.15,
+	"overdue": 0.2
+}
+
+# Consecutive absent/late marks, and days overdue, at which the feature maxes out
+RISK_STREAK_CAP = 4
+RISK_OVERDUE_CAP = 60
+
+RISK_LEVELS = ((60, "High"), (35, "Medium"), (0, "Low"))
+
+RISK_UPDATE_CHUNK_SIZE = 1000
+
+
+@scheduled_job()
+def compute_risk_scores():
+	"""
+	Score every active enrollment for drop-out risk (daily via scheduler)
+	
+	Enrollments, attendance and invoice totals are read in three bulk queries
+	into NumPy arrays, features and scores are computed for all enrollments
+	at once and written back in bulk.
+	"""
+	import numpy as np
+	
+	as_of = getdate(today())
+	window_start = add_days(as_of, -RISK_WINDOW_DAYS)
+	
+	enrollments = frappe.db.sql("""
+		SELECT name, student, batch, total_fee
+		FROM `tabStudent Enrollment`
+		WHERE status = 'Active'
+		ORDER BY name
+	""", as_dict=True)
+	
+	if not enrollments:
+		return
+	
+	index = {(e.student, e.batch): i for i, e in enumerate(enrollments)}
+	count = len(enrollments)
+	
+	# Attendance in the window, grouped by enrollment and in date order for streaks
+	attendance = frappe.db.sql("""
+		SELECT a.student, a.batch, DATEDIFF(%(as_of)s, a.attendance_date), a.status
+		FROM `tabAttendance` a
+		JOIN `tabStudent Enrollment` se
+			ON se.student = a.student AND se.batch = a.batch AND se.status = 'Active'
+		WHERE a.attendance_date BETWEEN %(window_start)s AND %(as_of)s
+		AND a.docstatus != 2
+		ORDER BY a.student, a.batch, a.attendance_date
+	""", {"as_of": as_of, "window_start": window_start})
+	
+	invoices = frappe.db.sql("""
+		SELECT
+			student_enrollment,
+			SUM(outstanding_amount),
+			MAX(CASE WHEN due_date < %(as_of)s THEN DATEDIFF(%(as_of)s, due_date) ELSE 0 END)
+		FROM `tabFee Invoice`
+		WHERE status NOT IN ('Cancelled', 'Paid')
+		AND outstanding_amount > 0
+		GROUP BY student_enrollment
+	""", {"as_of": as_of})
+	
+	# Attendance rows as arrays
+	rows = np.array([index.get((row[0], row[1]), -1) for row in attendance], dtype=np.int64)
+	age = np.array([row[2] for row in attendance], dtype=np.int64)
+	status = np.array([row[3] for row in attendance], dtype=object)
+	
+	keep = rows >= 0
+	rows, age, status = rows[keep], age[keep], status[keep]
+	
+	rate_recent, rate_prior, streak = get_attendance_features(rows, age, status, count)
+	
+	# Invoice totals as arrays
+	outstanding = np.zeros(count)
+	days_overdue = np.zeros(count)
+	enrollment_index = {e.name: i for i, e in enumerate(enrollments)}
+	for student_enrollment, amount, overdue in invoices:
+		i = enrollment_index.get(student_enrollment)
+		if i is not None:
+			outstanding[i] = float(amount or 0)
+			days_overdue[i] = float(overdue or 0)
+	
+	total_fee = np.array([float(e.total_fee or 0) for e in enrollments])
+	
+	features = {
+		"absence": 1 - rate_recent,
+		"trend": np.clip(rate_prior - rate_recent, 0, 1),
+		"streak": np.clip(streak / RISK_STREAK_CAP, 0, 1),
+		"balance": np.clip(np.divide(outstanding, total_fee, out=(outstanding > 0).astype(float), where=total_fee > 0), 0, 1),
+		"overdue": np.clip(days_overdue / RISK_OVERDUE_CAP, 0, 1)
+	}
+	
+	scores = np.round(100 * sum(RISK_WEIGHTS[name] * values for name, values in features.items()), 1)
+	
+	update_risk_scores(enrollments, scores, features, {
+		"attendance_rate": np.round(rate_recent * 100, 1),
+		"streak": streak,
+		"outstanding": outstanding,
+		"days_overdue": days_overdue
+	})
+
+
+def get_attendance_features(rows, age, status, count):
+	"""
+	Get recent and prior attendance rates and trailing absence streaks per enrollment
+	
+	Args:
+		rows: Enrollment index of each mark, marks of an enrollment together in date order
+		age: Days from each mark to the scoring date
+		status: Status of each mark
+		count: Number of enrollments
+	
+	Enrollments without marks keep a full rate and no streak. Returns the
+	(rate_recent, rate_prior, streak) arrays.
+	"""
+	import numpy as np
+	
+	present = (status == "Present").astype(float)
+	bad = (status == "Absent") | (status == "Late")
+	recent = age < RISK_WINDOW_DAYS // 2
+	
+	sessions_recent = np.bincount(rows, weights=recent, minlength=count)
+	sessions_prior = np.bincount(rows, weights=~recent, minlength=count)
+	present_recent = np.bincount(rows, weights=present * recent, minlength=count)
+	present_prior = np.bincount(rows, weights=present * ~recent, minlength=count)
+	
+	with np.errstate(divide="ignore", invalid="ignore"):
+		rate_recent = np.where(sessions_recent > 0, present_recent / sessions_recent, 1.0)
+		rate_prior = np.where(sessions_prior > 0, present_prior / sessions_prior, rate_recent)
+	
+	# Trailing run of absent/late marks: distance from each enrollment's last
+	# row back to its last good mark. Bad marks are seeded with their group's
+	# start - 1, so the running maximum never reaches into a previous group.
+	streak = np.zeros(count)
+	if len(rows):
+		positions = np.arange(len(rows))
+		group_start = np.r_[0, np.flatnonzero(np.diff(rows)) + 1]
+		group_end = np.r_[group_start[1:], len(rows)] - 1
+		seed = np.repeat(group_start - 1, np.diff(np.r_[group_start, len(rows)]))
+		last_good = np.maximum.accumulate(np.where(bad, seed, positions))
+		streak[rows[group_end]] = group_end - last_good[group_end]
+	
+	return rate_recent, rate_prior, streak
+
+
+def get_risk_level(score):
+	for threshold, level in RISK_LEVELS:
+		if score >= threshold:
+			return level
+
+
+def update_risk_scores(enrollments, scores, features, details):
+	"""Write scores back with one CASE update per chunk of enrollments"""
+	updated_on = now_datetime()
+	
+	rows = []
+	for i, enrollment in enumerate(enrollments):
+		factors = {key: round(float(value[i]), 3) for key, value in features.items()}
+		factors.update({key: float(value[i]) for key, value in details.items()})
+		rows.append((enrollment.name, float(scores[i]), get_risk_level(float(scores[i])), json.dumps(factors)))
+	
+	for start in range(0, len(rows), RISK_UPDATE_CHUNK_SIZE):
+		chunk = rows[start:start + RISK_UPDATE_CHUNK_SIZE]
+		cases = " ".join(["WHEN %s THEN %s"] * len(chunk))
+		
+		values = []
+		for column in (1, 2, 3):
+			for row in chunk:
+				values.extend([row[0], row[column]])
+		values.append(updated_on)
+		values.append(tuple(row[0] for row in chunk))
+		
+		frappe.db.sql(f"""
+			UPDATE `tabStudent Enrollment`
+			SET
+				risk_score = CASE name {cases} END,
+				risk_level = CASE name {cases} END,
+				risk_factors = CASE name {cases} END,
+				risk_updated_on = %s
+			WHERE name IN %s
+		""", tuple(values))
+	
+	frappe.db.commit()
+
+
+@frappe.whitelist()
+def get_at_risk_students(batch=None, course=None, risk_level=None, limit=50):
+	"""
+	Get active enrollments ranked by risk score, highest first
+	
+	Args:
+		batch: Filter by batch
+		course: Filter by course
+		risk_level: Filter by Low, Medium or High
+		limit: Maximum number of rows
+	"""
+	try:
+		conditions = ["status = 'Active'", "risk_score IS NOT NULL"]
+		values = {"limit": min(cint(limit) or 50, 500)}
+		
+		for field, value in (("batch", batch), ("course", course), ("risk_level", risk_level)):
+			if value:
+				conditions.append(f"{field} = %({field})s")
+				values[field] = value
+		
+		data = frappe.db.sql(f"""
+			SELECT
+				name, student, student_name, course, course_name, batch, batch_name,
+				risk_score, risk_level, risk_factors, risk_updated_on
+			FROM `tabStudent Enrollment`
+			WHERE {" AND ".join(conditions)}
+			ORDER BY risk_score DESC
+			LIMIT %(limit)s
+		""", values, as_dict=True)
+		
+		for row in data:
+			row.risk_factors = json.loads(row.risk_factors) if row.risk_factors else {}
+		
+		return {
+			"status": "success",
+			"data": data
+		}
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "At Risk Students Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
@@ -0,0 +1,124 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import getdate, today
+
+# Rosters are rebuilt on enrollment or attendance changes, the TTL only bounds stale keys
+ROSTER_CACHE_TTL = 12 * 60 * 60
+
+
+def get_roster_cache_key(teacher, date):
+	return f"smspro:teacher_roster:{teacher}:{getdate(date)}"
+
+
+@frappe.whitelist()
+def get_teacher_roster(date=None):
+	"""
+	Get the current user's classes for a date with their students and any
+	attendance already marked
+	
+	Args:
+		date: Roster date (defaults to today)
+	"""
+	try:
+		teacher = frappe.session.user
+		date = getdate(date or today())
+		
+		cache_key = get_roster_cache_key(teacher, date)
+		roster = frappe.cache.get_value(cache_key)
+		
+		if roster is None:
+			roster = build_teacher_roster(teacher, date)
+			frappe.cache.set_value(cache_key, roster, expires_in_sec=ROSTER_CACHE_TTL)
+		
+		return {
+			"status": "success",
+			"data": roster
+		}
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Teacher Roster Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
+
+
+def build_teacher_roster(teacher, date):
+	"""Build a teacher's roster for a date from three indexed queries"""
+	sessions = frappe.get_all(
+		"Class Session",
+		filters={"session_date": date, "teacher": teacher, "status": "Scheduled"},
+		fields=["name", "batch", "batch_name", "course", "classroom", "start_time", "end_time"],
+		order_by="start_time ASC"
+	)
+	
+	batches = [s.batch for s in sessions]
+	if not batches:
+		return {"date": str(date), "teacher": teacher, "classes": []}
+	
+	enrollments = frappe.db.sql("""
+		SELECT name, student, student_name, batch
+		FROM `tabStudent Enrollment`
+		WHERE batch IN %(batches)s
+		AND status = 'Active'
+		AND (enrollment_date IS NULL OR enrollment_date <= %(date)s)
+		ORDER BY student_name ASC
+	""", {"batches": batches, "date": date}, as_dict=True)
+	
+	attendance = frappe.db.sql("""
+		SELECT name, student, batch, status, notes
+		FROM `tabAttendance`
+		WHERE batch IN %(batches)s
+		AND attendance_date = %(date)s
+	""", {"batches": batches, "date": date}, as_dict=True)
+	
+	marked = {(a.batch, a.student): a for a in attendance}
+	
+	students_by_batch = {}
+	for enrollment in enrollments:
+		mark = marked.get((enrollment.batch, enrollment.student))
+		students_by_batch.setdefault(enrollment.batch, []).append({
+			"student": enrollment.student,
+			"student_name": enrollment.student_name,
+			"enrollment": enrollment.name,
+			"attendance": mark.name if mark else None,
+			"attendance_status": mark.status if mark else None,
+			"notes": mark.notes if mark else None
+		})
+	
+	classes = []
+	for session in sessions:
+		students = students_by_batch.get(session.batch, [])
+		classes.append({
+			"session": session.name,
+			"batch": session.batch,
+			"batch_name": session.batch_name,
+			"course": session.course,
+			"classroom": session.classroom,
+			"start_time": str(session.start_time) if session.start_time else None,
+			"end_time": str(session.end_time) if session.end_time else None,
+			"students": students,
+			"student_count": len(students),
+			"marked_count": len([s for s in students if s["attendance"]])
+		})
+	
+	return {"date": str(date), "teacher": teacher, "classes": classes}
+
+
+def clear_teacher_roster_cache(teacher, date=None):
+	"""Drop a teacher's cached roster for one date, or for every date"""
+	if not teacher:
+		return
+	
+	if date:
+		frappe.cache.delete_value(get_roster_cache_key(teacher, date))
+	else:
+		frappe.cache.delete_keys(f"smspro:teacher_roster:{teacher}:")
+
+
+def clear_batch_roster_cache(batch, date=None):
+	"""Drop the cached rosters of the teacher of a batch"""
+	if batch:
+		clear_teacher_roster_cache(frappe.db.get_value("Batch", batch, "teacher"), date)
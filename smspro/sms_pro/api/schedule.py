@@ -0,0 +1,175 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.utils import getdate, today
+
+from smspro.sms_pro.doctype.attendance_archive.attendance_archive import get_attendance_source
+
+SESSION_FIELDS = ["name", "batch", "batch_name", "course", "teacher", "classroom",
+	"session_date", "start_time", "end_time", "status"]
+
+
+@frappe.whitelist()
+def get_todays_classes(date=None, teacher=None, classroom=None):
+	"""
+	Get the class sessions held on a date (defaults to today)
+	
+	Args:
+		date: Session date
+		teacher: Only sessions of this teacher
+		classroom: Only sessions in this classroom
+	"""
+	try:
+		filters = {
+			"session_date": getdate(date or today()),
+			"status": "Scheduled"
+		}
+		
+		if teacher:
+			filters["teacher"] = teacher
+		if classroom:
+			filters["classroom"] = classroom
+		
+		sessions = frappe.get_all(
+			"Class Session",
+			filters=filters,
+			fields=SESSION_FIELDS,
+			order_by="start_time ASC"
+		)
+		
+		return {
+			"status": "success",
+			"data": sessions
+		}
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Todays Classes Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
+
+
+@frappe.whitelist()
+def get_calendar_events(start, end, filters=None):
+	"""
+	Get class sessions between two dates for the calendar view
+	"""
+	conditions = {"session_date": ["between", [getdate(start), getdate(end)]]}
+	
+	if filters:
+		filters = frappe.parse_json(filters)
+		for field in ("batch", "teacher", "classroom"):
+			value = filters.get(field) if isinstance(filters, dict) else None
+			if value:
+				conditions[field] = value
+	
+	sessions = frappe.get_all(
+		"Class Session",
+		filters=conditions,
+		fields=SESSION_FIELDS,
+		order_by="session_date ASC, start_time ASC"
+	)
+	
+	events = []
+	for session in sessions:
+		events.append({
+			"name": session.name,
+			"title": f"{session.batch_name or session.batch} ({session.classroom or _('No room')})",
+			"start": f"{session.session_date} {session.start_time or '00:00:00'}",
+			"end": f"{session.session_date} {session.end_time or session.start_time or '23:59:59'}",
+			"all_day": 0 if session.start_time else 1,
+			"status": session.status
+		})
+	
+	return events
+
+
+def get_session_attendance(batch=None, teacher=None, from_date=None, to_date=None):
+	"""
+	Get expected and recorded attendance for each scheduled class session
+	
+	Expected attendance is the number of active enrollments that had started
+	by the session date, recorded attendance is the number of Attendance rows
+	marked for that batch and date, live or archived.
+	"""
+	conditions = ["cs.status = 'Scheduled'"]
+	values = {}
+	
+	if batch:
+		conditions.append("cs.batch = %(batch)s")
+		values["batch"] = batch
+	if teacher:
+		conditions.append("cs.teacher = %(teacher)s")
+		values["teacher"] = teacher
+	if from_date:
+		conditions.append("cs.session_date >= %(from_date)s")
+		values["from_date"] = getdate(from_date)
+	if to_date:
+		conditions.append("cs.session_date <= %(to_date)s")
+		values["to_date"] = getdate(to_date)
+	
+	# Sessions of archived batches are matched against the archive as well
+	source = get_attendance_source(from_date, batch)
+	
+	return frappe.db.sql(f"""
+		SELECT
+			cs.name,
+			cs.batch,
+			cs.batch_name,
+			cs.session_date,
+			(
+				SELECT COUNT(*)
+				FROM `tabStudent Enrollment` se
+				WHERE se.batch = cs.batch
+				AND se.status = 'Active'
+				AND (se.enrollment_date IS NULL OR se.enrollment_date <= cs.session_date)
+			) as expected,
+			COUNT(a.name) as recorded,
+			COALESCE(SUM(CASE WHEN a.status = 'Present' THEN 1 ELSE 0 END), 0) as attended
+		FROM `tabClass Session` cs
+		LEFT JOIN {source} a
+			ON a.batch = cs.batch AND a.attendance_date = cs.session_date
+		WHERE {" AND ".join(conditions)}
+		GROUP BY cs.name, cs.batch, cs.batch_name, cs.session_date
+		ORDER BY cs.session_date ASC
+	""", values, as_dict=True)
+
+
+@frappe.whitelist()
+def get_attendance_rates(batch=None, teacher=None, from_date=None, to_date=None):
+	"""
+	Get expected vs recorded attendance per class session
+	"""
+	try:
+		sessions = get_session_attendance(batch, teacher, from_date, to_date or today())
+		
+		for session in sessions:
+			session.recording_rate = round(session.recorded / session.expected * 100, 2) if session.expected else 0
+			session.attendance_rate = round(session.attended / session.expected * 100, 2) if session.expected else 0
+		
+		total_expected = sum(s.expected for s in sessions)
+		total_recorded = sum(s.recorded for s in sessions)
+		total_attended = sum(s.attended for s in sessions)
+		
+		return {
+			"status": "success",
+			"sessions": sessions,
+			"summary": {
+				"total_sessions": len(sessions),
+				"unrecorded_sessions": len([s for s in sessions if s.expected and not s.recorded]),
+				"expected_attendance": total_expected,
+				"recorded_attendance": total_recorded,
+				"recording_rate": round(total_recorded / total_expected * 100, 2) if total_expected else 0,
+				"attendance_rate": round(total_attended / total_expected * 100, 2) if total_expected else 0
+			}
+		}
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Attendance Rates Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
@@ -0,0 +1,267 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import frappe
+from frappe import _
+from frappe.utils import flt, getdate
+
+# Students rendered per worker task, and written to disk together
+STATEMENT_CHUNK_SIZE = 250
+
+STATEMENT_TEMPLATE = "statements/student_statement.html"
+
+# Progress records outlive the run long enough for the UI to pick up the file
+PROGRESS_TTL = 24 * 60 * 60
+
+TERM_ENROLLMENTS_SQL = """
+	SELECT se.name
+	FROM `tabStudent Enrollment` se
+	JOIN `tabBatch` b ON b.name = se.batch
+	WHERE se.status != 'Cancelled'
+	AND b.start_date <= %(to_date)s
+	AND (b.end_date IS NULL OR b.end_date >= %(from_date)s)
+"""
+
+
+@frappe.whitelist()
+def generate_statements(from_date, to_date, output_format="pdf", processes=None):
+	"""
+	Start generating account statements for every student enrolled in a term
+	
+	Args:
+		from_date: First day of the term
+		to_date: Last day of the term
+		output_format: "pdf" or "html"
+		processes: Number of render processes, at most the CPU count (the default)
+	"""
+	try:
+		# Statements carry every family's invoices and payments
+		frappe.has_permission("Fee Invoice", "read", throw=True)
+		
+		if output_format not in ("pdf", "html"):
+			frappe.throw(_("Output format must be pdf or html"))
+		
+		run_id = frappe.generate_hash(length=10)
+		set_progress(run_id, status="Queued", total=0, done=0)
+		
+		frappe.enqueue(
+			"smspro.sms_pro.api.statements.run_statement_generation",
+			queue="long",
+			timeout=4 * 60 * 60,
+			run_id=run_id,
+			from_date=str(getdate(from_date)),
+			to_date=str(getdate(to_date)),
+			output_format=output_format,
+			processes=get_process_count(processes),
+			user=frappe.session.user
+		)
+		
+		return {
+			"status": "success",
+			"run_id": run_id,
+			"message": _("Statement generation queued")
+		}
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Statement Generation Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
+
+
+def get_process_count(processes=None):
+	"""Get the render processes to start, between 1 and the CPU count"""
+	cpu_count = os.cpu_count() or 1
+	return min(max(1, int(processes)), cpu_count) if processes else cpu_count
+
+
+@frappe.whitelist()
+def get_statement_progress(run_id):
+	"""Get the progress of a statement generation run"""
+	progress = frappe.cache.get_value(get_progress_key(run_id))
+	
+	if not progress:
+		return {"status": "error", "message": _("Statement run {0} not found").format(run_id)}
+	
+	return {"status": "success", "data": progress}
+
+
+def run_statement_generation(run_id, from_date, to_date, output_format="pdf", processes=None, user=None):
+	"""Background job: fetch a term's statement data and render it in a process pool"""
+	try:
+		statements = get_statement_data(from_date, to_date)
+		set_progress(run_id, status="Running", total=len(statements), done=0, user=user)
+		
+		folder_name = f"statements-{from_date}-{to_date}-{run_id}"
+		output_dir = frappe.get_site_path("private", "files", folder_name)
+		os.makedirs(output_dir, exist_ok=True)
+		
+		with open(frappe.get_app_path("smspro", "templates", STATEMENT_TEMPLATE)) as f:
+			template = f.read()
+		
+		chunks = [
+			(template, statements[i:i + STATEMENT_CHUNK_SIZE], output_format)
+			for i in range(0, len(statements), STATEMENT_CHUNK_SIZE)
+		]
+		
+		# Spawned, not forked: workers must not inherit this job's database and Redis sockets
+		done = 0
+		with ProcessPoolExecutor(
+			max_workers=get_process_count(processes),
+			mp_context=multiprocessing.get_context("spawn")
+		) as pool:
+			# Results come back in submission order, one chunk at a time
+			for rendered in pool.map(render_statement_chunk, chunks):
+				for filename, content in rendered:
+					with open(os.path.join(output_dir, filename), "wb") as f:
+						f.write(content)
+				
+				done += len(rendered)
+				set_progress(run_id, status="Running", total=len(statements), done=done, user=user)
+		
+		archive = shutil.make_archive(output_dir, "zip", output_dir)
+		shutil.rmtree(output_dir)
+		
+		file_doc = frappe.get_doc({
+			"doctype": "File",
+			"file_name": os.path.basename(archive),
+			"file_url": f"/private/files/{os.path.basename(archive)}",
+			"is_private": 1
+		}).insert(ignore_permissions=True)
+		
+		set_progress(run_id, status="Completed", total=len(statements), done=done,
+			file_url=file_doc.file_url, user=user)
+	
+	except Exception:
+		frappe.log_error(frappe.get_traceback(), "Statement Generation Error")
+		set_progress(run_id, status="Failed", user=user)
+
+
+def get_statement_data(from_date, to_date):
+	"""
+	Get statement data for every student enrolled in a term
+	
+	Enrollments, invoices and ledger entries are fetched with one query each
+	and grouped per student in memory.
+	"""
+	values = {"from_date": getdate(from_date), "to_date": getdate(to_date)}
+	
+	enrollments = frappe.db.sql(f"""
+		SELECT
+			se.name, se.student, se.course, se.course_name, se.batch, se.batch_name,
+			se.enrollment_date, se.status, se.total_fee,
+			s.first_name, s.last_name, s.parent_name, s.address
+		FROM `tabStudent Enrollment` se
+		JOIN `tabStudent` s ON s.name = se.student
+		WHERE se.name IN ({TERM_ENROLLMENTS_SQL})
+		ORDER BY se.student, se.enrollment_date
+	""", values, as_dict=True)
+	
+	invoices = frappe.db.sql(f"""
+		SELECT name, student, invoice_date, due_date, status, total_amount, outstanding_amount
+		FROM `tabFee Invoice`
+		WHERE student_enrollment IN ({TERM_ENROLLMENTS_SQL})
+		AND status != 'Cancelled'
+		ORDER BY invoice_date
+	""", values, as_dict=True)
+	
+	payments = frappe.db.sql(f"""
+		SELECT student, payment_entry, entry_type, posting_date, amount, mode_of_payment
+		FROM `tabSMS Payment Ledger`
+		WHERE student_enrollment IN ({TERM_ENROLLMENTS_SQL})
+		AND posting_date <= %(to_date)s
+		ORDER BY posting_date, creation
+	""", values, as_dict=True)
+	
+	statements = {}
+	for row in enrollments:
+		if row.student not in statements:
+			statements[row.student] = {
+				"student": {
+					"name": row.student,
+					"student_name": f"{row.first_name or ''} {row.last_name or ''}".strip(),
+					"parent_name": row.parent_name,
+					"address": row.address
+				},
+				"from_date": str(values["from_date"]),
+				"to_date": str(values["to_date"]),
+				"enrollments": [],
+				"invoices": [],
+				"payments": []
+			}
+		statements[row.student]["enrollments"].append(dict(row))
+	
+	for row in invoices:
+		if row.student in statements:
+			statements[row.student]["invoices"].append(dict(row))
+	
+	for row in payments:
+		if row.student in statements:
+			statements[row.student]["payments"].append(dict(row))
+	
+	for statement in statements.values():
+		statement["total_invoiced"] = sum(flt(inv["total_amount"]) for inv in statement["invoices"])
+		statement["total_paid"] = sum(flt(p["amount"]) for p in statement["payments"])
+		statement["balance"] = max(0, statement["total_invoiced"] - statement["total_paid"])
+	
+	return list(statements.values())
+
+
+def render_statement_chunk(args):
+	"""
+	Render a chunk of statements in a worker process
+	
+	Runs in a fresh interpreter without a site connection, everything it
+	needs is in the arguments.
+	"""
+	from jinja2 import Environment
+	
+	template, statements, output_format = args
+	
+	env = Environment(autoescape=True)
+	env.globals["currency"] = lambda value: f"₫{flt(value):,.0f}"
+	compiled = env.from_string(template)
+	
+	rendered = []
+	for statement in statements:
+		html = compiled.render(**statement)
+		filename = f"{statement['student']['name']}.{output_format}"
+		
+		if output_format == "pdf":
+			import pdfkit
+			
+			content = pdfkit.from_string(html, False, options={"encoding": "UTF-8", "page-size": "A4", "quiet": ""})
+		else:
+			content = html.encode("utf-8")
+		
+		rendered.append((filename, content))
+	
+	return rendered
+
+
+def get_progress_key(run_id):
+	return f"smspro:statement_run:{run_id}"
+
+
+def set_progress(run_id, status, total=None, done=None, file_url=None, user=None):
+	progress = frappe.cache.get_value(get_progress_key(run_id)) or {}
+	progress.update({"run_id": run_id, "status": status})
+	
+	if total is not None:
+		progress["total"] = total
+	if done is not None:
+		progress["done"] = done
+		progress["percent"] = round(done / total * 100, 2) if total else 100
+	if file_url:
+		progress["file_url"] = file_url
+	
+	frappe.cache.set_value(get_progress_key(run_id), progress, expires_in_sec=PROGRESS_TTL)
+	
+	if user:
+		frappe.publish_realtime("smspro_statement_progress", progress, user=user)
@@ -0,0 +1,185 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import math
+import re
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+from smspro.sms_pro.doctype.student_search_token.student_search_token import (
+	MIN_PREFIX_LENGTH,
+	get_trigrams,
+	normalize_phone_digits,
+	normalize_text,
+)
+
+# Candidates fetched per lookup before ranking
+CANDIDATE_LIMIT = 200
+
+# Share of each query word's trigrams a fuzzy match must contain
+TRIGRAM_MATCH_RATIO = 0.5
+
+
+@frappe.whitelist()
+def search_students(query, limit=20):
+	"""
+	Search students by name (with or without tone marks), phone, parent phone or student ID
+	
+	Query words are matched as prefixes of indexed name, phone and ID tokens.
+	When that finds too few students, trigrams shared with every query word
+	catch typos and partial numbers. Candidates are then ranked, exact names
+	first.
+	
+	Args:
+		query: Search text, e.g. "nguyen van", "Nguyễn Văn", "0912" or "STU1234"
+		limit: Maximum number of results
+	"""
+	try:
+		limit = min(cint(limit) or 20, 100)
+		words = get_query_words(query)
+		
+		if not words:
+			return {"status": "success", "data": []}
+		
+		candidates = get_prefix_candidates(words)
+		
+		trigram_count = sum(len(get_trigrams(word)) for word in words)
+		
+		trigram_matches = {}
+		if len(candidates) < limit:
+			trigram_matches = get_trigram_candidates(words)
+		
+		names = set(candidates) | set(trigram_matches)
+		if not names:
+			return {"status": "success", "data": []}
+		
+		students = frappe.db.sql("""
+			SELECT name, student_id, first_name, last_name, phone_number, parent_phone, status, search_name, search_key
+			FROM `tabStudent`
+			WHERE name IN %(names)s
+		""", {"names": tuple(names)}, as_dict=True)
+		
+		query_text = " ".join(words)
+		for student in students:
+			student.score = get_score(student, query_text, words, trigram_count, trigram_matches.get(student.name, 0))
+		
+		students.sort(key=lambda s: (-s.score, s.search_name or ""))
+		
+		return {
+			"status": "success",
+			"data": [
+				{
+					"name": s.name,
+					"student_id": s.student_id,
+					"student_name": f"{s.first_name or ''} {s.last_name or ''}".strip(),
+					"phone_number": s.phone_number,
+					"parent_phone": s.parent_phone,
+					"status": s.status,
+					"score": s.score
+				}
+				for s in students[:limit]
+			]
+		}
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Student Search Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
+
+
+def get_query_words(query):
+	"""Normalize a query into search words, keeping phone numbers in one piece"""
+	compact = re.sub(r"[\s\-\.\+\(\)]", "", query or "")
+	if compact.isdigit():
+		return [normalize_phone_digits(compact)]
+	
+	return normalize_text(query).split()
+
+
+def get_prefix_candidates(words):
+	"""Get students having a token starting with every query word"""
+	words = [word for word in words if len(word) >= MIN_PREFIX_LENGTH]
+	if not words:
+		return []
+	
+	lookups = " UNION ALL ".join(
+		f"""SELECT student, {i} as word_no
+		FROM `tabStudent Search Token`
+		WHERE token_type = 'Word' AND token LIKE %(word_{i})s"""
+		for i in range(len(words))
+	)
+	values = {f"word_{i}": f"{word}%" for i, word in enumerate(words)}
+	values["words"] = len(words)
+	values["limit"] = CANDIDATE_LIMIT
+	
+	return frappe.db.sql_list(f"""
+		SELECT student
+		FROM ({lookups}) t
+		GROUP BY student
+		HAVING COUNT(DISTINCT word_no) = %(words)s
+		LIMIT %(limit)s
+	""", values)
+
+
+def get_trigram_candidates(words):
+	"""
+	Get students sharing enough trigrams with every query word, with the number shared
+	
+	Each word is matched on its own, so one well matched word cannot carry a
+	query whose other words the student does not have.
+	"""
+	word_trigrams = [trigrams for trigrams in map(get_trigrams, words) if trigrams]
+	if not word_trigrams:
+		return {}
+	
+	lookups = " UNION ALL ".join(
+		f"""SELECT student, {i} as word_no, COUNT(*) as matched
+		FROM `tabStudent Search Token`
+		WHERE token_type = 'Trigram' AND token IN %(trigrams_{i})s
+		GROUP BY student
+		HAVING matched >= %(min_matched_{i})s"""
+		for i in range(len(word_trigrams))
+	)
+	values = {}
+	for i, trigrams in enumerate(word_trigrams):
+		values[f"trigrams_{i}"] = tuple(trigrams)
+		values[f"min_matched_{i}"] = max(1, math.ceil(len(trigrams) * TRIGRAM_MATCH_RATIO))
+	values["words"] = len(word_trigrams)
+	values["limit"] = CANDIDATE_LIMIT
+	
+	return dict(frappe.db.sql(f"""
+		SELECT student, SUM(matched) as matched
+		FROM ({lookups}) t
+		GROUP BY student
+		HAVING COUNT(DISTINCT word_no) = %(words)s
+		ORDER BY matched DESC
+		LIMIT %(limit)s
+	""", values))
+
+
+def get_score(student, query_text, words, trigram_count, trigrams_matched):
+	"""Rank a candidate: exact name, name prefix, word prefixes, then trigram overlap"""
+	search_name = student.search_name or ""
+	key_words = (student.search_key or "").split()
+	
+	if search_name == query_text or query_text in key_words:
+		score = 100
+	elif search_name.startswith(query_text):
+		score = 90
+	elif all(any(key.startswith(word) for key in key_words) for word in words):
+		score = 70
+	else:
+		score = 0
+	
+	if trigrams_matched and trigram_count:
+		score = max(score, round(60 * trigrams_matched / trigram_count))
+	
+	# Current students first among equals
+	if student.status == "Active":
+		score += 5
+	
+	return score
@@ -0,0 +1,29 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import random
+
+from frappe.tests.utils import FrappeTestCase
+
+from smspro.sms_pro.api.attendance_matrix import NO_MARK, STATUS_CODES, decode_rle, encode_rle
+
+
+class TestAttendanceMatrixEncoding(FrappeTestCase):
+	def test_encode(self):
+		self.assertEqual(encode_rle("PPPA.."), "3P1A2.")
+		self.assertEqual(encode_rle(""), "")
+	
+	def test_round_trip(self):
+		codes = [*STATUS_CODES.values(), NO_MARK]
+		rows = ["", "P", NO_MARK * 120, "P" * 12 + "A" + "P" * 12, "".join(codes)]
+		
+		rng = random.Random(42)
+		rows += ["".join(rng.choice(codes) for _i in range(rng.randint(1, 200))) for _j in range(50)]
+		
+		for row in rows:
+			self.assertEqual(decode_rle(encode_rle(row)), row)
+	
+	def test_runs_of_ten_or_more(self):
+		# Multi-digit counts must not be split into separate runs
+		self.assertEqual(encode_rle("P" * 12 + "L"), "12P1L")
+		self.assertEqual(decode_rle("12P1L"), "P" * 12 + "L")
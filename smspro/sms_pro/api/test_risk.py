@@ -0,0 +1,66 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import numpy as np
+from frappe.tests.utils import FrappeTestCase
+
+from smspro.sms_pro.api.risk import get_attendance_features, get_risk_level
+
+
+def make_marks(groups):
+	"""Flatten {enrollment: [(age, status), ...]} into the arrays compute_risk_scores builds"""
+	marks = [(row, age, status) for row, group in groups for age, status in group]
+	rows, age, status = zip(*marks, strict=True)
+	return np.array(rows, dtype=np.int64), np.array(age, dtype=np.int64), np.array(status, dtype=object)
+
+
+class TestRiskFeatures(FrappeTestCase):
+	def setUp(self):
+		# Enrollment 2 has no attendance, 1 is all absent/late right after a group ending Absent
+		rows, age, status = make_marks([
+			(0, [(40, "Present"), (35, "Present"), (10, "Present"), (5, "Absent"), (1, "Absent")]),
+			(1, [(15, "Absent"), (8, "Late"), (2, "Absent")]),
+			(3, [(20, "Absent"), (10, "Absent"), (3, "Present")]),
+			(4, [(9, "Present"), (2, "Excused")])
+		])
+		self.rate_recent, self.rate_prior, self.streak = get_attendance_features(rows, age, status, 5)
+	
+	def test_trailing_streak(self):
+		self.assertEqual(self.streak[0], 2)
+	
+	def test_streak_stops_at_group_boundary(self):
+		# Enrollment 0's absences do not carry over into enrollment 1's streak
+		self.assertEqual(self.streak[1], 3)
+		self.assertEqual(self.streak[3], 0)
+	
+	def test_all_bad_group(self):
+		self.assertEqual(self.rate_recent[1], 0)
+		self.assertEqual(self.rate_prior[1], 0)
+	
+	def test_excused_is_not_part_of_a_streak(self):
+		self.assertEqual(self.streak[4], 0)
+		self.assertEqual(self.rate_recent[4], 0.5)
+	
+	def test_enrollment_without_attendance(self):
+		self.assertEqual(self.rate_recent[2], 1)
+		self.assertEqual(self.rate_prior[2], 1)
+		self.assertEqual(self.streak[2], 0)
+	
+	def test_trend_compares_recent_with_prior_half(self):
+		self.assertEqual(self.rate_prior[0], 1)
+		self.assertAlmostEqual(self.rate_recent[0], 1 / 3)
+		# Without prior marks there is no trend
+		self.assertEqual(self.rate_prior[3], self.rate_recent[3])
+	
+	def test_no_attendance_at_all(self):
+		empty = np.array([], dtype=np.int64)
+		rate_recent, rate_prior, streak = get_attendance_features(empty, empty, np.array([], dtype=object), 3)
+		
+		self.assertEqual(rate_recent.tolist(), [1, 1, 1])
+		self.assertEqual(rate_prior.tolist(), [1, 1, 1])
+		self.assertEqual(streak.tolist(), [0, 0, 0])
+	
+	def test_risk_levels(self):
+		self.assertEqual(get_risk_level(75), "High")
+		self.assertEqual(get_risk_level(35), "Medium")
+		self.assertEqual(get_risk_level(0), "Low")
@@ -0,0 +1,198 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+from datetime import timedelta
+
+import frappe
+from frappe import _
+from frappe.utils import getdate, to_timedelta
+
+from smspro.sms_pro.doctype.batch.batch import WEEKDAYS, parse_days_of_week
+from smspro.sms_pro.doctype.class_session.class_session import DEFAULT_SESSION_HOURS
+
+# Batches in these states no longer occupy a room or a teacher
+INACTIVE_BATCH_STATUSES = ("Cancelled", "Completed")
+
+BATCH_FIELDS_SQL = """
+	b.name, b.batch_name, b.teacher, b.classroom, b.start_date, b.end_date,
+	b.class_time, b.days_of_week, c.hours_per_session
+"""
+
+
+def get_interval(batch):
+	"""Return (start, end) of a batch's class in minutes since midnight"""
+	start = to_timedelta(batch.class_time)
+	end = start + timedelta(hours=batch.hours_per_session or DEFAULT_SESSION_HOURS)
+	return int(start.total_seconds() // 60), int(end.total_seconds() // 60)
+
+
+def dates_overlap(a, b):
+	"""Check whether the date ranges of two batches overlap, open ends run forever"""
+	a_start, b_start = getdate(a.start_date), getdate(b.start_date)
+	a_end = getdate(a.end_date) if a.end_date else None
+	b_end = getdate(b.end_date) if b.end_date else None
+	
+	return (b_end is None or a_start <= b_end) and (a_end is None or b_start <= a_end)
+
+
+def describe_conflict(resource, value, weekday, a, b):
+	return frappe._dict({
+		"resource": resource,
+		"value": value,
+		"weekday": WEEKDAYS[weekday],
+		"batch": a.name,
+		"batch_name": a.batch_name,
+		"conflicting_batch": b.name,
+		"conflicting_batch_name": b.batch_name
+	})
+
+
+def get_batch_conflicts(batch):
+	"""
+	Find batches booked into the same classroom or with the same teacher at an
+	overlapping time
+	
+	Only batches sharing the room or teacher and overlapping the date range are
+	read, through the (teacher, start_date) and (classroom, start_date) indexes.
+	"""
+	if batch.status in INACTIVE_BATCH_STATUSES or not batch.class_time or not batch.start_date:
+		return []
+	
+	weekdays = set(parse_days_of_week(batch.days_of_week))
+	if not weekdays or not (batch.teacher or batch.classroom):
+		return []
+	
+	values = {
+		"name": batch.name or "",
+		"start_date": getdate(batch.start_date),
+		"end_date": getdate(batch.end_date) if batch.end_date else None,
+		"inactive": INACTIVE_BATCH_STATUSES
+	}
+	
+	resource_conditions = []
+	for resource in ("teacher", "classroom"):
+		if batch.get(resource):
+			resource_conditions.append(f"b.{resource} = %({resource})s")
+			values[resource] = batch.get(resource)
+	
+	candidates = frappe.db.sql(f"""
+		SELECT {BATCH_FIELDS_SQL}
+		FROM `tabBatch` b
+		LEFT JOIN `tabCourse` c ON c.name = b.course
+		WHERE ({" OR ".join(resource_conditions)})
+		AND b.name != %(name)s
+		AND b.status NOT IN %(inactive)s
+		AND (%(end_date)s IS NULL OR b.start_date <= %(end_date)s)
+		AND (b.end_date IS NULL OR b.end_date >= %(start_date)s)
+	""", values, as_dict=True)
+	
+	if not candidates:
+		return []
+	
+	current = frappe._dict(batch.as_dict())
+	current.hours_per_session = frappe.get_value("Course", batch.course, "hours_per_session") if batch.course else None
+	start, end = get_interval(current)
+	
+	conflicts = []
+	for candidate in candidates:
+		if not candidate.class_time:
+			continue
+		
+		other_start, other_end = get_interval(candidate)
+		if other_start >= end or start >= other_end:
+			continue
+		
+		shared_days = weekdays.intersection(parse_days_of_week(candidate.days_of_week))
+		if not shared_days:
+			continue
+		
+		for resource in ("teacher", "classroom"):
+			if batch.get(resource) and batch.get(resource) == candidate.get(resource):
+				conflicts.append(describe_conflict(resource, candidate.get(resource), min(shared_days), current, candidate))
+	
+	return conflicts
+
+
+def find_timetable_conflicts(batches):
+	"""
+	Find every room and teacher double booking among the given batches
+	
+	Each class becomes an interval on a weekly timeline (weekday * 1440 + minute)
+	per classroom and per teacher. A single sweep over the sorted start and end
+	events keeps the set of classes in progress, and a class starting while
+	another with an overlapping date range is still in progress is a conflict.
+	"""
+	events = {}
+	for batch in batches:
+		if not batch.class_time:
+			continue
+		
+		start, end = get_interval(batch)
+		for weekday in parse_days_of_week(batch.days_of_week):
+			offset = weekday * 1440
+			for resource in ("teacher", "classroom"):
+				value = batch.get(resource)
+				if not value:
+					continue
+				timeline = events.setdefault((resource, value), [])
+				# Ends sort before starts at the same minute, back-to-back classes do not clash
+				timeline.append((offset + end, 0, weekday, batch))
+				timeline.append((offset + start, 1, weekday, batch))
+	
+	conflicts = []
+	for (resource, value), timeline in events.items():
+		timeline.sort(key=lambda event: (event[0], event[1]))
+		active = {}
+		
+		for _minute, is_start, weekday, batch in timeline:
+			if not is_start:
+				active.pop(batch.name, None)
+				continue
+			
+			for other in active.values():
+				if dates_overlap(batch, other):
+					conflicts.append(describe_conflict(resource, value, weekday, other, batch))
+			
+			active[batch.name] = batch
+	
+	return conflicts
+
+
+@frappe.whitelist()
+def validate_timetable(from_date, to_date):
+	"""
+	Check all batches running in a term for classroom and teacher conflicts
+	
+	Args:
+		from_date: First day of the term
+		to_date: Last day of the term
+	"""
+	try:
+		batches = frappe.db.sql(f"""
+			SELECT {BATCH_FIELDS_SQL}
+			FROM `tabBatch` b
+			LEFT JOIN `tabCourse` c ON c.name = b.course
+			WHERE b.status NOT IN %(inactive)s
+			AND b.start_date <= %(to_date)s
+			AND (b.end_date IS NULL OR b.end_date >= %(from_date)s)
+		""", {
+			"from_date": getdate(from_date),
+			"to_date": getdate(to_date),
+			"inactive": INACTIVE_BATCH_STATUSES
+		}, as_dict=True)
+		
+		conflicts = find_timetable_conflicts(batches)
+		
+		return {
+			"status": "success",
+			"batches_checked": len(batches),
+			"conflicts": conflicts,
+			"message": _("{0} conflicts found in {1} batches").format(len(conflicts), len(batches))
+		}
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Timetable Validation Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
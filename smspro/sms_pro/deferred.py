@@ -0,0 +1,85 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+"""
+Deferred, coalesced side effects for document hooks
+
+Hooks call `defer(method, key, **kwargs)` instead of doing recomputation
+inline. Calls are collected per key for the current transaction and, once it
+commits, each key is enqueued as one background job. A key that is already
+waiting in the queue is not enqueued again, so saving 200 enrollments of a
+batch recounts that batch once.
+
+Set `smspro_sync_side_effects` in site config (tests do this implicitly) to
+run side effects inline, exactly as before.
+"""
+
+import frappe
+
+# A pending marker expires so a lost job cannot block its key forever
+PENDING_TTL = 10 * 60
+
+
+def is_sync():
+	return bool(
+		frappe.flags.in_test
+		or frappe.flags.in_install
+		or frappe.flags.in_patch
+		or frappe.flags.smspro_sync_side_effects
+		or frappe.conf.get("smspro_sync_side_effects")
+	)
+
+
+def defer(method, key, **kwargs):
+	"""
+	Run `method(**kwargs)` once per key after the current transaction commits
+	
+	Args:
+		method: Dotted path of the function to run
+		key: Coalescing key, e.g. "batch_enrollment:<batch>"
+		kwargs: Arguments for the function, the last call for a key wins
+	"""
+	if is_sync():
+		frappe.get_attr(method)(**kwargs)
+		return
+	
+	pending = frappe.flags.smspro_deferred
+	if pending is None:
+		pending = frappe.flags.smspro_deferred = {}
+		frappe.db.after_commit.add(flush)
+		frappe.db.after_rollback.add(discard)
+	
+	pending[key] = (method, kwargs)
+
+
+def flush():
+	"""Enqueue the side effects collected in the committed transaction"""
+	pending = frappe.flags.pop("smspro_deferred", None) or {}
+	
+	for key, (method, kwargs) in pending.items():
+		# SET NX: skip keys already waiting in the queue
+		if not frappe.cache.set(get_pending_key(key), 1, nx=True, ex=PENDING_TTL):
+			continue
+		
+		frappe.enqueue(
+			"smspro.sms_pro.deferred.run",
+			queue="short",
+			key=key,
+			method=method,
+			kwargs=kwargs
+		)
+
+
+def discard():
+	frappe.flags.pop("smspro_deferred", None)
+
+
+def run(key, method, kwargs):
+	"""Background job entry point for a deferred side effect"""
+	# Clear the marker first so changes committed while we run enqueue again
+	frappe.cache.delete(get_pending_key(key))
+	frappe.get_attr(method)(**kwargs)
+
+
+def get_pending_key(key):
+	return frappe.cache.make_key(f"smspro:deferred:{key}")
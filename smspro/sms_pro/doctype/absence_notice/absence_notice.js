@@ -0,0 +1,8 @@
+// Copyright (c) 2024, Mr Linh Vu and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('Absence Notice', {
+	// refresh: function(frm) {
+
+	// }
+});
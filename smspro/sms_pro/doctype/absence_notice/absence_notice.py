@@ -0,0 +1,146 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import getdate, now_datetime
+
+from smspro.sms_pro.jobs import scheduled_job
+from smspro.sms_pro.notification_gateway import normalize_phone
+
+# Attendance statuses parents are told about
+NOTICE_STATUSES = ("Absent", "Late")
+
+
+class AbsenceNotice(Document):
+	pass
+
+
+def on_doctype_update():
+	# The digest job reads pending notices in date order
+	frappe.db.add_index("Absence Notice", ["notified", "attendance_date"])
+
+
+def buffer_attendance(attendance):
+	"""
+	Record or withdraw the pending notice for an attendance mark (Attendance on_update)
+	
+	Notices are keyed by the attendance, so re-marks update the one buffered
+	row and a correction to Present or Excused removes it before the digest
+	goes out. Notices already sent are left as they are.
+	"""
+	if attendance.status not in NOTICE_STATUSES:
+		remove_attendance(attendance)
+		return
+	
+	timestamp = now_datetime()
+	frappe.db.sql("""
+		INSERT INTO `tabAbsence Notice` (
+			name, creation, modified, owner, modified_by, docstatus,
+			attendance, student, student_name, batch, batch_name, attendance_date, status, notified
+		)
+		VALUES (%(name)s, %(timestamp)s, %(timestamp)s, %(user)s, %(user)s, 0,
+			%(name)s, %(student)s, %(student_name)s, %(batch)s, %(batch_name)s, %(attendance_date)s, %(status)s, 0)
+		ON DUPLICATE KEY UPDATE
+			status = IF(notified, status, VALUES(status)),
+			modified = IF(notified, modified, VALUES(modified))
+	""", {
+		"name": attendance.name,
+		"timestamp": timestamp,
+		"user": frappe.session.user,
+		"student": attendance.student,
+		"student_name": attendance.student_name,
+		"batch": attendance.batch,
+		"batch_name": attendance.batch_name,
+		"attendance_date": attendance.attendance_date,
+		"status": attendance.status
+	})
+
+
+def remove_attendance(attendance):
+	"""Drop the pending notice of an attendance mark (corrections and Attendance on_trash)"""
+	frappe.db.delete("Absence Notice", {"name": attendance.name, "notified": 0})
+
+
+@scheduled_job()
+def send_absence_digests():
+	"""
+	Send one absence digest per family for all pending notices (daily via scheduler)
+	
+	Siblings sharing a parent phone or email get a single digest. SMS goes
+	through the notification gateway under a per-family, per-day idempotency
+	key, email through the bulk mailer.
+	"""
+	from smspro.sms_pro.mailer import queue_emails
+	from smspro.sms_pro.notification_gateway import is_channel_enabled, send_notifications
+	
+	digest_date = getdate()
+	
+	notices = frappe.db.sql("""
+		SELECT
+			n.name, n.student, n.student_name, n.batch_name, n.attendance_date, n.status,
+			s.parent_name, s.parent_email, IFNULL(NULLIF(s.parent_phone, ''), s.phone_number) as phone
+		FROM `tabAbsence Notice` n
+		JOIN `tabStudent` s ON s.name = n.student
+		WHERE n.notified = 0
+		AND n.attendance_date <= %s
+		ORDER BY n.attendance_date, n.student_name
+	""", (digest_date,), as_dict=True)
+	
+	if not notices:
+		return
+	
+	families = {}
+	for notice in notices:
+		family = normalize_phone(notice.phone) or (notice.parent_email or "").lower() or notice.student
+		families.setdefault(family, []).append(notice)
+	
+	sms_enabled = is_channel_enabled("SMS")
+	emails = []
+	sms = []
+	for family, family_notices in families.items():
+		first = family_notices[0]
+		lines = [
+			f"- {notice.student_name}, {notice.batch_name}, {notice.attendance_date}: {notice.status}"
+			for notice in family_notices
+		]
+		
+		if first.parent_email:
+			emails.append({
+				"recipient": first.parent_email,
+				"sender": "Administrator",
+				"subject": f"Attendance Notice - {digest_date}",
+				"content": "\n".join([
+					f"Dear {first.parent_name or 'Parent'},",
+					"",
+					"The following absences and late arrivals were recorded:",
+					*lines,
+					"",
+					"Best regards,",
+					"SMS Pro Team"
+				])
+			})
+		
+		if sms_enabled and first.phone:
+			sms.append({
+				"channel": "SMS",
+				"recipient": first.phone,
+				"student": first.student,
+				"message": "SMS Pro: " + "; ".join(
+					f"{notice.student_name} {'vang' if notice.status == 'Absent' else 'di muon'} "
+					f"{notice.batch_name} {notice.attendance_date}"
+					for notice in family_notices
+				),
+				"idempotency_key": f"absence_digest:{family}:{digest_date}"
+			})
+	
+	queue_emails(emails)
+	if sms:
+		send_notifications(sms)
+	
+	frappe.db.sql("""
+		UPDATE `tabAbsence Notice`
+		SET notified = 1, notified_on = %(now)s
+		WHERE name IN %(names)s
+	""", {"now": now_datetime(), "names": tuple(notice.name for notice in notices)})
+	frappe.db.commit()
@@ -3,23 +3,17 @@
 
 import frappe
 from frappe.model.document import Document
+from frappe.utils import getdate, now_datetime, today
+
+from smspro.sms_pro.api.prepared_report import invalidate_prepared_reports
+from smspro.sms_pro.doctype.absence_notice.absence_notice import buffer_attendance, remove_attendance
+
+ATTENDANCE_STATUSES = ("Present", "Absent", "Late", "Excused")
 
 
 class Attendance(Document):
 	def validate(self):
-		# Check if attendance already exists for this student, batch, and date
-		existing_attendance = frappe.db.exists(
-			"Attendance",
-			{
-				"student": self.student,
-				"batch": self.batch,
-				"attendance_date": self.attendance_date,
-				"name": ["!=", self.name]
-			}
-		)
-		
-		if existing_attendance:
-			frappe.throw(f"Attendance already marked for this student on {self.attendance_date}")
+		# One mark per student, batch and date is enforced by a unique key (on_doctype_update)
 		
 		# Validate attendance date is not in the future
 		from datetime import date
@@ -56,6 +50,26 @@ class Attendance(Document):
 	def on_update(self):
 		# Update enrollment attendance statistics
 		self.update_enrollment_attendance()
+		
+		# Refresh the teacher roster for this class
+		self.clear_roster_cache()
+		
+		# Collect absences and late arrivals for the parents' daily digest
+		buffer_attendance(self)
+		
+		# Prepared report results built from attendance are stale after commit
+		invalidate_prepared_reports(self.doctype)
+	
+	def on_trash(self):
+		self.clear_roster_cache()
+		remove_attendance(self)
+		invalidate_prepared_reports(self.doctype)
+	
+	def clear_roster_cache(self):
+		"""Drop the cached roster of the batch teacher for this date"""
+		from smspro.sms_pro.api.roster import clear_batch_roster_cache
+		
+		clear_batch_roster_cache(self.batch, self.attendance_date)
 	
 	def update_enrollment_attendance(self):
 		"""Update attendance statistics for student enrollment"""
@@ -107,95 +121,211 @@ class Attendance(Document):
 		if not self.student or not self.batch:
 			return {}
 		
-		total_sessions = frappe.db.count(
-			"Attendance",
-			{
-				"student": self.student,
-				"batch": self.batch
-			}
-		)
-		
-		attended_sessions = frappe.db.count(
-			"Attendance",
-			{
-				"student": self.student,
-				"batch": self.batch,
-				"status": "Present"
-			}
-		)
-		
-		absent_sessions = frappe.db.count(
-			"Attendance",
-			{
-				"student": self.student,
-				"batch": self.batch,
-				"status": "Absent"
-			}
-		)
-		
-		late_sessions = frappe.db.count(
-			"Attendance",
-			{
-				"student": self.student,
-				"batch": self.batch,
-				"status": "Late"
-			}
-		)
-		
-		attendance_rate = (attended_sessions / total_sessions * 100) if total_sessions > 0 else 0
-		
-		return {
-			"total_sessions": total_sessions,
-			"attended_sessions": attended_sessions,
-			"absent_sessions": absent_sessions,
-			"late_sessions": late_sessions,
-			"attendance_rate": round(attendance_rate, 2)
-		}
+		return get_attendance_summary(self.student, self.batch)
 	
 	@frappe.whitelist()
 	def mark_batch_attendance(self, batch, attendance_date, attendance_list):
 		"""Mark attendance for multiple students in a batch"""
-		created_count = 0
-		updated_count = 0
-		
-		for student_data in attendance_list:
-			student = student_data.get("student")
-			status = student_data.get("status", "Present")
-			notes = student_data.get("notes", "")
-			
-			if not student:
-				continue
-			
-			# Check if attendance already exists
-			existing_attendance = frappe.db.exists(
-				"Attendance",
-				{
-					"student": student,
-					"batch": batch,
-					"attendance_date": attendance_date
-				}
-			)
-			
-			if existing_attendance:
-				# Update existing attendance
-				attendance = frappe.get_doc("Attendance", existing_attendance)
-				attendance.status = status
-				attendance.notes = notes
-				attendance.save()
-				updated_count += 1
-			else:
-				# Create new attendance
-				attendance = frappe.new_doc("Attendance")
-				attendance.student = student
-				attendance.batch = batch
-				attendance.attendance_date = attendance_date
-				attendance.status = status
-				attendance.notes = notes
-				attendance.insert()
-				created_count += 1
+		return upsert_attendance(batch, attendance_date, attendance_list)
+
+
+@frappe.whitelist()
+def mark_attendance(batch, attendance_date, attendance_list):
+	"""
+	Mark or re-mark the attendance of students in a batch for one date
+	
+	Args:
+		batch: Batch name
+		attendance_date: Date of the class
+		attendance_list: List of {"student", "status", "notes"} (list or JSON)
+	"""
+	try:
+		result = upsert_attendance(batch, attendance_date, attendance_list)
 		
 		return {
-			"created": created_count,
-			"updated": updated_count,
-			"total": created_count + updated_count
+			"status": "success",
+			**result
+		}
+	
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Mark Attendance Error")
+		return {
+			"status": "error",
+			"message": str(e)
 		}
+
+
+def upsert_attendance(batch, attendance_date, attendance_list):
+	"""
+	Write the attendance of a batch for one date in a single upsert
+	
+	New marks are inserted and existing ones get their status and notes
+	updated through the unique key on (student, batch, attendance_date), so
+	concurrent marking of the same student leaves one row. Only students with
+	an active enrollment in the batch are marked, the others are returned as
+	skipped. The Attendance on_update effects (absence notices, roster cache,
+	prepared reports) are applied to the written rows afterwards.
+	"""
+	from smspro.sms_pro.api.roster import clear_batch_roster_cache
+	
+	frappe.has_permission("Attendance", "create", throw=True)
+	
+	attendance_date = getdate(attendance_date)
+	if attendance_date > getdate(today()):
+		frappe.throw("Attendance date cannot be in the future")
+	
+	attendance_list = frappe.parse_json(attendance_list) if isinstance(attendance_list, str) else attendance_list
+	marks = {}
+	for row in attendance_list or []:
+		if not row.get("student"):
+			continue
+		
+		status = row.get("status") or "Present"
+		if status not in ATTENDANCE_STATUSES:
+			frappe.throw(f"Invalid attendance status {status}")
+		
+		# The last mark of a student in the list wins
+		marks[row["student"]] = (status, row.get("notes") or "")
+	
+	if not marks:
+		return {"created": 0, "updated": 0, "total": 0, "skipped": []}
+	
+	batch_info = frappe.db.get_value("Batch", batch, ["batch_name", "course", "class_time"], as_dict=True)
+	if not batch_info:
+		frappe.throw(f"Batch {batch} not found")
+	course_name = frappe.db.get_value("Course", batch_info.course, "course_name") if batch_info.course else None
+	
+	students = {row.name: row for row in frappe.db.sql("""
+		SELECT name, first_name, last_name
+		FROM `tabStudent`
+		WHERE name IN %s
+	""", [tuple(marks)], as_dict=True)}
+	
+	unknown = set(marks) - set(students)
+	if unknown:
+		frappe.throw(f"Students not found: {', '.join(sorted(unknown))}")
+	
+	# Students who left the batch are not marked in it any more
+	enrolled = set(frappe.db.sql_list("""
+		SELECT student
+		FROM `tabStudent Enrollment`
+		WHERE batch = %s
+		AND status = 'Active'
+		AND student IN %s
+	""", [batch, tuple(marks)]))
+	skipped = sorted(set(marks) - enrolled)
+	marks = {student: mark for student, mark in marks.items() if student in enrolled}
+	
+	if not marks:
+		return {"created": 0, "updated": 0, "total": 0, "skipped": skipped}
+	
+	names = {student: f"{student}-{batch}-{attendance_date}" for student in marks}
+	
+	# Rows moved to another batch by a transfer keep their old name, a mark
+	# inserted under it would update the moved row instead of adding one here
+	existing = frappe.db.sql("""
+		SELECT name, student, batch
+		FROM `tabAttendance`
+		WHERE (batch = %s AND attendance_date = %s AND student IN %s)
+		OR name IN %s
+	""", [batch, attendance_date, tuple(marks), tuple(names.values())], as_dict=True)
+	
+	marked = {row.student for row in existing if row.batch == batch}
+	taken = {row.name for row in existing if row.batch != batch}
+	for student, name in names.items():
+		if name in taken and student not in marked:
+			names[student] = f"{name}-{frappe.generate_hash(length=5)}"
+	
+	updated_count = len(marked)
+	created_count = len(marks) - updated_count
+	
+	timestamp = now_datetime()
+	user = frappe.session.user
+	values = []
+	for student, (status, notes) in marks.items():
+		info = students[student]
+		student_name = f"{info.first_name} {info.last_name}" if info.first_name and info.last_name else None
+		values.extend([
+			names[student], timestamp, timestamp, user, user,
+			student, student_name, batch, batch_info.batch_name, batch_info.course, course_name,
+			attendance_date, batch_info.class_time, status, notes
+		])
+	
+	frappe.db.sql(f"""
+		INSERT INTO `tabAttendance` (
+			name, creation, modified, owner, modified_by, docstatus,
+			student, student_name, batch, batch_name, course, course_name,
+			attendance_date, class_time, status, notes
+		)
+		VALUES {", ".join(["(%s, %s, %s, %s, %s, 0, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(marks))}
+		ON DUPLICATE KEY UPDATE
+			status = VALUES(status),
+			notes = VALUES(notes),
+			modified = VALUES(modified),
+			modified_by = VALUES(modified_by)
+	""", values)
+	
+	written = frappe.db.sql("""
+		SELECT name, student, student_name, batch, batch_name, attendance_date, status
+		FROM `tabAttendance`
+		WHERE batch = %s
+		AND attendance_date = %s
+		AND student IN %s
+	""", [batch, attendance_date, tuple(marks)], as_dict=True)
+	
+	for attendance in written:
+		buffer_attendance(attendance)
+	
+	clear_batch_roster_cache(batch, attendance_date)
+	invalidate_prepared_reports("Attendance")
+	
+	return {
+		"created": created_count,
+		"updated": updated_count,
+		"total": created_count + updated_count,
+		"skipped": skipped
+	}
+
+
+def get_attendance_summary(student, batch):
+	"""
+	Get attendance counts of a student in a batch
+	
+	Live rows are counted in one grouped query, rows already moved to the
+	archive are taken from the archive summary.
+	"""
+	from smspro.sms_pro.doctype.attendance_archive.attendance_archive import get_archived_counts
+	
+	counts = {row.status: row.count for row in frappe.db.sql("""
+		SELECT status, COUNT(*) as count
+		FROM `tabAttendance`
+		WHERE student = %s AND batch = %s
+		GROUP BY status
+	""", (student, batch), as_dict=True)}
+	archived = get_archived_counts(student, batch)
+	
+	total_sessions = sum(counts.values()) + (archived.total_sessions or 0)
+	attended_sessions = counts.get("Present", 0) + (archived.present_sessions or 0)
+	absent_sessions = counts.get("Absent", 0) + (archived.absent_sessions or 0)
+	late_sessions = counts.get("Late", 0) + (archived.late_sessions or 0)
+	
+	attendance_rate = (attended_sessions / total_sessions * 100) if total_sessions > 0 else 0
+	
+	return {
+		"total_sessions": total_sessions,
+		"attended_sessions": attended_sessions,
+		"absent_sessions": absent_sessions,
+		"late_sessions": late_sessions,
+		"attendance_rate": round(attendance_rate, 2)
+	}
+
+
+def on_doctype_update():
+	# Session attendance lookups read a batch's marks for one date, added on
+	# sites where the doctype is not reloaded by add_attendance_indexes
+	frappe.db.add_index("Attendance", ["batch", "attendance_date"])
+	
+	# One mark per student, batch and date, existing duplicates are removed by
+	# the dedupe_attendance patch and add_attendance_unique_key adds the key on
+	# sites where the doctype is not reloaded
+	frappe.db.add_unique("Attendance", ["student", "batch", "attendance_date"])
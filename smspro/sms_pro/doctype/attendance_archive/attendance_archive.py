@@ -0,0 +1,211 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, getdate, today
+
+from smspro.sms_pro.jobs import scheduled_job
+
+# Attendance of a completed batch is archived once the batch has ended this long ago
+ARCHIVE_AFTER_DAYS = 30
+
+# Rows moved per transaction
+ARCHIVE_CHUNK_SIZE = 5000
+
+# Batches archived between checkpoints of the daily job
+ARCHIVE_BATCHES_PER_CHUNK = 10
+
+# Columns copied from Attendance, the archive keeps the original names
+ARCHIVE_COLUMNS = (
+	"name", "creation", "modified", "modified_by", "owner", "docstatus", "idx",
+	"student", "student_name", "batch", "batch_name", "course", "course_name",
+	"attendance_date", "class_time", "status", "notes", "teacher_notes"
+)
+
+# Columns readers need from live and archived attendance alike
+SOURCE_COLUMNS = (
+	"name", "docstatus", "student", "student_name", "batch", "batch_name",
+	"course", "course_name", "attendance_date", "status"
+)
+
+ARCHIVED_UNTIL_KEY = "smspro:attendance_archived_until"
+
+
+class AttendanceArchive(Document):
+	def validate(self):
+		if not self.is_new():
+			frappe.throw("Archived attendance cannot be modified")
+
+
+def on_doctype_update():
+	# Archived rows are read back per batch and date, or per student in a batch
+	frappe.db.add_index("Attendance Archive", ["batch", "attendance_date"])
+	frappe.db.add_index("Attendance Archive", ["student", "batch"])
+
+
+@scheduled_job(chunk_size=ARCHIVE_BATCHES_PER_CHUNK)
+def archive_completed_batches(job):
+	"""Move attendance of completed batches into the archive (daily via scheduler)"""
+	for batches in job.chunks(get_batches_to_archive):
+		for batch in batches:
+			# A large batch can outlast the time budget, the next call carries on
+			# with the rows it has not moved yet
+			if not archive_batch_attendance(batch.name, is_out_of_time=job.is_out_of_time):
+				job.pause()
+				break
+
+
+def get_batches_to_archive(cursor, limit):
+	return frappe.db.sql("""
+		SELECT b.name
+		FROM `tabBatch` b
+		WHERE b.status = 'Completed'
+		AND b.end_date <= %(end_date)s
+		AND b.name > %(cursor)s
+		AND EXISTS (SELECT 1 FROM `tabAttendance` a WHERE a.batch = b.name)
+		ORDER BY b.name
+		LIMIT %(limit)s
+	""", {"end_date": add_days(today(), -ARCHIVE_AFTER_DAYS), "cursor": cursor or "", "limit": limit}, as_dict=True)
+
+
+def archive_batch_attendance(batch, chunk_size=ARCHIVE_CHUNK_SIZE, is_out_of_time=None):
+	"""
+	Move the attendance of a batch into the archive in chunks
+	
+	Each chunk is copied and deleted in its own transaction, so an interrupted
+	run picks up where it stopped. The per-enrollment summary is rebuilt once
+	the batch has been moved.
+	
+	Returns False when `is_out_of_time()` stopped it before the batch was moved.
+	"""
+	columns = ", ".join(f"`{column}`" for column in ARCHIVE_COLUMNS)
+	
+	# A row archived before under the same name is overwritten by the live one,
+	# so the delete below never drops a mark that was not copied
+	updates = ", ".join(
+		f"`{column}` = VALUES(`{column}`)" for column in (*ARCHIVE_COLUMNS[1:], "archived_on")
+	)
+	
+	while True:
+		if is_out_of_time and is_out_of_time():
+			frappe.cache.delete_value(ARCHIVED_UNTIL_KEY)
+			return False
+		
+		names = frappe.db.sql_list("""
+			SELECT name
+			FROM `tabAttendance`
+			WHERE batch = %s
+			ORDER BY attendance_date
+			LIMIT %s
+		""", (batch, chunk_size))
+		
+		if not names:
+			break
+		
+		values = {"names": tuple(names)}
+		frappe.db.sql(f"""
+			INSERT INTO `tabAttendance Archive` ({columns}, archived_on)
+			SELECT {columns}, NOW()
+			FROM `tabAttendance`
+			WHERE name IN %(names)s
+			ON DUPLICATE KEY UPDATE {updates}
+		""", values)
+		frappe.db.sql("DELETE FROM `tabAttendance` WHERE name IN %(names)s", values)
+		frappe.db.commit()
+	
+	update_archive_summary(batch)
+	frappe.db.commit()
+	
+	frappe.cache.delete_value(ARCHIVED_UNTIL_KEY)
+	
+	return True
+
+
+def update_archive_summary(batch):
+	"""Rebuild the per-enrollment attendance counts of a batch from its archived rows"""
+	frappe.db.delete("Attendance Archive Summary", {"batch": batch})
+	
+	frappe.db.sql("""
+		INSERT INTO `tabAttendance Archive Summary` (
+			name, creation, modified, owner, modified_by, docstatus,
+			student_enrollment, student, batch, course,
+			first_attendance_date, last_attendance_date,
+			total_sessions, present_sessions, absent_sessions, late_sessions, excused_sessions
+		)
+		SELECT
+			CONCAT(a.batch, '-', a.student), NOW(), NOW(), 'Administrator', 'Administrator', 0,
+			(
+				SELECT se.name
+				FROM `tabStudent Enrollment` se
+				WHERE se.student = a.student AND se.batch = a.batch
+				ORDER BY se.status = 'Cancelled', se.enrollment_date DESC
+				LIMIT 1
+			),
+			a.student, a.batch, MAX(a.course),
+			MIN(a.attendance_date), MAX(a.attendance_date),
+			COUNT(*),
+			SUM(CASE WHEN a.status = 'Present' THEN 1 ELSE 0 END),
+			SUM(CASE WHEN a.status = 'Absent' THEN 1 ELSE 0 END),
+			SUM(CASE WHEN a.status = 'Late' THEN 1 ELSE 0 END),
+			SUM(CASE WHEN a.status = 'Excused' THEN 1 ELSE 0 END)
+		FROM `tabAttendance Archive` a
+		WHERE a.batch = %s
+		AND a.docstatus != 2
+		GROUP BY a.student, a.batch
+	""", (batch,))
+
+
+def get_archived_until():
+	"""Get the latest archived attendance date, or None if nothing is archived"""
+	archived_until = frappe.cache.get_value(ARCHIVED_UNTIL_KEY)
+	
+	if archived_until is None:
+		archived_until = frappe.db.sql("SELECT MAX(attendance_date) FROM `tabAttendance Archive`")[0][0] or ""
+		frappe.cache.set_value(ARCHIVED_UNTIL_KEY, str(archived_until))
+	
+	return getdate(archived_until) if archived_until else None
+
+
+def needs_archive(from_date=None, batch=None):
+	"""Check whether a read starting at `from_date` (for one batch) can reach archived rows"""
+	archived_until = get_archived_until()
+	
+	if not archived_until:
+		return False
+	if from_date and getdate(from_date) > archived_until:
+		return False
+	if batch and not frappe.db.exists("Attendance Archive", {"batch": batch}):
+		return False
+	
+	return True
+
+
+def get_attendance_source(from_date=None, batch=None):
+	"""
+	Get the table expression to read attendance from
+	
+	Live attendance alone unless the date range or batch reaches archived rows,
+	in which case both tiers are combined with UNION ALL.
+	"""
+	if not needs_archive(from_date, batch):
+		return "`tabAttendance`"
+	
+	columns = ", ".join(SOURCE_COLUMNS)
+	return f"""(
+		SELECT {columns} FROM `tabAttendance`
+		UNION ALL
+		SELECT {columns} FROM `tabAttendance Archive`
+	)"""
+
+
+def get_archived_counts(student, batch):
+	"""Get the archived attendance counts of a student in a batch"""
+	counts = frappe.db.get_value(
+		"Attendance Archive Summary",
+		{"student": student, "batch": batch},
+		["total_sessions", "present_sessions", "absent_sessions", "late_sessions", "excused_sessions"],
+		as_dict=True
+	)
+	
+	return counts or frappe._dict()
@@ -0,0 +1,14 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class AttendanceArchiveSummary(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_unique("Attendance Archive Summary", ["student", "batch"])
+	frappe.db.add_index("Attendance Archive Summary", ["batch"])
@@ -3,6 +3,32 @@
 
 import frappe
 from frappe.model.document import Document
+from frappe.utils import add_days, add_months, getdate, today
+
+from smspro.sms_pro.columnar import to_columnar
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Fields that change the generated Class Session rows
+SCHEDULE_FIELDS = ("batch_name", "course", "teacher", "classroom", "start_date", "end_date",
+	"class_time", "days_of_week", "status")
+
+# Open-ended batches without a course duration get sessions for this many months
+DEFAULT_SCHEDULE_MONTHS = 6
+
+
+def parse_days_of_week(days_of_week):
+	"""Return the sorted weekday numbers (Monday = 0) of a days_of_week value"""
+	if not days_of_week:
+		return []
+	
+	days = set()
+	for day in days_of_week.replace("\n", ",").split(","):
+		day = day.strip().capitalize()
+		if day in WEEKDAYS:
+			days.add(WEEKDAYS.index(day))
+	
+	return sorted(days)
 
 
 class Batch(Document):
@@ -22,6 +48,26 @@ class Batch(Document):
 		# Auto-generate batch name if not provided
 		if not self.batch_name and self.course:
 			self.batch_name = self.generate_batch_name()
+		
+		# Validate classroom and teacher are not double booked
+		self.validate_schedule_conflicts()
+	
+	def validate_schedule_conflicts(self):
+		"""Check the classroom and teacher are free at the batch's class time"""
+		from smspro.sms_pro.api.timetable import get_batch_conflicts
+		
+		conflicts = get_batch_conflicts(self)
+		if not conflicts:
+			return
+		
+		messages = []
+		for conflict in conflicts:
+			if conflict.resource == "classroom":
+				messages.append(f"Classroom {conflict.value} is already booked by {conflict.conflicting_batch_name} on {conflict.weekday}")
+			else:
+				messages.append(f"Teacher {conflict.value} is already teaching {conflict.conflicting_batch_name} on {conflict.weekday}")
+		
+		frappe.throw("<br>".join(messages), title="Schedule Conflict")
 	
 	def generate_batch_name(self):
 		"""Generate batch name from course and date"""
@@ -34,9 +80,62 @@ class Batch(Document):
 		
 		return f"{course_name} - {start_month} {start_year}"
 	
+	def get_schedule_end_date(self):
+		"""Get the last day sessions are generated for"""
+		if self.end_date:
+			return getdate(self.end_date)
+		
+		duration = frappe.get_value("Course", self.course, "duration_months") if self.course else None
+		return add_days(add_months(getdate(self.start_date), duration or DEFAULT_SCHEDULE_MONTHS), -1)
+	
+	def get_schedule_dates(self):
+		"""Get every date this batch meets on"""
+		weekdays = parse_days_of_week(self.days_of_week)
+		if not self.start_date or not weekdays:
+			return []
+		
+		current = getdate(self.start_date)
+		end = self.get_schedule_end_date()
+		dates = []
+		
+		while current <= end:
+			if current.weekday() in weekdays:
+				dates.append(current)
+			current = add_days(current, 1)
+		
+		return dates
+	
 	def on_update(self):
 		# Update current enrollment count
 		self.update_enrollment_count()
+		
+		# Regenerate class sessions when the schedule changes
+		if any(self.has_value_changed(field) for field in SCHEDULE_FIELDS):
+			self.sync_class_sessions()
+			self.clear_roster_cache()
+	
+	def on_trash(self):
+		from smspro.sms_pro.doctype.class_session.class_session import delete_batch_sessions
+		
+		delete_batch_sessions(self.name)
+		self.clear_roster_cache()
+	
+	def clear_roster_cache(self):
+		"""Drop cached rosters of the current and previous teacher"""
+		from smspro.sms_pro.api.roster import clear_teacher_roster_cache
+		
+		clear_teacher_roster_cache(self.teacher)
+		
+		previous = self.get_doc_before_save()
+		if previous and previous.teacher != self.teacher:
+			clear_teacher_roster_cache(previous.teacher)
+	
+	@frappe.whitelist()
+	def sync_class_sessions(self):
+		"""Generate Class Session rows from the batch schedule"""
+		from smspro.sms_pro.doctype.class_session.class_session import sync_batch_sessions
+		
+		return sync_batch_sessions(self)
 	
 	def update_enrollment_count(self):
 		"""Update the current enrollment count"""
@@ -50,23 +149,41 @@ class Batch(Document):
 		self.current_enrollment = count
 	
 	@frappe.whitelist()
-	def get_enrollments(self):
-		"""Get all enrollments for this batch"""
+	def get_enrollments(self, format=None):
+		"""
+		Get all enrollments for this batch
+		
+		Pass format="columnar" for column arrays plus a schema.
+		"""
 		enrollments = frappe.get_all(
 			"Student Enrollment",
 			filters={"batch": self.name},
 			fields=["name", "student", "student_name", "enrollment_date", "status"]
 		)
+		
+		if format == "columnar":
+			return to_columnar(enrollments)
+		
 		return enrollments
 	
 	@frappe.whitelist()
 	def get_attendance_summary(self):
 		"""Get attendance summary for this batch"""
-		# This will be implemented when Attendance DocType is created
+		from smspro.sms_pro.api.schedule import get_session_attendance
+		
+		sessions = get_session_attendance(batch=self.name, to_date=today())
+		
+		expected = sum(s.expected for s in sessions)
+		recorded = sum(s.recorded for s in sessions)
+		attended = sum(s.attended for s in sessions)
+		
 		return {
-			"total_sessions": 0,
-			"attended_sessions": 0,
-			"attendance_rate": 0
+			"total_sessions": len(sessions),
+			"expected_attendance": expected,
+			"recorded_attendance": recorded,
+			"attended_sessions": attended,
+			"recording_rate": round(recorded / expected * 100, 2) if expected else 0,
+			"attendance_rate": round(attended / expected * 100, 2) if expected else 0
 		}
 	
 	@frappe.whitelist()
@@ -82,3 +199,10 @@ class Batch(Document):
 	def is_full(self):
 		"""Check if batch is full"""
 		return self.get_available_slots() == 0
+
+
+def on_doctype_update():
+	# Conflict checks look up batches sharing a teacher or classroom, added on
+	# sites where the doctype is not reloaded by add_batch_conflict_indexes
+	frappe.db.add_index("Batch", ["teacher", "start_date"])
+	frappe.db.add_index("Batch", ["classroom", "start_date"])
@@ -0,0 +1,119 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from smspro.sms_pro.api.timetable import find_timetable_conflicts
+
+TEST_COURSE = "_TEST-CONFLICT"
+
+
+def make_batch_row(name, class_time, days_of_week="Monday", teacher=None, classroom=None, hours=2):
+	return frappe._dict({
+		"name": name,
+		"batch_name": name,
+		"teacher": teacher,
+		"classroom": classroom,
+		"start_date": "2024-01-01",
+		"end_date": "2024-06-30",
+		"class_time": class_time,
+		"days_of_week": days_of_week,
+		"hours_per_session": hours
+	})
+
+
+class TestTimetableSweep(FrappeTestCase):
+	def test_overlapping_classroom(self):
+		conflicts = find_timetable_conflicts([
+			make_batch_row("A", "18:00:00", classroom="R1"),
+			make_batch_row("B", "19:00:00", classroom="R1")
+		])
+		
+		self.assertEqual(len(conflicts), 1)
+		self.assertEqual(conflicts[0].resource, "classroom")
+		self.assertEqual(conflicts[0].value, "R1")
+		self.assertEqual(conflicts[0].weekday, "Monday")
+		self.assertEqual({conflicts[0].batch, conflicts[0].conflicting_batch}, {"A", "B"})
+	
+	def test_overlapping_teacher(self):
+		conflicts = find_timetable_conflicts([
+			make_batch_row("A", "18:00:00", teacher="t@example.com", classroom="R1"),
+			make_batch_row("B", "18:30:00", teacher="t@example.com", classroom="R2")
+		])
+		
+		self.assertEqual([c.resource for c in conflicts], ["teacher"])
+	
+	def test_back_to_back_is_not_a_conflict(self):
+		conflicts = find_timetable_conflicts([
+			make_batch_row("A", "18:00:00", teacher="t@example.com", classroom="R1"),
+			make_batch_row("B", "20:00:00", teacher="t@example.com", classroom="R1")
+		])
+		
+		self.assertEqual(conflicts, [])
+	
+	def test_different_days_are_not_a_conflict(self):
+		conflicts = find_timetable_conflicts([
+			make_batch_row("A", "18:00:00", "Monday, Wednesday", classroom="R1"),
+			make_batch_row("B", "18:00:00", "Tuesday, Thursday", classroom="R1")
+		])
+		
+		self.assertEqual(conflicts, [])
+	
+	def test_non_overlapping_dates_are_not_a_conflict(self):
+		later = make_batch_row("B", "18:00:00", classroom="R1")
+		later.update({"start_date": "2024-07-01", "end_date": None})
+		
+		conflicts = find_timetable_conflicts([make_batch_row("A", "18:00:00", classroom="R1"), later])
+		
+		self.assertEqual(conflicts, [])
+
+
+class TestBatch(FrappeTestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		
+		if not frappe.db.exists("Course", TEST_COURSE):
+			frappe.get_doc({
+				"doctype": "Course",
+				"course_code": TEST_COURSE,
+				"course_name": "Conflict Test Course",
+				"course_fee": 1000000,
+				"hours_per_session": 2
+			}).insert()
+	
+	def make_batch(self, class_time, days_of_week="Monday", teacher=None, classroom=None):
+		return frappe.get_doc({
+			"doctype": "Batch",
+			"batch_name": frappe.generate_hash(length=8),
+			"course": TEST_COURSE,
+			"teacher": teacher,
+			"classroom": classroom,
+			"start_date": "2024-01-01",
+			"end_date": "2024-03-31",
+			"class_time": class_time,
+			"days_of_week": days_of_week,
+			"capacity": 20,
+			"status": "Planning"
+		})
+	
+	def test_overlapping_classroom_is_rejected(self):
+		self.make_batch("18:00:00", classroom="_Test Room 1").insert()
+		
+		with self.assertRaises(frappe.ValidationError):
+			self.make_batch("19:00:00", classroom="_Test Room 1").insert()
+	
+	def test_overlapping_teacher_is_rejected(self):
+		self.make_batch("08:00:00", teacher="Administrator", classroom="_Test Room 2").insert()
+		
+		with self.assertRaises(frappe.ValidationError):
+			self.make_batch("09:00:00", teacher="Administrator", classroom="_Test Room 3").insert()
+	
+	def test_back_to_back_is_allowed(self):
+		self.make_batch("13:00:00", "Friday", classroom="_Test Room 4").insert()
+		self.make_batch("15:00:00", "Friday", classroom="_Test Room 4").insert()
+	
+	def test_different_days_are_allowed(self):
+		self.make_batch("10:00:00", "Saturday", classroom="_Test Room 5").insert()
+		self.make_batch("10:00:00", "Sunday", classroom="_Test Room 5").insert()
@@ -0,0 +1,17 @@
+// Copyright (c) 2024, Mr Linh Vu and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('Class Session', {
+	refresh: function(frm) {
+		// Add custom buttons
+		if (frm.doc.batch) {
+			frm.add_custom_button(__('View Attendance'), function() {
+				frappe.route_options = {
+					"batch": frm.doc.batch,
+					"attendance_date": frm.doc.session_date
+				};
+				frappe.set_route("List", "Attendance");
+			}, __("Attendance"));
+		}
+	}
+});
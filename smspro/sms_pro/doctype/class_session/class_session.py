@@ -0,0 +1,99 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+from datetime import timedelta
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import getdate, now, to_timedelta, today
+
+# Session length used when the course does not define hours_per_session
+DEFAULT_SESSION_HOURS = 1.5
+
+
+class ClassSession(Document):
+	def validate(self):
+		# Sessions are generated from the batch schedule, copy the batch details
+		if self.batch and not self.teacher:
+			batch = frappe.get_doc("Batch", self.batch)
+			self.batch_name = batch.batch_name
+			self.course = batch.course
+			self.teacher = batch.teacher
+			self.classroom = batch.classroom
+			self.start_time, self.end_time = get_session_times(batch)
+
+
+def on_doctype_update():
+	# Calendar and today's-classes lookups are range reads on these keys
+	frappe.db.add_index("Class Session", ["session_date", "teacher"])
+	frappe.db.add_index("Class Session", ["session_date", "classroom"])
+	frappe.db.add_index("Class Session", ["batch", "session_date"])
+
+
+def get_session_times(batch):
+	"""Return (start_time, end_time) of a batch's sessions"""
+	if not batch.class_time:
+		return None, None
+	
+	hours = frappe.get_value("Course", batch.course, "hours_per_session") if batch.course else None
+	start_time = to_timedelta(batch.class_time)
+	end_time = start_time + timedelta(hours=hours or DEFAULT_SESSION_HOURS)
+	
+	return start_time, end_time
+
+
+def sync_batch_sessions(batch):
+	"""Bring the Class Session rows of a batch in line with its schedule"""
+	existing = {
+		getdate(d)
+		for d in frappe.get_all("Class Session", filters={"batch": batch.name}, pluck="session_date")
+	}
+	
+	if batch.status == "Cancelled":
+		# Keep the sessions that already took place, drop the rest
+		wanted = {d for d in existing if d < getdate(today())}
+	else:
+		wanted = set(batch.get_schedule_dates())
+	
+	stale = existing - wanted
+	if stale:
+		frappe.db.delete("Class Session", {"batch": batch.name, "session_date": ["in", sorted(stale)]})
+	
+	start_time, end_time = get_session_times(batch)
+	timestamp = now()
+	
+	# Refresh the rows we keep in a single statement
+	if existing - stale:
+		frappe.db.sql("""
+			UPDATE `tabClass Session`
+			SET batch_name = %s, course = %s, teacher = %s, classroom = %s,
+				start_time = %s, end_time = %s, modified = %s
+			WHERE batch = %s
+		""", (batch.batch_name, batch.course, batch.teacher, batch.classroom,
+			start_time, end_time, timestamp, batch.name))
+	
+	missing = sorted(wanted - existing)
+	if missing:
+		user = frappe.session.user
+		frappe.db.bulk_insert(
+			"Class Session",
+			fields=["name", "creation", "modified", "owner", "modified_by", "batch", "batch_name",
+					"course", "teacher", "classroom", "session_date", "start_time", "end_time", "status"],
+			values=[
+				(f"{batch.name}-{session_date}", timestamp, timestamp, user, user, batch.name,
+				 batch.batch_name, batch.course, batch.teacher, batch.classroom, session_date,
+				 start_time, end_time, "Scheduled")
+				for session_date in missing
+			]
+		)
+	
+	return {
+		"created": len(missing),
+		"deleted": len(stale),
+		"total": len(wanted)
+	}
+
+
+def delete_batch_sessions(batch_name):
+	"""Remove every session generated for a batch"""
+	frappe.db.delete("Class Session", {"batch": batch_name})
@@ -0,0 +1,14 @@
+// Copyright (c) 2024, Mr Linh Vu and contributors
+// For license information, please see license.txt
+
+frappe.views.calendar["Class Session"] = {
+	field_map: {
+		start: "start",
+		end: "end",
+		id: "name",
+		title: "title",
+		allDay: "all_day"
+	},
+	filters: ["batch", "teacher", "classroom"],
+	get_events_method: "smspro.sms_pro.api.schedule.get_calendar_events"
+};
@@ -4,6 +4,8 @@
 import frappe
 from frappe.model.document import Document
 
+from smspro.sms_pro.columnar import to_columnar
+
 
 class Course(Document):
 	def validate(self):
@@ -43,13 +45,21 @@ class Course(Document):
 			self.course_name = f"Course {self.course_code}"
 	
 	@frappe.whitelist()
-	def get_enrollments(self):
-		"""Get all enrollments for this course"""
+	def get_enrollments(self, format=None):
+		"""
+		Get all enrollments for this course
+		
+		Pass format="columnar" for column arrays plus a schema.
+		"""
 		enrollments = frappe.get_all(
 			"Student Enrollment",
 			filters={"course": self.name},
 			fields=["name", "student", "batch", "enrollment_date", "status"]
 		)
+		
+		if format == "columnar":
+			return to_columnar(enrollments)
+		
 		return enrollments
 	
 	@frappe.whitelist()
@@ -5,6 +5,10 @@ import frappe
 from frappe.model.document import Document
 from datetime import datetime, timedelta
 
+from smspro.sms_pro.api.prepared_report import invalidate_prepared_reports
+from smspro.sms_pro.deferred import defer
+from smspro.sms_pro.mailer import queue_emails
+
 
 class FeeInvoice(Document):
 	def validate(self):
@@ -71,11 +75,12 @@ class FeeInvoice(Document):
 				self.status = "Submitted"
 	
 	def on_update(self):
-		# Update enrollment details
-		self.update_enrollment_details()
-		
-		# Update payment tracking
-		self.update_payment_tracking()
+		# Update enrollment details and payment tracking after commit
+		defer(
+			"smspro.sms_pro.doctype.fee_invoice.fee_invoice.refresh_invoice",
+			f"fee_invoice_refresh:{self.name}",
+			invoice=self.name
+		)
 	
 	def update_enrollment_details(self):
 		"""Update student, course, and batch details from enrollment"""
@@ -100,19 +105,14 @@ class FeeInvoice(Document):
 	
 	def update_payment_tracking(self):
 		"""Update payment tracking information"""
+		from smspro.sms_pro.doctype.sms_payment_ledger.sms_payment_ledger import get_payment_totals
+		
 		# Get latest payment date
-		latest_payment = frappe.db.sql("""
-			SELECT MAX(pe.posting_date) as last_payment_date,
-				   SUM(pe.paid_amount) as total_paid
-			FROM `tabPayment Entry` pe
-			WHERE pe.reference_doctype = 'Fee Invoice'
-			AND pe.reference_name = %s
-			AND pe.docstatus = 1
-		""", (self.name,), as_dict=True)
-		
-		if latest_payment and latest_payment[0].last_payment_date:
-			self.last_payment_date = latest_payment[0].last_payment_date
-			self.paid_amount = latest_payment[0].total_paid or 0
+		latest_payment = get_payment_totals(fee_invoice=self.name)
+		
+		if latest_payment.last_payment_date:
+			self.last_payment_date = latest_payment.last_payment_date
+			self.paid_amount = latest_payment.total_paid or 0
 		
 		# Recalculate outstanding amount
 		self.outstanding_amount = max(0, self.total_amount - (self.paid_amount or 0))
@@ -120,17 +120,9 @@ class FeeInvoice(Document):
 	@frappe.whitelist()
 	def get_payment_history(self):
 		"""Get payment history for this invoice"""
-		payments = frappe.get_all(
-			"Payment Entry",
-			filters={
-				"reference_name": self.name,
-				"reference_doctype": "Fee Invoice",
-				"docstatus": 1
-			},
-			fields=["name", "posting_date", "paid_amount", "reference_no", "mode_of_payment"],
-			order_by="posting_date desc"
-		)
-		return payments
+		from smspro.sms_pro.doctype.sms_payment_ledger.sms_payment_ledger import get_payment_history
+		
+		return get_payment_history(fee_invoice=self.name)
 	
 	@frappe.whitelist()
 	def send_reminder(self):
@@ -142,15 +134,13 @@ class FeeInvoice(Document):
 		if not student_email:
 			frappe.throw("Student email not found")
 		
-		# Create communication
-		communication = frappe.new_doc("Communication")
-		communication.communication_type = "Communication"
-		communication.communication_medium = "Email"
-		communication.subject = f"Payment Reminder - Invoice {self.name}"
-		communication.sent_or_received = "Sent"
-		communication.sender = frappe.session.user
-		communication.recipients = student_email
-		communication.content = f"""
+		queue_emails([{
+			"recipient": student_email,
+			"sender": frappe.session.user,
+			"subject": f"Payment Reminder - Invoice {self.name}",
+			"reference_doctype": "Fee Invoice",
+			"reference_name": self.name,
+			"content": f"""
 		Dear Student,
 		
 		This is a reminder that payment for invoice {self.name} is due.
@@ -165,10 +155,9 @@ class FeeInvoice(Document):
 		
 		Thank you.
 		"""
-		communication.insert()
-		communication.send()
+		}], queue="short")
 		
-		frappe.msgprint(f"Payment reminder sent to {student_email}")
+		frappe.msgprint(f"Payment reminder queued for {student_email}")
 	
 	@frappe.whitelist()
 	def mark_as_paid(self):
@@ -184,3 +173,48 @@ class FeeInvoice(Document):
 		self.save()
 		
 		frappe.msgprint("Invoice marked as paid")
+
+
+def refresh_invoice(invoice):
+	"""Deferred: copy enrollment details and payment totals onto an invoice"""
+	if not frappe.db.exists("Fee Invoice", invoice):
+		return
+	
+	doc = frappe.get_doc("Fee Invoice", invoice)
+	
+	# Update enrollment details
+	doc.update_enrollment_details()
+	
+	# Update payment tracking
+	doc.update_payment_tracking()
+	
+	# Recompute totals and statuses from the refreshed fees and payments
+	doc.calculate_amounts()
+	doc.update_payment_status()
+	if doc.status != "Cancelled":
+		doc.update_status()
+	
+	frappe.db.set_value(
+		"Fee Invoice",
+		invoice,
+		{
+			"student": doc.student,
+			"student_name": doc.student_name,
+			"course": doc.course,
+			"course_name": doc.course_name,
+			"batch": doc.batch,
+			"batch_name": doc.batch_name,
+			"course_fee": doc.course_fee,
+			"discount_amount": doc.discount_amount,
+			"total_amount": doc.total_amount,
+			"paid_amount": doc.paid_amount,
+			"outstanding_amount": doc.outstanding_amount,
+			"payment_status": doc.payment_status,
+			"status": doc.status,
+			"last_payment_date": doc.last_payment_date
+		},
+		update_modified=False
+	)
+	
+	# set_value skips on_update
+	invalidate_prepared_reports("Fee Invoice")
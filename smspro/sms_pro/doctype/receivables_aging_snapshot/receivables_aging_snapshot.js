@@ -0,0 +1,13 @@
+// Copyright (c) 2024, Mr Linh Vu and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('Receivables Aging Snapshot', {
+	refresh: function(frm) {
+		// Snapshots are rebuilt nightly, open the aging report from here
+		frm.add_custom_button(__('Receivables Aging'), function() {
+			frappe.set_route("query-report", "Receivables Aging", {
+				"snapshot_date": frm.doc.snapshot_date
+			});
+		}, __("View"));
+	}
+});
@@ -0,0 +1,77 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, getdate, today
+
+from smspro.sms_pro.jobs import scheduled_job
+
+# Daily snapshots kept for week-over-week and month-over-month comparison
+SNAPSHOT_RETENTION_DAYS = 120
+
+
+class ReceivablesAgingSnapshot(Document):
+	pass
+
+
+def on_doctype_update():
+	# The aging report reads one snapshot date grouped by course, batch or student
+	frappe.db.add_index("Receivables Aging Snapshot", ["snapshot_date", "course"])
+	frappe.db.add_index("Receivables Aging Snapshot", ["snapshot_date", "batch"])
+	frappe.db.add_index("Receivables Aging Snapshot", ["snapshot_date", "student"])
+
+
+@scheduled_job()
+def rebuild_aging_snapshot(snapshot_date=None):
+	"""
+	Rebuild the receivables aging snapshot for a date (daily via scheduler)
+	
+	Outstanding invoices are bucketed by days past due_date in one
+	INSERT ... SELECT, independent of the stored invoice status.
+	"""
+	snapshot_date = getdate(snapshot_date or today())
+	
+	frappe.db.delete("Receivables Aging Snapshot", {"snapshot_date": snapshot_date})
+	
+	frappe.db.sql("""
+		INSERT INTO `tabReceivables Aging Snapshot` (
+			creation, modified, owner, modified_by, docstatus,
+			snapshot_date, fee_invoice, due_date, days_overdue, aging_bucket, outstanding_amount,
+			student, student_name, course, course_name, batch, batch_name
+		)
+		SELECT
+			NOW(), NOW(), 'Administrator', 'Administrator', 0,
+			%(snapshot_date)s,
+			fi.name,
+			fi.due_date,
+			GREATEST(DATEDIFF(%(snapshot_date)s, fi.due_date), 0),
+			CASE
+				WHEN fi.due_date IS NULL OR fi.due_date >= %(snapshot_date)s THEN 'Not Due'
+				WHEN DATEDIFF(%(snapshot_date)s, fi.due_date) <= 30 THEN '0-30'
+				WHEN DATEDIFF(%(snapshot_date)s, fi.due_date) <= 60 THEN '31-60'
+				WHEN DATEDIFF(%(snapshot_date)s, fi.due_date) <= 90 THEN '61-90'
+				ELSE '90+'
+			END,
+			fi.outstanding_amount,
+			fi.student, fi.student_name, fi.course, fi.course_name, fi.batch, fi.batch_name
+		FROM `tabFee Invoice` fi
+		WHERE fi.outstanding_amount > 0
+		AND fi.status NOT IN ('Cancelled', 'Paid')
+		AND (fi.invoice_date IS NULL OR fi.invoice_date <= %(snapshot_date)s)
+	""", {"snapshot_date": snapshot_date})
+	
+	# Drop snapshots past the retention window
+	frappe.db.delete(
+		"Receivables Aging Snapshot",
+		{"snapshot_date": ["<", add_days(snapshot_date, -SNAPSHOT_RETENTION_DAYS)]}
+	)
+
+
+def get_snapshot_date(on_or_before=None):
+	"""Get the latest snapshot date on or before a date"""
+	return frappe.db.sql("""
+		SELECT MAX(snapshot_date)
+		FROM `tabReceivables Aging Snapshot`
+		WHERE snapshot_date <= %s
+	""", (getdate(on_or_before or today()),))[0][0]
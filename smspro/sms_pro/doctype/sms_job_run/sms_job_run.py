@@ -0,0 +1,14 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class SMSJobRun(Document):
+	pass
+
+
+def on_doctype_update():
+	# Run history is read per job, newest first
+	frappe.db.add_index("SMS Job Run", ["job_name", "creation"])
@@ -0,0 +1,15 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class SMSKPISnapshot(Document):
+	pass
+
+
+def on_doctype_update():
+	# One row per resolution and date, trend charts read date ranges
+	frappe.db.add_unique("SMS KPI Snapshot", ["resolution", "snapshot_date"])
+	frappe.db.add_index("SMS KPI Snapshot", ["snapshot_date", "resolution"])
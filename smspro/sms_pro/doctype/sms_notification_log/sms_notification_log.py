@@ -0,0 +1,15 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class SMSNotificationLog(Document):
+	pass
+
+
+def on_doctype_update():
+	# Retries pick up unsent messages oldest first, history is read per reference
+	frappe.db.add_index("SMS Notification Log", ["status", "creation"])
+	frappe.db.add_index("SMS Notification Log", ["reference_doctype", "reference_name"])
@@ -0,0 +1,9 @@
+// Copyright (c) 2024, Mr Linh Vu and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('SMS Payment Ledger', {
+	refresh: function(frm) {
+		// Ledger entries are append-only
+		frm.disable_save();
+	}
+});
@@ -0,0 +1,199 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import flt, getdate, today
+
+from smspro.sms_pro.api.prepared_report import invalidate_prepared_reports
+
+# Payment Entry references that are recorded in the ledger
+LEDGER_REFERENCE_DOCTYPES = ("Fee Invoice", "Student Enrollment")
+
+
+class SMSPaymentLedger(Document):
+	def validate(self):
+		# The ledger is append-only, cancellations are recorded as reversal rows
+		if not self.is_new():
+			frappe.throw("Payment ledger entries cannot be modified")
+	
+	def on_update(self):
+		invalidate_prepared_reports(self.doctype)
+	
+	def on_trash(self):
+		frappe.throw("Payment ledger entries cannot be deleted")
+
+
+def on_doctype_update():
+	# History, totals and statements are range reads on these keys
+	frappe.db.add_index("SMS Payment Ledger", ["fee_invoice", "posting_date"])
+	frappe.db.add_index("SMS Payment Ledger", ["student_enrollment", "posting_date"])
+	frappe.db.add_index("SMS Payment Ledger", ["student", "posting_date"])
+
+
+def make_ledger_entries(doc, method=None):
+	"""Record a submitted Payment Entry in the ledger (Payment Entry on_submit)"""
+	rows = get_ledger_rows(doc)
+	
+	for row in rows:
+		add_ledger_entry(row)
+	
+	update_referenced_invoices(rows)
+
+
+def reverse_ledger_entries(doc, method=None):
+	"""Record reversal rows for a cancelled Payment Entry (Payment Entry on_cancel)"""
+	entries = frappe.get_all(
+		"SMS Payment Ledger",
+		filters={"payment_entry": doc.name},
+		fields=["fee_invoice", "student_enrollment", "student", "amount", "mode_of_payment", "reference_no"]
+	)
+	
+	# Net out what is still recorded for each reference
+	net = {}
+	for entry in entries:
+		key = (entry.fee_invoice, entry.student_enrollment, entry.student)
+		if key not in net:
+			net[key] = entry.copy()
+			net[key].amount = 0
+		net[key].amount += flt(entry.amount)
+	
+	rows = []
+	for row in net.values():
+		if not row.amount:
+			continue
+		
+		row.update({
+			"entry_type": "Reversal",
+			"payment_entry": doc.name,
+			"posting_date": getdate(today()),
+			"amount": -row.amount
+		})
+		add_ledger_entry(row)
+		rows.append(row)
+	
+	update_referenced_invoices(rows)
+
+
+def add_ledger_entry(row):
+	entry = frappe.new_doc("SMS Payment Ledger")
+	entry.update(row)
+	entry.insert(ignore_permissions=True)
+	return entry
+
+
+def get_ledger_rows(doc):
+	"""Build ledger rows from the Fee Invoice and Student Enrollment references of a Payment Entry"""
+	references = [
+		ref for ref in doc.get("references") or []
+		if ref.reference_doctype in LEDGER_REFERENCE_DOCTYPES and ref.reference_name
+	]
+	if not references:
+		return []
+	
+	invoice_names = [ref.reference_name for ref in references if ref.reference_doctype == "Fee Invoice"]
+	invoices = {}
+	if invoice_names:
+		invoices = {
+			inv.name: inv
+			for inv in frappe.get_all(
+				"Fee Invoice",
+				filters={"name": ["in", invoice_names]},
+				fields=["name", "student_enrollment", "student"]
+			)
+		}
+	
+	enrollment_names = [ref.reference_name for ref in references if ref.reference_doctype == "Student Enrollment"]
+	enrollments = {}
+	if enrollment_names:
+		enrollments = {
+			se.name: se
+			for se in frappe.get_all(
+				"Student Enrollment",
+				filters={"name": ["in", enrollment_names]},
+				fields=["name", "student"]
+			)
+		}
+	
+	rows = []
+	for ref in references:
+		amount = flt(ref.allocated_amount) or flt(doc.paid_amount)
+		if ref.reference_doctype == "Fee Invoice":
+			invoice = invoices.get(ref.reference_name) or frappe._dict()
+			fee_invoice, student_enrollment, student = ref.reference_name, invoice.student_enrollment, invoice.student
+		else:
+			enrollment = enrollments.get(ref.reference_name) or frappe._dict()
+			fee_invoice, student_enrollment, student = None, ref.reference_name, enrollment.student
+		
+		rows.append(frappe._dict({
+			"entry_type": "Payment",
+			"payment_entry": doc.name,
+			"posting_date": getdate(doc.posting_date),
+			"amount": amount,
+			"mode_of_payment": doc.get("mode_of_payment"),
+			"reference_no": doc.get("reference_no"),
+			"fee_invoice": fee_invoice,
+			"student_enrollment": student_enrollment,
+			"student": student or (doc.party if doc.get("party_type") == "Student" else None)
+		}))
+	
+	return rows
+
+
+def update_referenced_invoices(rows):
+	"""Refresh payment status of the invoices a set of ledger rows touch"""
+	from smspro.sms_pro.api.payment import update_invoice_payment_status
+	
+	for fee_invoice in {row.fee_invoice for row in rows if row.fee_invoice}:
+		update_invoice_payment_status(fee_invoice)
+
+
+def get_payment_totals(fee_invoice=None, student_enrollment=None):
+	"""
+	Get total paid and last payment date from the ledger
+	
+	A payment counts towards the last payment date only while it has not been
+	reversed.
+	"""
+	field, value = ("fee_invoice", fee_invoice) if fee_invoice else ("student_enrollment", student_enrollment)
+	
+	totals = frappe.db.sql(f"""
+		SELECT
+			SUM(t.amount) as total_paid,
+			MAX(CASE WHEN t.amount > 0 THEN t.posting_date END) as last_payment_date
+		FROM (
+			SELECT payment_entry, SUM(amount) as amount, MIN(posting_date) as posting_date
+			FROM `tabSMS Payment Ledger`
+			WHERE {field} = %s
+			GROUP BY payment_entry
+		) t
+	""", (value,), as_dict=True)[0]
+	
+	return frappe._dict({
+		"total_paid": flt(totals.total_paid),
+		"last_payment_date": totals.last_payment_date
+	})
+
+
+def get_payment_history(fee_invoice=None, student_enrollment=None, student=None):
+	"""Get the payments still in effect for an invoice, enrollment or student, newest first"""
+	if fee_invoice:
+		field, value = "fee_invoice", fee_invoice
+	elif student_enrollment:
+		field, value = "student_enrollment", student_enrollment
+	else:
+		field, value = "student", student
+	
+	return frappe.db.sql(f"""
+		SELECT
+			payment_entry as name,
+			MIN(posting_date) as posting_date,
+			SUM(amount) as paid_amount,
+			MAX(reference_no) as reference_no,
+			MAX(mode_of_payment) as mode_of_payment
+		FROM `tabSMS Payment Ledger`
+		WHERE {field} = %s
+		GROUP BY payment_entry
+		HAVING SUM(amount) != 0
+		ORDER BY posting_date DESC
+	""", (value,), as_dict=True)
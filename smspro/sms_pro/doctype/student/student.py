@@ -4,6 +4,14 @@
 import frappe
 from frappe.model.document import Document
 
+from smspro.sms_pro.doctype.student.student_duplicates import find_duplicates
+from smspro.sms_pro.doctype.student_search_token.student_search_token import (
+	delete_search_tokens,
+	get_block_keys,
+	get_search_fields,
+	update_search_tokens,
+)
+
 
 class Student(Document):
 	def validate(self):
@@ -18,6 +26,29 @@ class Student(Document):
 		# Validate phone number
 		if self.phone_number and len(self.phone_number) < 10:
 			frappe.throw("Please enter a valid phone number")
+		
+		# Normalized name, phones and ID for accent-insensitive search
+		self.search_name, self.search_key = get_search_fields(self)
+		
+		# Warn about records that look like the same student
+		if self.is_new():
+			self.check_duplicates()
+	
+	def check_duplicates(self):
+		"""Show existing students this record is likely a duplicate of"""
+		duplicates = find_duplicates(self)
+		if not duplicates:
+			return
+		
+		frappe.msgprint(
+			"<br>".join(
+				f"{frappe.utils.get_link_to_form('Student', d.name)} {d.student_name} "
+				f"({round(d.score * 100)}% match: {', '.join(d.reasons)})"
+				for d in duplicates
+			),
+			title="Possible Duplicate Student",
+			indicator="orange"
+		)
 	
 	def generate_student_id(self):
 		"""Generate unique student ID"""
@@ -36,6 +67,13 @@ class Student(Document):
 	def on_update(self):
 		# Update full name
 		self.full_name = f"{self.first_name} {self.last_name}"
+		
+		# Refresh the search index and blocking keys when the fields behind them changed
+		if self.has_value_changed("search_key") or self.has_value_changed("date_of_birth"):
+			update_search_tokens(self.name, self.search_key, get_block_keys(self))
+	
+	def on_trash(self):
+		delete_search_tokens(self.name)
 	
 	@frappe.whitelist()
 	def get_enrollments(self):
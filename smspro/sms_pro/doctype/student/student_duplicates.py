@@ -0,0 +1,179 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+"""
+Duplicate student detection
+
+Records are only compared when they share a blocking key (normalized name
+and birth year, or a phone number), see `get_block_keys`. Candidate pairs are
+then scored on name similarity, date of birth, phones and email.
+"""
+
+from difflib import SequenceMatcher
+
+import frappe
+from frappe.utils import getdate
+
+from smspro.sms_pro.doctype.student_search_token.student_search_token import (
+	get_block_keys,
+	normalize_phone_digits,
+	normalize_text,
+)
+
+# Pairs scoring at least this are reported as likely duplicates
+DUPLICATE_THRESHOLD = 0.75
+
+# Blocks larger than this (a shared office phone, a very common name) are skipped
+MAX_BLOCK_SIZE = 50
+
+STUDENT_FIELDS = """
+	name, creation, first_name, last_name, date_of_birth, phone_number, parent_phone, email, search_name
+"""
+
+
+def find_duplicates(doc, threshold=DUPLICATE_THRESHOLD):
+	"""Get existing students likely to be the same person as `doc`, best match first"""
+	keys = get_block_keys(doc)
+	if not keys:
+		return []
+	
+	candidates = frappe.db.sql(f"""
+		SELECT {STUDENT_FIELDS}
+		FROM `tabStudent`
+		WHERE name IN (
+			SELECT student
+			FROM `tabStudent Search Token`
+			WHERE token_type = 'Block' AND token IN %(keys)s
+		)
+		AND name != %(name)s
+		LIMIT %(limit)s
+	""", {"keys": tuple(keys), "name": doc.name or "", "limit": MAX_BLOCK_SIZE}, as_dict=True)
+	
+	student = frappe._dict({
+		"first_name": doc.first_name,
+		"last_name": doc.last_name,
+		"date_of_birth": doc.date_of_birth,
+		"phone_number": doc.phone_number,
+		"parent_phone": doc.parent_phone,
+		"email": doc.email,
+		"search_name": doc.get("search_name")
+	})
+	
+	duplicates = []
+	for candidate in candidates:
+		score, reasons = get_similarity(student, candidate)
+		if score >= threshold:
+			duplicates.append(frappe._dict({
+				"name": candidate.name,
+				"student_name": f"{candidate.first_name or ''} {candidate.last_name or ''}".strip(),
+				"score": score,
+				"reasons": reasons
+			}))
+	
+	return sorted(duplicates, key=lambda d: -d.score)
+
+
+def get_similarity(a, b):
+	"""Score how likely two student records are the same person, with the reasons"""
+	name_a = a.search_name or normalize_text(f"{a.first_name or ''} {a.last_name or ''}")
+	name_b = b.search_name or normalize_text(f"{b.first_name or ''} {b.last_name or ''}")
+	
+	name_ratio = SequenceMatcher(None, name_a, name_b).ratio() if name_a and name_b else 0
+	score = 0.6 * name_ratio
+	reasons = []
+	
+	if name_ratio >= 0.9:
+		reasons.append("name")
+	
+	if a.date_of_birth and b.date_of_birth:
+		if getdate(a.date_of_birth) == getdate(b.date_of_birth):
+			score += 0.2
+			reasons.append("date of birth")
+		else:
+			score -= 0.2
+	
+	phone_a = normalize_phone_digits(a.phone_number)
+	phone_b = normalize_phone_digits(b.phone_number)
+	if phone_a and phone_a == phone_b:
+		score += 0.25
+		reasons.append("phone")
+	
+	# Siblings share the parent phone too, so it weighs less
+	parent_a = normalize_phone_digits(a.parent_phone)
+	if parent_a and parent_a == normalize_phone_digits(b.parent_phone):
+		score += 0.2
+		reasons.append("parent phone")
+	
+	if a.email and (a.email or "").strip().lower() == (b.email or "").strip().lower():
+		score += 0.2
+		reasons.append("email")
+	
+	return round(max(0, min(score, 1)), 3), reasons
+
+
+def find_duplicate_students(threshold=DUPLICATE_THRESHOLD):
+	"""
+	Sweep all students for likely duplicates in one pass and suggest merges
+	
+	Only pairs inside a shared block are scored. Each suggestion keeps the
+	record with more enrollments, or the older one, and merges the other
+	into it.
+	"""
+	students = {
+		row.name: row
+		for row in frappe.db.sql(f"SELECT {STUDENT_FIELDS} FROM `tabStudent`", as_dict=True)
+	}
+	
+	enrollments = dict(frappe.db.sql("""
+		SELECT student, COUNT(*)
+		FROM `tabStudent Enrollment`
+		GROUP BY student
+	"""))
+	
+	# Members of every block with more than one student, in block order
+	rows = frappe.db.sql("""
+		SELECT t.token, t.student
+		FROM `tabStudent Search Token` t
+		JOIN (
+			SELECT token
+			FROM `tabStudent Search Token`
+			WHERE token_type = 'Block'
+			GROUP BY token
+			HAVING COUNT(*) BETWEEN 2 AND %(max_block_size)s
+		) b ON b.token = t.token
+		WHERE t.token_type = 'Block'
+		ORDER BY t.token
+	""", {"max_block_size": MAX_BLOCK_SIZE})
+	
+	blocks = {}
+	for token, student in rows:
+		blocks.setdefault(token, []).append(student)
+	
+	seen = set()
+	suggestions = []
+	for members in blocks.values():
+		for i, name_a in enumerate(members):
+			for name_b in members[i + 1:]:
+				pair = tuple(sorted((name_a, name_b)))
+				if pair in seen or name_a not in students or name_b not in students:
+					continue
+				seen.add(pair)
+				
+				score, reasons = get_similarity(students[name_a], students[name_b])
+				if score < threshold:
+					continue
+				
+				keep, merge = sorted(
+					pair,
+					key=lambda name: (-enrollments.get(name, 0), students[name].creation)
+				)
+				suggestions.append(frappe._dict({
+					"keep": keep,
+					"keep_name": f"{students[keep].first_name or ''} {students[keep].last_name or ''}".strip(),
+					"merge": merge,
+					"merge_name": f"{students[merge].first_name or ''} {students[merge].last_name or ''}".strip(),
+					"score": score,
+					"reasons": ", ".join(reasons)
+				}))
+	
+	return sorted(suggestions, key=lambda s: -s.score)
@@ -0,0 +1,133 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from smspro.sms_pro.doctype.student.student_duplicates import (
+	DUPLICATE_THRESHOLD,
+	find_duplicates,
+	get_similarity,
+)
+from smspro.sms_pro.doctype.student_search_token.student_search_token import get_block_keys
+
+
+def make_student(**values):
+	return frappe._dict({
+		"first_name": "Nguyễn Văn",
+		"last_name": "An",
+		"date_of_birth": "2012-05-01",
+		"phone_number": None,
+		"parent_phone": None,
+		"email": None,
+		**values
+	})
+
+
+class TestBlockKeys(FrappeTestCase):
+	def test_name_key_ignores_accents_and_carries_birth_year(self):
+		self.assertIn("name:nguyen van an:2012", get_block_keys(make_student()))
+		self.assertEqual(
+			get_block_keys(make_student(first_name="nguyen van")),
+			get_block_keys(make_student(first_name="Nguyễn Văn"))
+		)
+	
+	def test_name_key_without_birth_date(self):
+		self.assertEqual(get_block_keys(make_student(date_of_birth=None)), {"name:nguyen van an:"})
+	
+	def test_phone_keys_are_normalized(self):
+		keys = get_block_keys(make_student(phone_number="+84 912 345 678", parent_phone="0987-654-321"))
+		
+		self.assertIn("phone:0912345678", keys)
+		self.assertIn("phone:0987654321", keys)
+	
+	def test_short_phones_are_not_keys(self):
+		keys = get_block_keys(make_student(phone_number="12345"))
+		
+		self.assertFalse(any(key.startswith("phone:") for key in keys))
+
+
+class TestSimilarity(FrappeTestCase):
+	def test_same_person_typed_twice(self):
+		score, reasons = get_similarity(
+			make_student(phone_number="0912345678"),
+			make_student(first_name="Nguyen Van", phone_number="+84912345678")
+		)
+		
+		self.assertGreaterEqual(score, DUPLICATE_THRESHOLD)
+		self.assertEqual(reasons, ["name", "date of birth", "phone"])
+	
+	def test_same_name_and_birth_date_reach_the_threshold(self):
+		score, _reasons = get_similarity(make_student(), make_student())
+		
+		self.assertEqual(score, 0.8)
+		self.assertGreaterEqual(score, DUPLICATE_THRESHOLD)
+	
+	def test_same_name_alone_is_below_the_threshold(self):
+		score, _reasons = get_similarity(make_student(date_of_birth=None), make_student(date_of_birth=None))
+		
+		self.assertEqual(score, 0.6)
+		self.assertLess(score, DUPLICATE_THRESHOLD)
+	
+	def test_siblings_sharing_parent_phone_are_not_duplicates(self):
+		score, reasons = get_similarity(
+			make_student(last_name="An", date_of_birth="2012-05-01", parent_phone="0987654321"),
+			make_student(last_name="Bình", date_of_birth="2015-09-12", parent_phone="0987654321")
+		)
+		
+		self.assertIn("parent phone", reasons)
+		self.assertLess(score, DUPLICATE_THRESHOLD)
+	
+	def test_different_birth_date_lowers_the_score(self):
+		same, _reasons = get_similarity(make_student(), make_student())
+		different, _reasons = get_similarity(make_student(), make_student(date_of_birth="2013-05-01"))
+		
+		self.assertAlmostEqual(same - different, 0.4)
+		self.assertLess(different, DUPLICATE_THRESHOLD)
+	
+	def test_score_is_capped_at_one(self):
+		student = make_student(phone_number="0912345678", parent_phone="0987654321", email="an@example.com")
+		
+		score, _reasons = get_similarity(student, make_student(**student))
+		
+		self.assertEqual(score, 1)
+
+
+class TestFindDuplicates(FrappeTestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		
+		if not frappe.db.exists("Student", "_T-DUP-1"):
+			frappe.get_doc({
+				"doctype": "Student",
+				"student_id": "_T-DUP-1",
+				"first_name": "Phạm Thị",
+				"last_name": "Mai",
+				"date_of_birth": "2011-03-15",
+				"phone_number": "0933111222"
+			}).insert()
+	
+	def test_retyped_student_is_found(self):
+		new = frappe.get_doc({
+			"doctype": "Student",
+			"first_name": "Pham Thi",
+			"last_name": "Mai",
+			"date_of_birth": "2011-03-15",
+			"phone_number": "+84 933 111 222"
+		})
+		
+		duplicates = find_duplicates(new)
+		
+		self.assertEqual([d.name for d in duplicates], ["_T-DUP-1"])
+	
+	def test_unrelated_student_is_not_compared(self):
+		new = frappe.get_doc({
+			"doctype": "Student",
+			"first_name": "Võ Minh",
+			"last_name": "Khoa",
+			"date_of_birth": "2011-03-15",
+			"phone_number": "0944555666"
+		})
+		
+		self.assertEqual(find_duplicates(new), [])
@@ -0,0 +1,148 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+"""
+Bulk repricing of enrollments
+
+Enrollments keep the course fee captured when they were created. A course
+fee change reaches existing enrollments only through `reprice_enrollments`,
+which reports the difference per enrollment and, when applied, updates
+enrollments and their open fee invoices with set-based SQL per chunk,
+recomputing totals, outstanding amounts and payment status in the database.
+"""
+
+import frappe
+from frappe.utils import flt, now_datetime, today
+
+from smspro.sms_pro.api.prepared_report import invalidate_prepared_reports
+
+REPRICE_CHUNK_SIZE = 1000
+
+DIFF_FIELDS = [
+	"enrollment", "student", "student_name", "batch", "old_course_fee", "new_course_fee",
+	"discount_amount", "paid_amount", "old_total_fee", "new_total_fee",
+	"old_outstanding", "new_outstanding", "open_invoices"
+]
+
+# Same rules as StudentEnrollment.update_payment_status and FeeInvoice.update_payment_status
+PAYMENT_STATUS_SQL = """
+	CASE
+		WHEN {total} <= 0 OR IFNULL(paid_amount, 0) = 0 THEN 'Unpaid'
+		WHEN IFNULL(paid_amount, 0) >= {total} THEN 'Paid'
+		ELSE 'Partially Paid'
+	END
+"""
+
+
+def get_repricing_diff(course, new_fee=None, batch=None):
+	"""
+	Get the active enrollments of a course whose fee would change
+	
+	Args:
+		course: Course name
+		new_fee: Fee to apply (defaults to the course's current fee)
+		batch: Only enrollments of this batch
+	"""
+	if new_fee is None:
+		new_fee = frappe.db.get_value("Course", course, "course_fee")
+		if new_fee is None:
+			frappe.throw(f"Course {course} not found")
+	
+	new_fee = flt(new_fee)
+	if new_fee <= 0:
+		frappe.throw("Course fee must be greater than 0")
+	
+	conditions = ""
+	values = {"course": course, "new_fee": new_fee}
+	if batch:
+		conditions = "AND se.batch = %(batch)s"
+		values["batch"] = batch
+	
+	rows = frappe.db.sql(f"""
+		SELECT
+			se.name AS enrollment, se.student, se.student_name, se.batch,
+			se.course_fee AS old_course_fee,
+			IFNULL(se.discount_amount, 0) AS discount_amount, IFNULL(se.paid_amount, 0) AS paid_amount,
+			se.total_fee AS old_total_fee, se.outstanding_amount AS old_outstanding,
+			(
+				SELECT COUNT(*)
+				FROM `tabFee Invoice` fi
+				WHERE fi.student_enrollment = se.name
+				AND fi.status NOT IN ('Paid', 'Cancelled')
+			) AS open_invoices
+		FROM `tabStudent Enrollment` se
+		WHERE se.course = %(course)s
+		AND se.status = 'Active'
+		AND IFNULL(se.course_fee, 0) != %(new_fee)s
+		{conditions}
+		ORDER BY se.name
+	""", values, as_dict=True)
+	
+	for row in rows:
+		row.new_course_fee = new_fee
+		row.new_total_fee = new_fee - flt(row.discount_amount)
+		row.new_outstanding = max(0, row.new_total_fee - flt(row.paid_amount))
+	
+	return rows
+
+
+def reprice_enrollments(course, new_fee=None, batch=None, dry_run=True):
+	"""
+	Apply a course fee to its active enrollments and their open invoices
+	
+	Returns the diff. With dry_run nothing is written.
+	"""
+	diff = get_repricing_diff(course, new_fee, batch)
+	if dry_run or not diff:
+		return diff
+	
+	# Both tables recompute from their own discount and paid amounts
+	total = "(%(new_fee)s - IFNULL(discount_amount, 0))"
+	payment_status = PAYMENT_STATUS_SQL.format(total=total)
+	
+	values = {
+		"new_fee": diff[0].new_course_fee,
+		"today": today(),
+		"now": now_datetime(),
+		"user": frappe.session.user
+	}
+	
+	for start in range(0, len(diff), REPRICE_CHUNK_SIZE):
+		values["names"] = tuple(row.enrollment for row in diff[start:start + REPRICE_CHUNK_SIZE])
+		
+		frappe.db.sql(f"""
+			UPDATE `tabStudent Enrollment`
+			SET
+				course_fee = %(new_fee)s,
+				total_fee = {total},
+				outstanding_amount = GREATEST(0, {total} - IFNULL(paid_amount, 0)),
+				payment_status = {payment_status},
+				modified = %(now)s,
+				modified_by = %(user)s
+			WHERE name IN %(names)s
+		""", values)
+		
+		# Open invoices, status follows FeeInvoice.update_status
+		frappe.db.sql(f"""
+			UPDATE `tabFee Invoice`
+			SET
+				course_fee = %(new_fee)s,
+				total_amount = {total},
+				outstanding_amount = GREATEST(0, {total} - IFNULL(paid_amount, 0)),
+				payment_status = {payment_status},
+				status = CASE
+					WHEN {payment_status} = 'Paid' THEN 'Paid'
+					WHEN due_date < %(today)s THEN 'Overdue'
+					ELSE 'Submitted'
+				END,
+				modified = %(now)s,
+				modified_by = %(user)s
+			WHERE student_enrollment IN %(names)s
+			AND status NOT IN ('Paid', 'Cancelled')
+		""", values)
+		
+		invalidate_prepared_reports("Student Enrollment")
+		invalidate_prepared_reports("Fee Invoice")
+		frappe.db.commit()
+	
+	return diff
@@ -4,6 +4,11 @@
 import frappe
 from frappe.model.document import Document
 
+from smspro.sms_pro.api.prepared_report import invalidate_prepared_reports
+from smspro.sms_pro.deferred import defer
+
+MODULE = "smspro.sms_pro.doctype.student_enrollment.student_enrollment"
+
 
 class StudentEnrollment(Document):
 	def validate(self):
@@ -21,8 +26,8 @@ class StudentEnrollment(Document):
 		if existing_enrollment:
 			frappe.throw(f"Student is already enrolled in this batch")
 		
-		# Check if batch has available capacity
-		if not self.is_batch_available():
+		# Check if batch has available capacity when joining it
+		if self.is_joining_batch() and not self.is_batch_available():
 			frappe.throw(f"Batch is full. No available slots.")
 		
 		# Validate enrollment date
@@ -35,18 +40,43 @@ class StudentEnrollment(Document):
 		# Update payment status
 		self.update_payment_status()
 	
+	def is_joining_batch(self):
+		"""Check if this save adds an active enrollment to the batch"""
+		if self.status != "Active":
+			return False
+		
+		previous = self.get_doc_before_save()
+		return not previous or previous.batch != self.batch or previous.status != "Active"
+	
 	def is_batch_available(self):
 		"""Check if batch has available capacity"""
 		if not self.batch:
 			return True
 		
-		batch_capacity = frappe.get_value("Batch", self.batch, "capacity")
-		current_enrollment = frappe.get_value("Batch", self.batch, "current_enrollment")
+		# Lock the batch until commit, so concurrent enrollments and batch
+		# transfers into it are checked against the same count
+		batch_capacity = frappe.db.sql("""
+			SELECT capacity
+			FROM `tabBatch`
+			WHERE name = %s
+			FOR UPDATE
+		""", self.batch)
+		batch_capacity = batch_capacity[0][0] if batch_capacity else None
 		
 		if not batch_capacity:
 			return True
 		
-		return (current_enrollment or 0) < batch_capacity
+		# Count live, current_enrollment is refreshed after commit
+		current_enrollment = frappe.db.count(
+			"Student Enrollment",
+			{
+				"batch": self.batch,
+				"status": "Active",
+				"name": ["!=", self.name]
+			}
+		)
+		
+		return current_enrollment < batch_capacity
 	
 	def validate_enrollment_date(self):
 		"""Validate enrollment date against course and batch dates"""
@@ -63,17 +93,18 @@ class StudentEnrollment(Document):
 			frappe.throw("Enrollment date cannot be after batch end date")
 	
 	def calculate_fees(self):
-		"""Calculate total fees"""
+		"""Calculate total fees from the course fee captured at enrollment"""
 		if not self.course:
 			return
 		
-		# Get course fee
-		course_fee = frappe.get_value("Course", self.course, "course_fee") or 0
-		self.course_fee = course_fee
+		# Capture the course fee when enrolling or changing course only, later
+		# course fee changes are applied with `bench reprice-enrollments`
+		if self.has_value_changed("course"):
+			self.course_fee = frappe.get_value("Course", self.course, "course_fee") or 0
 		
 		# Calculate total fee
 		discount = self.discount_amount or 0
-		self.total_fee = course_fee - discount
+		self.total_fee = (self.course_fee or 0) - discount
 		
 		# Calculate outstanding amount
 		paid_amount = self.paid_amount or 0
@@ -96,14 +127,45 @@ class StudentEnrollment(Document):
 	
 	def on_update(self):
 		# Update student and course names
-		self.update_names()
+		defer(f"{MODULE}.update_enrollment_names", f"enrollment_names:{self.name}", enrollment=self.name)
 		
-		# Update batch enrollment count
-		self.update_batch_enrollment()
+		# Update batch enrollment count, once per batch per flush
+		for batch in self.get_affected_batches():
+			defer(f"{MODULE}.update_batch_enrollment_count", f"batch_enrollment:{batch}", batch=batch)
 		
 		# Create fee invoice if needed
 		if self.status == "Active" and self.payment_status == "Unpaid":
-			self.create_fee_invoice()
+			defer(f"{MODULE}.create_enrollment_fee_invoice", f"fee_invoice:{self.name}", enrollment=self.name)
+		
+		# Refresh the teacher rosters of the batch
+		self.clear_roster_cache()
+		
+		# Prepared report results built from enrollments are stale after commit
+		invalidate_prepared_reports(self.doctype)
+	
+	def get_affected_batches(self):
+		"""Get the batches whose active count this save may change"""
+		batches = {self.batch}
+		
+		previous = self.get_doc_before_save()
+		if previous:
+			batches.add(previous.batch)
+		
+		return [batch for batch in batches if batch]
+	
+	def on_trash(self):
+		self.clear_roster_cache()
+		invalidate_prepared_reports(self.doctype)
+	
+	def clear_roster_cache(self):
+		"""Drop cached teacher rosters affected by this enrollment"""
+		from smspro.sms_pro.api.roster import clear_batch_roster_cache
+		
+		clear_batch_roster_cache(self.batch)
+		
+		previous = self.get_doc_before_save()
+		if previous and previous.batch and previous.batch != self.batch:
+			clear_batch_roster_cache(previous.batch)
 	
 	def update_names(self):
 		"""Update student, course, and batch names"""
@@ -128,17 +190,7 @@ class StudentEnrollment(Document):
 		if not self.batch:
 			return
 		
-		# Count active enrollments for this batch
-		count = frappe.db.count(
-			"Student Enrollment",
-			{
-				"batch": self.batch,
-				"status": "Active"
-			}
-		)
-		
-		# Update batch
-		frappe.db.set_value("Batch", self.batch, "current_enrollment", count)
+		update_batch_enrollment_count(self.batch)
 	
 	def create_fee_invoice(self):
 		"""Create fee invoice for this enrollment"""
@@ -170,22 +222,68 @@ class StudentEnrollment(Document):
 	@frappe.whitelist()
 	def get_payment_history(self):
 		"""Get payment history for this enrollment"""
-		payments = frappe.get_all(
-			"Payment Entry",
-			filters={
-				"reference_name": self.name,
-				"reference_doctype": "Student Enrollment"
-			},
-			fields=["name", "posting_date", "paid_amount", "reference_no"]
-		)
-		return payments
+		from smspro.sms_pro.doctype.sms_payment_ledger.sms_payment_ledger import get_payment_history
+		
+		return get_payment_history(student_enrollment=self.name)
 	
 	@frappe.whitelist()
 	def get_attendance_summary(self):
 		"""Get attendance summary for this enrollment"""
-		# This will be implemented when Attendance DocType is created
-		return {
-			"total_sessions": 0,
-			"attended_sessions": 0,
-			"attendance_rate": 0
+		from smspro.sms_pro.doctype.attendance.attendance import get_attendance_summary
+		
+		return get_attendance_summary(self.student, self.batch)
+
+
+def update_enrollment_names(enrollment):
+	"""Deferred: store the student, course and batch names of an enrollment"""
+	if not frappe.db.exists("Student Enrollment", enrollment):
+		return
+	
+	doc = frappe.get_doc("Student Enrollment", enrollment)
+	doc.update_names()
+	
+	frappe.db.set_value(
+		"Student Enrollment",
+		enrollment,
+		{
+			"student_name": doc.student_name,
+			"course_name": doc.course_name,
+			"batch_name": doc.batch_name
+		},
+		update_modified=False
+	)
+	
+	# set_value skips on_update, the names are report columns
+	invalidate_prepared_reports("Student Enrollment")
+
+
+def update_batch_enrollment_count(batch):
+	"""Deferred: recount the active enrollments of a batch"""
+	# Count active enrollments for this batch
+	count = frappe.db.count(
+		"Student Enrollment",
+		{
+			"batch": batch,
+			"status": "Active"
 		}
+	)
+	
+	# Update batch
+	frappe.db.set_value("Batch", batch, "current_enrollment", count)
+
+
+def create_enrollment_fee_invoice(enrollment):
+	"""Deferred: create the fee invoice of an active, unpaid enrollment"""
+	if not frappe.db.exists("Student Enrollment", enrollment):
+		return
+	
+	doc = frappe.get_doc("Student Enrollment", enrollment)
+	if doc.status == "Active" and doc.payment_status == "Unpaid":
+		doc.create_fee_invoice()
+
+
+def on_doctype_update():
+	# Batch recounts and session expectations filter active enrollments by batch
+	frappe.db.add_index("Student Enrollment", ["batch", "status"])
+	# The at-risk list ranks active enrollments by score
+	frappe.db.add_index("Student Enrollment", ["status", "risk_score"])
@@ -0,0 +1,117 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import re
+import unicodedata
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import getdate
+
+# Shortest query word matched by prefix, shorter words would match most of the table
+MIN_PREFIX_LENGTH = 2
+
+
+class StudentSearchToken(Document):
+	pass
+
+
+def on_doctype_update():
+	# Prefix lookups are range scans on (token_type, token), student comes along for free
+	frappe.db.add_index("Student Search Token", ["token_type", "token", "student"])
+	frappe.db.add_index("Student Search Token", ["student"])
+
+
+def normalize_text(text):
+	"""
+	Lowercase text and strip Vietnamese diacritics
+	
+	"Nguyễn Văn Đức" becomes "nguyen van duc".
+	"""
+	text = unicodedata.normalize("NFD", text or "")
+	text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+	text = text.replace("đ", "d").replace("Đ", "D").lower()
+	return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def normalize_phone_digits(phone):
+	"""Keep the digits of a phone number in local 0xxxxxxxxx form"""
+	digits = re.sub(r"\D", "", phone or "")
+	
+	# Local numbers start with 0, a leading 84 is the country code
+	if digits.startswith("84") and len(digits) > 4:
+		digits = "0" + digits[2:]
+	
+	return digits
+
+
+def get_trigrams(word):
+	"""Trigrams of a word padded at the start, so "an" still yields " an" """
+	padded = f" {word}"
+	return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def get_search_fields(doc):
+	"""Build the search_name and search_key of a Student"""
+	search_name = normalize_text(f"{doc.first_name or ''} {doc.last_name or ''}")
+	
+	keys = [search_name, normalize_text(doc.student_id)]
+	keys += [normalize_phone_digits(doc.get(field)) for field in ("phone_number", "parent_phone")]
+	
+	return search_name, " ".join(key for key in keys if key)
+
+
+def get_block_keys(doc):
+	"""
+	Blocking keys for duplicate detection
+	
+	Records sharing a key are compared with each other: the normalized name
+	with the birth year, and every phone number the record carries.
+	"""
+	search_name = doc.get("search_name") or normalize_text(f"{doc.first_name or ''} {doc.last_name or ''}")
+	birth_year = getdate(doc.date_of_birth).year if doc.get("date_of_birth") else ""
+	
+	keys = set()
+	if search_name:
+		keys.add(f"name:{search_name}:{birth_year}")
+	
+	for field in ("phone_number", "parent_phone"):
+		phone = normalize_phone_digits(doc.get(field))
+		if len(phone) >= 9:
+			keys.add(f"phone:{phone}")
+	
+	return keys
+
+
+def get_search_tokens(search_key):
+	"""Words and trigrams indexed for a search key"""
+	words = set(search_key.split())
+	
+	trigrams = set()
+	for word in words:
+		trigrams |= get_trigrams(word)
+	
+	return words, trigrams
+
+
+def update_search_tokens(student, search_key, block_keys=()):
+	"""Replace the indexed search tokens and blocking keys of a student (Student on_update)"""
+	frappe.db.delete("Student Search Token", {"student": student})
+	
+	words, trigrams = get_search_tokens(search_key or "")
+	values = [(student, word, "Word") for word in words]
+	values += [(student, trigram, "Trigram") for trigram in trigrams]
+	values += [(student, key, "Block") for key in block_keys]
+	
+	if not values:
+		return
+	
+	frappe.db.bulk_insert(
+		"Student Search Token",
+		fields=["student", "token", "token_type"],
+		values=values
+	)
+
+
+def delete_search_tokens(student):
+	frappe.db.delete("Student Search Token", {"student": student})
@@ -0,0 +1,95 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import unicodedata
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from smspro.sms_pro.api.student_search import get_query_words, search_students
+from smspro.sms_pro.doctype.student_search_token.student_search_token import (
+	get_search_tokens,
+	get_trigrams,
+	normalize_phone_digits,
+	normalize_text,
+)
+
+TEST_STUDENTS = [
+	{"student_id": "_T-SEARCH-1", "first_name": "Nguyễn Văn", "last_name": "Đức", "phone_number": "0912345678"},
+	{"student_id": "_T-SEARCH-2", "first_name": "Trần Thị", "last_name": "Hương", "parent_phone": "+84 987 654 321"},
+	{"student_id": "_T-SEARCH-3", "first_name": "Lê Hoàng", "last_name": "Đạt", "phone_number": "0901112223"}
+]
+
+
+class TestNormalization(FrappeTestCase):
+	def test_vietnamese_diacritics_are_stripped(self):
+		self.assertEqual(normalize_text("Nguyễn Văn Đức"), "nguyen van duc")
+		self.assertEqual(normalize_text("Trần Thị Hương"), "tran thi huong")
+		self.assertEqual(normalize_text("Phạm Ngọc Ánh"), "pham ngoc anh")
+	
+	def test_d_with_stroke_in_both_cases(self):
+		self.assertEqual(normalize_text("đ"), "d")
+		self.assertEqual(normalize_text("Đ"), "d")
+		self.assertEqual(normalize_text("ĐẶNG đình ĐÔ"), "dang dinh do")
+	
+	def test_composed_and_decomposed_input_match(self):
+		composed = "Hu\u1ef3nh"
+		decomposed = unicodedata.normalize("NFD", composed)
+		
+		self.assertEqual(normalize_text(composed), normalize_text(decomposed))
+		self.assertEqual(normalize_text(composed), "huynh")
+	
+	def test_punctuation_and_spacing_are_collapsed(self):
+		self.assertEqual(normalize_text("  Lê-Hoàng,   Đạt "), "le hoang dat")
+		self.assertEqual(normalize_text(None), "")
+	
+	def test_phone_digits(self):
+		self.assertEqual(normalize_phone_digits("0912 345 678"), "0912345678")
+		self.assertEqual(normalize_phone_digits("+84 912-345-678"), "0912345678")
+		self.assertEqual(normalize_phone_digits("84"), "84")
+	
+	def test_trigrams_are_padded_at_the_start(self):
+		self.assertEqual(get_trigrams("an"), {" an"})
+		self.assertEqual(get_trigrams("duc"), {" du", "duc"})
+	
+	def test_search_tokens(self):
+		words, trigrams = get_search_tokens("nguyen van duc 0912345678")
+		
+		self.assertEqual(words, {"nguyen", "van", "duc", "0912345678"})
+		self.assertIn(" ng", trigrams)
+		self.assertIn("yen", trigrams)
+	
+	def test_query_words(self):
+		self.assertEqual(get_query_words("Nguyễn  Văn"), ["nguyen", "van"])
+		self.assertEqual(get_query_words("+84 912.345.678"), ["0912345678"])
+
+
+class TestStudentSearch(FrappeTestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		
+		for student in TEST_STUDENTS:
+			if not frappe.db.exists("Student", student["student_id"]):
+				frappe.get_doc({"doctype": "Student", **student}).insert()
+	
+	def search(self, query):
+		result = search_students(query)
+		self.assertEqual(result["status"], "success")
+		return [row["name"] for row in result["data"] if row["name"].startswith("_T-SEARCH")]
+	
+	def test_accent_insensitive_prefix_match(self):
+		self.assertEqual(self.search("nguyen van")[0], "_T-SEARCH-1")
+		self.assertEqual(self.search("Nguyễn Văn")[0], "_T-SEARCH-1")
+		self.assertEqual(self.search("ngu du")[0], "_T-SEARCH-1")
+	
+	def test_every_word_must_match_a_prefix(self):
+		self.assertNotIn("_T-SEARCH-1", self.search("nguyen huong"))
+	
+	def test_phone_and_parent_phone_prefix(self):
+		self.assertEqual(self.search("0912 345")[0], "_T-SEARCH-1")
+		self.assertEqual(self.search("+84 987 654 321")[0], "_T-SEARCH-2")
+	
+	def test_trigram_match_catches_typos(self):
+		self.assertIn("_T-SEARCH-2", self.search("huogn"))
+		self.assertIn("_T-SEARCH-3", self.search("hoangg dat"))
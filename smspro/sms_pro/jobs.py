@@ -0,0 +1,277 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+"""
+Locked, resumable, time-boxed scheduled jobs
+
+Scheduled SMS Pro functions are marked with `@scheduled_job()`. Each call
+takes a Redis lock named after the function, so a slow run is never
+overlapped by the next one (the overlapping call is recorded as Skipped),
+and is recorded as an SMS Job Run with its duration, chunks, rows and
+error.
+
+Jobs with a `chunk_size` receive a `JobRun` as their first argument and
+iterate with `job.chunks(fetch)`. After each chunk the cursor is stored in
+SMS Job Checkpoint and committed. Chunks are sized from the time earlier
+rows took, so the next one fits in what is left of the time budget. Once
+the budget is spent the job stops, is re-enqueued and the next call resumes
+from the cursor. A run that died halfway resumes too, unless its cycle is
+older than RESUME_WINDOW:
+
+	@scheduled_job(chunk_size=500)
+	def send_reminders(job):
+		for invoices in job.chunks(get_overdue_invoices):
+			...
+	
+	def get_overdue_invoices(cursor, limit):
+		# rows ordered by name, after the cursor
+"""
+
+import functools
+import time
+
+import frappe
+from frappe.utils import add_to_date, get_datetime, now_datetime
+from rq import get_current_job
+
+# Seconds a call may run before it checkpoints and re-enqueues, below the
+# default queue's timeout scheduled jobs run under
+DEFAULT_TIME_BUDGET = 4 * 60
+
+# Seconds the lock outlives the time budget, or the queue timeout of the job
+LOCK_GRACE = 5 * 60
+
+# Share of the queue timeout a chunked call may spend before it re-enqueues
+QUEUE_TIMEOUT_SHARE = 0.8
+
+# Share of the chunk size fetched first, before the time per row is known
+PROBE_CHUNK_SHARE = 0.1
+
+# Hours after which an unfinished cycle starts over instead of resuming
+RESUME_WINDOW = 6
+
+
+class JobRun:
+	"""Progress, checkpoint and metrics of one call of a scheduled job"""
+	
+	def __init__(self, job_name, chunk_size=None, time_budget=DEFAULT_TIME_BUDGET):
+		self.job_name = job_name
+		self.chunk_size = chunk_size
+		self.started = time.monotonic()
+		self.paused = False
+		self.chunks_done = 0
+		self.rows_done = 0
+		self.seconds_per_row = None
+		self.lock_token = frappe.generate_hash(length=12)
+		
+		# RQ stops a job at its queue timeout: the budget stays below it, and the
+		# lock outlives it so a long unchunked run cannot be overlapped
+		queue_timeout = get_queue_timeout()
+		self.time_budget = min(time_budget, queue_timeout * QUEUE_TIMEOUT_SHARE) if queue_timeout else time_budget
+		self.lock_ttl = (queue_timeout or self.time_budget) + LOCK_GRACE
+		
+		checkpoint = frappe.db.get_value(
+			"SMS Job Checkpoint", job_name, ["status", "cursor", "cycle_started_on"], as_dict=True
+		)
+		self.resumed = bool(
+			checkpoint
+			and checkpoint.status != "Completed"
+			and checkpoint.cursor
+			and get_datetime(checkpoint.cycle_started_on) > add_to_date(now_datetime(), hours=-RESUME_WINDOW)
+		)
+		self.cursor = checkpoint.cursor if self.resumed else None
+		self.cursor_start = self.cursor
+	
+	def chunks(self, fetch, key="name"):
+		"""
+		Yield rows from `fetch(cursor, limit)` chunk by chunk, checkpointing after each
+		
+		Args:
+			fetch: Returns up to `limit` rows ordered by `key`, after `cursor` (None for the start)
+			key: Row field the cursor is taken from
+		"""
+		while True:
+			limit = self.get_chunk_limit()
+			if not limit:
+				self.paused = True
+				return
+			
+			chunk_started = time.monotonic()
+			rows = fetch(self.cursor, limit)
+			if not rows:
+				return
+			
+			yield rows
+			
+			# Paused inside the chunk, it is fetched again by the next call
+			if self.paused:
+				return
+			
+			# The slowest chunk so far sizes the next ones
+			seconds_per_row = (time.monotonic() - chunk_started) / len(rows)
+			self.seconds_per_row = max(self.seconds_per_row or 0, seconds_per_row)
+			
+			self.checkpoint(str(rows[-1][key]), len(rows))
+	
+	def get_chunk_limit(self):
+		"""Get the rows the next chunk can take within the time left, 0 once it is spent"""
+		remaining = self.time_budget - (time.monotonic() - self.started)
+		if remaining <= 0:
+			return 0
+		
+		if self.seconds_per_row is None:
+			return max(1, int(self.chunk_size * PROBE_CHUNK_SHARE))
+		if not self.seconds_per_row:
+			return self.chunk_size
+		
+		return min(self.chunk_size, int(remaining / self.seconds_per_row))
+	
+	def is_out_of_time(self):
+		return time.monotonic() - self.started >= self.time_budget
+	
+	def pause(self):
+		"""Stop inside a chunk without checkpointing it, the next call fetches it again"""
+		self.paused = True
+	
+	def checkpoint(self, cursor, rows):
+		"""Store the cursor after a processed chunk and commit it with the chunk's work"""
+		self.cursor = cursor
+		self.chunks_done += 1
+		self.rows_done += rows
+		
+		save_checkpoint(self.job_name, "Running", cursor)
+		frappe.db.commit()
+		
+		# Keep the lock while making progress
+		frappe.cache.expire(get_lock_key(self.job_name), self.lock_ttl)
+	
+	def acquire_lock(self):
+		return frappe.cache.set(
+			get_lock_key(self.job_name), self.lock_token, nx=True, ex=self.lock_ttl
+		)
+	
+	def release_lock(self):
+		key = get_lock_key(self.job_name)
+		token = frappe.cache.get(key)
+		if token and token.decode() == self.lock_token:
+			frappe.cache.delete(key)
+
+
+def scheduled_job(chunk_size=None, time_budget=DEFAULT_TIME_BUDGET):
+	"""
+	Run the decorated function under a per-job lock with run metrics
+	
+	Args:
+		chunk_size: Rows per chunk, the function then gets a JobRun as first argument
+		time_budget: Seconds before a chunked job checkpoints and re-enqueues itself,
+			capped below the queue timeout
+	"""
+	def decorator(fn):
+		method = f"{fn.__module__}.{fn.__name__}"
+		
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs):
+			return run_job(fn, method, chunk_size, time_budget, args, kwargs)
+		
+		return wrapper
+	
+	return decorator
+
+
+def run_job(fn, method, chunk_size, time_budget, args, kwargs):
+	job = JobRun(fn.__name__, chunk_size, time_budget)
+	run = start_run(job)
+	
+	if not job.acquire_lock():
+		finish_run(run, job, "Skipped")
+		frappe.db.commit()
+		return {
+			"status": "skipped",
+			"message": f"{job.job_name} is already running"
+		}
+	
+	try:
+		if job.cursor is None and chunk_size:
+			save_checkpoint(job.job_name, "Running", None, run, cycle_started_on=now_datetime())
+		
+		result = fn(job, *args, **kwargs) if chunk_size else fn(*args, **kwargs)
+		
+		status = "Paused" if job.paused else "Completed"
+		if chunk_size:
+			save_checkpoint(job.job_name, status, job.cursor, run)
+		finish_run(run, job, status)
+		frappe.db.commit()
+		
+		# Free the lock first, the next call may start right away
+		if job.paused:
+			job.release_lock()
+			frappe.enqueue(method, queue="default")
+		
+		return result
+	
+	except Exception as e:
+		frappe.db.rollback()
+		
+		if chunk_size:
+			save_checkpoint(job.job_name, "Failed", job.cursor, run)
+		finish_run(run, job, "Failed", frappe.get_traceback())
+		frappe.db.commit()
+		
+		frappe.log_error(frappe.get_traceback(), f"{job.job_name} Job Error")
+		return {
+			"status": "error",
+			"message": str(e)
+		}
+	
+	finally:
+		job.release_lock()
+
+
+def start_run(job):
+	run = frappe.get_doc({
+		"doctype": "SMS Job Run",
+		"job_name": job.job_name,
+		"status": "Running",
+		"resumed": int(job.resumed),
+		"started_on": now_datetime(),
+		"cursor_start": job.cursor_start
+	})
+	run.insert(ignore_permissions=True)
+	frappe.db.commit()
+	
+	return run.name
+
+
+def finish_run(run, job, status, error=None):
+	frappe.db.set_value("SMS Job Run", run, {
+		"status": status,
+		"ended_on": now_datetime(),
+		"duration": round(time.monotonic() - job.started, 3),
+		"chunks": job.chunks_done,
+		"rows": job.rows_done,
+		"cursor_end": job.cursor,
+		"error": error
+	}, update_modified=False)
+
+
+def save_checkpoint(job_name, status, cursor, run=None, cycle_started_on=None):
+	values = {"status": status, "cursor": cursor}
+	if run:
+		values["last_run"] = run
+	if cycle_started_on:
+		values["cycle_started_on"] = cycle_started_on
+	
+	if frappe.db.exists("SMS Job Checkpoint", job_name):
+		frappe.db.set_value("SMS Job Checkpoint", job_name, values, update_modified=False)
+	else:
+		frappe.get_doc({"doctype": "SMS Job Checkpoint", "job_name": job_name, **values}).insert(ignore_permissions=True)
+
+
+def get_queue_timeout():
+	"""Get the timeout of the background job running this call, or None outside a worker"""
+	rq_job = get_current_job()
+	return rq_job.timeout if rq_job else None
+
+
+def get_lock_key(job_name):
+	return frappe.cache.make_key(f"smspro:job_lock:{job_name}")
@@ -0,0 +1,434 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+"""
+Load-test harness for the busiest hours
+
+Seeds a site with load-test records (names starting with LT-), drives
+concurrent HTTP clients against a running bench with a scenario's mix of
+whitelisted methods and doc API calls, then checks the database for broken
+invariants:
+
+	registration: hundreds of students enrolling into a few small batches,
+		with batch lookups, payment summaries and student searches
+	attendance: teachers marking today's attendance for every enrolled
+		student at once, with re-marks, rosters and attendance matrices
+
+Responses are classified as ok, rejected (validation and duplicate errors a
+busy day is expected to produce), deadlock, lock timeout or error. Latency
+percentiles are reported per operation. Run it with:
+
+	bench --site smspro.local load-test registration --users 200 --duration 60
+"""
+
+import asyncio
+import random
+import time
+
+import frappe
+from frappe.utils import add_months, getdate, today
+
+LOAD_TEST_PREFIX = "LT-"
+LOAD_TEST_USER = "load-test@smspro.local"
+LOAD_TEST_COURSE = "LT-COURSE"
+
+# Operation weights per scenario
+SCENARIOS = {
+	"registration": {
+		"enroll": 6,
+		"get_batch": 2,
+		"payment_summary": 1,
+		"search_students": 1
+	},
+	"attendance": {
+		"mark_attendance": 6,
+		"remark_attendance": 1,
+		"teacher_roster": 2,
+		"attendance_matrix": 1
+	}
+}
+
+# Exception types Frappe reports for expected rejections
+REJECTED_EXCEPTIONS = ("ValidationError", "DuplicateEntryError", "UniqueValidationError", "LinkValidationError")
+
+ATTENDANCE_STATUSES = (("Present", 85), ("Absent", 10), ("Late", 5))
+
+
+def seed_site(scenario, students=500, batches=4):
+	"""
+	Create the load-test user, course, batches and students, and clear
+	enrollments and attendance of earlier runs
+	
+	Returns the API token and the seeded names for the clients.
+	"""
+	if scenario not in SCENARIOS:
+		frappe.throw(f"Unknown scenario {scenario}")
+	
+	if scenario == "attendance" and batches > 14:
+		frappe.throw("The attendance scenario seeds at most 14 batches, one per class hour")
+	
+	# Run enrollment side effects inline while seeding instead of queueing them
+	frappe.flags.smspro_sync_side_effects = True
+	
+	token = get_api_token()
+	clear_runs()
+	
+	if not frappe.db.exists("Course", LOAD_TEST_COURSE):
+		frappe.get_doc({
+			"doctype": "Course",
+			"course_code": LOAD_TEST_COURSE,
+			"course_name": "Load Test Course",
+			"course_fee": 1000000,
+			"status": "Active"
+		}).insert(ignore_permissions=True)
+	
+	student_names = []
+	for i in range(students):
+		student_id = f"{LOAD_TEST_PREFIX}S{i:05d}"
+		if not frappe.db.exists("Student", student_id):
+			frappe.get_doc({
+				"doctype": "Student",
+				"student_id": student_id,
+				"first_name": "Load",
+				"last_name": f"Test {i}",
+				"status": "Active"
+			}).insert(ignore_permissions=True)
+		student_names.append(student_id)
+	
+	# Registration: demand is about twice the seats. Attendance: room for everyone.
+	if scenario == "registration":
+		capacity = max(1, students // (batches * 2))
+	else:
+		capacity = -(-students // batches)
+	
+	batch_names = []
+	for i in range(batches):
+		batch_name = f"{LOAD_TEST_PREFIX}B{i:02d}"
+		batch = frappe.get_doc("Batch", batch_name) if frappe.db.exists("Batch", batch_name) else frappe.new_doc("Batch")
+		batch.update({
+			"batch_name": batch_name,
+			"course": LOAD_TEST_COURSE,
+			"start_date": getdate(today()),
+			"end_date": add_months(today(), 3),
+			"class_time": f"{7 + i:02d}:00:00",
+			"days_of_week": "Monday\nTuesday\nWednesday\nThursday\nFriday\nSaturday\nSunday",
+			"capacity": capacity,
+			"status": "Active",
+			"teacher": LOAD_TEST_USER if scenario == "attendance" else None
+		})
+		batch.save(ignore_permissions=True)
+		batch_names.append(batch_name)
+	
+	roster = []
+	if scenario == "attendance":
+		for i, student in enumerate(student_names):
+			batch = batch_names[i % len(batch_names)]
+			frappe.get_doc({
+				"doctype": "Student Enrollment",
+				"student": student,
+				"course": LOAD_TEST_COURSE,
+				"batch": batch,
+				"enrollment_date": getdate(today()),
+				"status": "Active"
+			}).insert(ignore_permissions=True)
+			roster.append((student, batch))
+	
+	frappe.db.commit()
+	
+	return frappe._dict({
+		"token": token,
+		"scenario": scenario,
+		"course": LOAD_TEST_COURSE,
+		"students": student_names,
+		"batches": batch_names,
+		"roster": roster,
+		"date": today()
+	})
+
+
+def get_api_token():
+	"""Create the load-test user with fresh API keys, return the token header value"""
+	if not frappe.db.exists("User", LOAD_TEST_USER):
+		frappe.get_doc({
+			"doctype": "User",
+			"email": LOAD_TEST_USER,
+			"first_name": "Load Test",
+			"send_welcome_email": 0,
+			"roles": [{"role": "System Manager"}]
+		}).insert(ignore_permissions=True)
+	
+	user = frappe.get_doc("User", LOAD_TEST_USER)
+	api_secret = frappe.generate_hash(length=15)
+	if not user.api_key:
+		user.api_key = frappe.generate_hash(length=15)
+	user.api_secret = api_secret
+	user.save(ignore_permissions=True)
+	
+	return f"token {user.api_key}:{api_secret}"
+
+
+def clear_runs():
+	"""Delete what earlier runs created: enrollments, invoices, attendance, notices"""
+	batch_filter = {"batch": ["like", f"{LOAD_TEST_PREFIX}%"]}
+	
+	frappe.db.delete("Absence Notice", batch_filter)
+	frappe.db.delete("Attendance", batch_filter)
+	frappe.db.delete("Fee Invoice", batch_filter)
+	frappe.db.delete("Student Enrollment", batch_filter)
+	frappe.db.sql("UPDATE `tabBatch` SET current_enrollment = 0 WHERE name LIKE %s", f"{LOAD_TEST_PREFIX}%")
+
+
+def delete_load_test_data():
+	"""Delete every load-test record"""
+	from smspro.sms_pro.doctype.student_search_token.student_search_token import delete_search_tokens
+	
+	clear_runs()
+	
+	frappe.db.delete("Class Session", {"batch": ["like", f"{LOAD_TEST_PREFIX}%"]})
+	frappe.db.delete("Batch", {"name": ["like", f"{LOAD_TEST_PREFIX}%"]})
+	
+	for student in frappe.get_all("Student", filters={"name": ["like", f"{LOAD_TEST_PREFIX}%"]}, pluck="name"):
+		delete_search_tokens(student)
+	frappe.db.delete("Student", {"name": ["like", f"{LOAD_TEST_PREFIX}%"]})
+	
+	frappe.db.delete("Course", {"name": LOAD_TEST_COURSE})
+	frappe.db.commit()
+
+
+def check_invariants():
+	"""Check the seeded batches for overbooking, duplicates and count drift"""
+	values = {"prefix": f"{LOAD_TEST_PREFIX}%"}
+	
+	overbooked = frappe.db.sql("""
+		SELECT b.name AS batch, b.capacity, COUNT(se.name) AS active
+		FROM `tabBatch` b
+		JOIN `tabStudent Enrollment` se ON se.batch = b.name AND se.status = 'Active'
+		WHERE b.name LIKE %(prefix)s
+		GROUP BY b.name, b.capacity
+		HAVING COUNT(se.name) > b.capacity
+	""", values, as_dict=True)
+	
+	duplicate_enrollments = frappe.db.sql("""
+		SELECT student, batch, COUNT(*) AS count
+		FROM `tabStudent Enrollment`
+		WHERE batch LIKE %(prefix)s AND status = 'Active'
+		GROUP BY student, batch
+		HAVING COUNT(*) > 1
+	""", values, as_dict=True)
+	
+	duplicate_attendance = frappe.db.sql("""
+		SELECT student, batch, attendance_date, COUNT(*) AS count
+		FROM `tabAttendance`
+		WHERE batch LIKE %(prefix)s
+		GROUP BY student, batch, attendance_date
+		HAVING COUNT(*) > 1
+	""", values, as_dict=True)
+	
+	# current_enrollment is refreshed after commit, drift right after a run may be pending jobs
+	stale_counts = frappe.db.sql("""
+		SELECT b.name AS batch, b.current_enrollment, COUNT(se.name) AS active
+		FROM `tabBatch` b
+		LEFT JOIN `tabStudent Enrollment` se ON se.batch = b.name AND se.status = 'Active'
+		WHERE b.name LIKE %(prefix)s
+		GROUP BY b.name, b.current_enrollment
+		HAVING IFNULL(b.current_enrollment, 0) != COUNT(se.name)
+	""", values, as_dict=True)
+	
+	return {
+		"overbooked_batches": overbooked,
+		"duplicate_enrollments": duplicate_enrollments,
+		"duplicate_attendance": duplicate_attendance,
+		"stale_enrollment_counts": stale_counts
+	}
+
+
+class LoadTestRun:
+	"""Concurrent clients for one scenario against a running bench"""
+	
+	def __init__(self, url, site, seed, users=100, duration=60, ramp_up=5):
+		self.url = url.rstrip("/")
+		self.site = site
+		self.seed = seed
+		self.users = users
+		self.duration = duration
+		self.ramp_up = ramp_up
+		self.weights = SCENARIOS[seed.scenario]
+		self.results = {}
+		
+		# Each student of the roster is marked once, by whichever client takes it first
+		self.to_mark = list(seed.roster)
+		random.shuffle(self.to_mark)
+		self.marked = []
+	
+	def run(self):
+		return asyncio.run(self.run_clients())
+	
+	async def run_clients(self):
+		import aiohttp
+		
+		headers = {
+			"Authorization": self.seed.token,
+			"Accept": "application/json",
+			"X-Frappe-Site-Name": self.site
+		}
+		connector = aiohttp.TCPConnector(limit=self.users)
+		timeout = aiohttp.ClientTimeout(total=120)
+		
+		started = time.monotonic()
+		self.deadline = started + self.duration
+		
+		async with aiohttp.ClientSession(headers=headers, connector=connector, timeout=timeout) as session:
+			await asyncio.gather(*(self.run_client(session, i) for i in range(self.users)))
+		
+		return self.get_report(time.monotonic() - started)
+	
+	async def run_client(self, session, index):
+		# Spread client start over the ramp-up
+		await asyncio.sleep(self.ramp_up * index / max(self.users, 1))
+		
+		operations = list(self.weights)
+		weights = list(self.weights.values())
+		
+		while time.monotonic() < self.deadline:
+			operation = random.choices(operations, weights)[0]
+			request = getattr(self, f"build_{operation}")()
+			if not request:
+				continue
+			
+			method, path, params = request
+			started = time.monotonic()
+			try:
+				async with session.request(
+					method, f"{self.url}{path}",
+					params=params if method == "GET" else None,
+					json=params if method != "GET" else None
+				) as response:
+					body = await response.text()
+					outcome = classify_response(response.status, body)
+			except Exception:
+				outcome = "error"
+			
+			self.record(operation, outcome, time.monotonic() - started)
+	
+	def record(self, operation, outcome, elapsed):
+		result = self.results.setdefault(operation, {"latencies": [], "outcomes": {}})
+		result["latencies"].append(elapsed)
+		result["outcomes"][outcome] = result["outcomes"].get(outcome, 0) + 1
+	
+	# Registration operations
+	
+	def build_enroll(self):
+		return ("POST", "/api/resource/Student Enrollment", {
+			"student": random.choice(self.seed.students),
+			"course": self.seed.course,
+			"batch": random.choice(self.seed.batches),
+			"enrollment_date": self.seed.date,
+			"status": "Active"
+		})
+	
+	def build_get_batch(self):
+		return ("GET", f"/api/resource/Batch/{random.choice(self.seed.batches)}", None)
+	
+	def build_payment_summary(self):
+		return ("GET", "/api/method/smspro.sms_pro.api.payment.get_payment_summary", {
+			"batch": random.choice(self.seed.batches)
+		})
+	
+	def build_search_students(self):
+		return ("GET", "/api/method/smspro.sms_pro.api.student_search.search_students", {
+			"query": f"test {random.randrange(len(self.seed.students))}"
+		})
+	
+	# Attendance operations
+	
+	def build_mark_attendance(self):
+		# Everyone is marked, the remaining traffic is re-marks and reads
+		if not self.to_mark:
+			return None
+		
+		student, batch = self.to_mark.pop()
+		self.marked.append((student, batch))
+		return ("POST", "/api/method/smspro.sms_pro.doctype.attendance.attendance.mark_attendance", {
+			"batch": batch,
+			"attendance_date": self.seed.date,
+			"attendance_list": [{"student": student, "status": get_attendance_status()}]
+		})
+	
+	def build_remark_attendance(self):
+		if not self.marked:
+			return None
+		
+		student, batch = random.choice(self.marked)
+		return ("PUT", f"/api/resource/Attendance/{student}-{batch}-{self.seed.date}", {
+			"status": get_attendance_status()
+		})
+	
+	def build_teacher_roster(self):
+		return ("GET", "/api/method/smspro.sms_pro.api.roster.get_teacher_roster", {"date": self.seed.date})
+	
+	def build_attendance_matrix(self):
+		return ("GET", "/api/method/smspro.sms_pro.api.attendance_matrix.get_attendance_matrix", {
+			"batch": random.choice(self.seed.batches)
+		})
+	
+	def get_report(self, elapsed):
+		operations = {}
+		totals = {"requests": 0}
+		
+		for operation, result in sorted(self.results.items()):
+			latencies = sorted(result["latencies"])
+			operations[operation] = {
+				"requests": len(latencies),
+				"outcomes": result["outcomes"],
+				"p50_ms": round(get_percentile(latencies, 50) * 1000, 1),
+				"p95_ms": round(get_percentile(latencies, 95) * 1000, 1),
+				"p99_ms": round(get_percentile(latencies, 99) * 1000, 1)
+			}
+			totals["requests"] += len(latencies)
+			for outcome, count in result["outcomes"].items():
+				totals[outcome] = totals.get(outcome, 0) + count
+		
+		requests = totals["requests"] or 1
+		return {
+			"scenario": self.seed.scenario,
+			"users": self.users,
+			"elapsed": round(elapsed, 1),
+			"throughput": round(totals["requests"] / elapsed, 1) if elapsed else 0,
+			"error_rate": round(totals.get("error", 0) / requests, 4),
+			"deadlock_rate": round(totals.get("deadlock", 0) / requests, 4),
+			"totals": totals,
+			"operations": operations
+		}
+
+
+def classify_response(status, body):
+	"""Classify a response as ok, rejected, deadlock, lock_timeout or error"""
+	if "Deadlock found" in body or "QueryDeadlockError" in body:
+		return "deadlock"
+	if "Lock wait timeout" in body or "QueryTimeoutError" in body:
+		return "lock_timeout"
+	
+	if status == 200:
+		# SMS Pro methods report failures in the message
+		if '"status": "error"' in body or '"status":"error"' in body:
+			return "error"
+		return "ok"
+	
+	if status in (409, 417) and any(exc in body for exc in REJECTED_EXCEPTIONS):
+		return "rejected"
+	
+	return "error"
+
+
+def get_attendance_status():
+	statuses, weights = zip(*ATTENDANCE_STATUSES, strict=True)
+	return random.choices(statuses, weights)[0]
+
+
+def get_percentile(values, percentile):
+	"""Nearest-rank percentile of sorted values"""
+	if not values:
+		return 0
+	
+	rank = max(1, -(-len(values) * percentile // 100))
+	return values[int(rank) - 1]
@@ -0,0 +1,243 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+"""
+Bulk email delivery over pooled SMTP connections
+
+`queue_emails(messages)` records each message as a Communication and enqueues
+delivery in batches. A batch job sends its messages from a small pool of
+threads, each reusing one SMTP connection for all of its messages and
+retrying transient failures with exponential backoff. Delivery status is
+written back to the Communications in bulk once the batch is done.
+
+The outgoing Email Account is used unless `smspro_smtp` is set in site
+config, e.g. to deliver into a local SMTP sink:
+
+	"smspro_smtp": {"host": "localhost", "port": 1025}
+	
+	python -m aiosmtpd -n -l localhost:1025
+"""
+
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+import frappe
+from frappe.utils import now_datetime
+
+# Messages per background job
+MAIL_BATCH_SIZE = 200
+
+# SMTP connections opened by one job
+MAIL_CONCURRENCY = 4
+
+# Retries of a transient failure, waiting MAIL_RETRY_BACKOFF * 2 ** attempt seconds
+MAIL_MAX_RETRIES = 3
+MAIL_RETRY_BACKOFF = 2
+
+SMTP_TIMEOUT = 30
+
+
+def queue_emails(messages, queue="long"):
+	"""
+	Record messages as Communications and enqueue their delivery
+	
+	Args:
+		messages: List of dicts with recipient, subject, content and optionally
+			sender, reference_doctype and reference_name
+		queue: Worker queue for the delivery jobs
+	
+	Returns the number of messages queued.
+	"""
+	if not messages:
+		return 0
+	
+	timestamp = now_datetime()
+	user = frappe.session.user
+	
+	for message in messages:
+		message["communication"] = frappe.generate_hash(length=10)
+	
+	frappe.db.bulk_insert(
+		"Communication",
+		fields=["name", "creation", "modified", "owner", "modified_by", "communication_date",
+				"communication_type", "communication_medium", "sent_or_received", "delivery_status",
+				"sender", "recipients", "subject", "content", "reference_doctype", "reference_name"],
+		values=[
+			(message["communication"], timestamp, timestamp, user, user, timestamp,
+			 "Communication", "Email", "Sent", "Sending",
+			 message.get("sender") or user, message["recipient"], message["subject"], message["content"],
+			 message.get("reference_doctype"), message.get("reference_name"))
+			for message in messages
+		]
+	)
+	
+	# Jobs are only picked up once the Communications they update are committed
+	for i in range(0, len(messages), MAIL_BATCH_SIZE):
+		frappe.enqueue(
+			"smspro.sms_pro.mailer.send_batch",
+			queue=queue,
+			enqueue_after_commit=True,
+			messages=[
+				{key: message.get(key) for key in ("communication", "recipient", "subject", "content")}
+				for message in messages[i:i + MAIL_BATCH_SIZE]
+			]
+		)
+	
+	return len(messages)
+
+
+def send_batch(messages, concurrency=MAIL_CONCURRENCY):
+	"""Background job: deliver a batch of messages over pooled SMTP connections"""
+	settings = get_smtp_settings()
+	
+	# One slice of the batch per connection
+	concurrency = max(1, min(concurrency, len(messages)))
+	slices = [messages[i::concurrency] for i in range(concurrency)]
+	
+	with ThreadPoolExecutor(max_workers=concurrency) as pool:
+		results = [result for slice_results in pool.map(lambda s: deliver(settings, s), slices)
+				   for result in slice_results]
+	
+	sent = [communication for communication, error in results if not error]
+	failed = [(communication, error) for communication, error in results if error]
+	
+	if sent:
+		frappe.db.sql("""
+			UPDATE `tabCommunication`
+			SET delivery_status = 'Sent'
+			WHERE name IN %(names)s
+		""", {"names": tuple(sent)})
+	
+	if failed:
+		frappe.db.sql("""
+			UPDATE `tabCommunication`
+			SET delivery_status = 'Error'
+			WHERE name IN %(names)s
+		""", {"names": tuple(communication for communication, _error in failed)})
+		frappe.log_error(
+			"\n".join(f"{communication}: {error}" for communication, error in failed),
+			"Bulk Email Delivery Error"
+		)
+	
+	frappe.db.commit()
+	
+	return {"sent": len(sent), "failed": len(failed)}
+
+
+def deliver(settings, messages):
+	"""
+	Send messages one after another over a single reused SMTP connection
+	
+	Runs in a pool thread, so it must not touch the database.
+	"""
+	connection = SMTPConnection(settings)
+	results = []
+	
+	try:
+		for message in messages:
+			results.append((message["communication"], connection.send(build_message(settings, message))))
+	finally:
+		connection.close()
+	
+	return results
+
+
+def build_message(settings, message):
+	email = EmailMessage()
+	email["From"] = settings.sender
+	email["To"] = message["recipient"]
+	email["Subject"] = message["subject"]
+	email["Date"] = formatdate(localtime=True)
+	email["Message-ID"] = make_msgid(domain=settings.host)
+	email.set_content(message["content"])
+	return email
+
+
+class SMTPConnection:
+	"""An SMTP connection that is opened lazily and reopened after failures"""
+	
+	def __init__(self, settings):
+		self.settings = settings
+		self.smtp = None
+	
+	def connect(self):
+		settings = self.settings
+		if settings.use_ssl:
+			self.smtp = smtplib.SMTP_SSL(settings.host, settings.port, timeout=SMTP_TIMEOUT)
+		else:
+			self.smtp = smtplib.SMTP(settings.host, settings.port, timeout=SMTP_TIMEOUT)
+		
+		try:
+			if settings.use_tls and not settings.use_ssl:
+				self.smtp.starttls()
+			if settings.login and settings.password:
+				self.smtp.login(settings.login, settings.password)
+		except Exception:
+			# Later messages must reconnect, not reuse a half-open connection
+			self.close()
+			raise
+	
+	def send(self, email):
+		"""Send one message, returning None on success or the error message"""
+		for attempt in range(MAIL_MAX_RETRIES + 1):
+			try:
+				if not self.smtp:
+					self.connect()
+				self.smtp.send_message(email)
+				return None
+			
+			except smtplib.SMTPRecipientsRefused as e:
+				# Permanent for this message, the connection is still usable
+				return str(e)
+			
+			except smtplib.SMTPResponseException as e:
+				if e.smtp_code >= 500:
+					return str(e)
+				error = e
+			
+			except (smtplib.SMTPException, OSError) as e:
+				error = e
+			
+			self.close()
+			if attempt < MAIL_MAX_RETRIES:
+				time.sleep(MAIL_RETRY_BACKOFF * 2 ** attempt)
+		
+		return str(error)
+	
+	def close(self):
+		if not self.smtp:
+			return
+		
+		try:
+			self.smtp.quit()
+		except (smtplib.SMTPException, OSError):
+			pass
+		
+		self.smtp = None
+
+
+def get_smtp_settings():
+	"""Get SMTP settings from `smspro_smtp` in site config or the outgoing Email Account"""
+	conf = frappe.conf.get("smspro_smtp")
+	if conf:
+		settings = frappe._dict(conf)
+		settings.setdefault("port", 25)
+		settings.setdefault("sender", "SMS Pro <noreply@localhost>")
+		return settings
+	
+	from frappe.email.smtp import get_outgoing_email_account
+	
+	account = get_outgoing_email_account(raise_exception_not_set=True)
+	
+	return frappe._dict({
+		"host": account.smtp_server,
+		"port": int(account.smtp_port or (465 if account.get("use_ssl_for_outgoing") else 25)),
+		"use_ssl": account.get("use_ssl_for_outgoing"),
+		"use_tls": account.get("use_tls"),
+		"login": None if account.get("no_smtp_authentication") else (account.get("login_id") or account.email_id),
+		"password": None if account.get("no_smtp_authentication") else account.get_password(raise_exception=False),
+		"sender": account.email_id
+	})
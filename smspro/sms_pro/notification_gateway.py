@@ -0,0 +1,425 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+"""
+SMS and Zalo notification gateway
+
+`send_notifications(messages)` records each message in SMS Notification Log
+under an idempotency key and enqueues delivery in batches. A batch job sends
+its messages concurrently from one asyncio event loop, with one pooled HTTP
+session and one rate limiter per provider. Transient failures are retried
+with backoff, always under the same idempotency key, so a message is
+recorded once and never sent again once it is Sent.
+
+Providers are configured per channel in site config:
+
+	"smspro_notification_providers": {
+		"SMS": {"provider": "http", "url": "https://sms.example.vn/send", "api_key": "...",
+			"sender": "SMSPRO", "rate_limit": 20, "max_connections": 10},
+		"Zalo": {"provider": "zalo", "access_token": "...", "template_id": "...", "rate_limit": 10}
+	}
+
+Point a channel's url at `bench notification-stub` to test against a local
+stub provider.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+
+import frappe
+from frappe.utils import now_datetime
+
+from smspro.sms_pro.jobs import scheduled_job
+
+# Messages per background job
+NOTIFICATION_BATCH_SIZE = 500
+
+# Send attempts per message, in-process retries and later retry runs combined
+NOTIFICATION_MAX_ATTEMPTS = 5
+
+# Wait NOTIFICATION_RETRY_BACKOFF * 2 ** attempt seconds between in-process retries
+NOTIFICATION_RETRY_BACKOFF = 1
+NOTIFICATION_INLINE_RETRIES = 2
+
+HTTP_TIMEOUT = 15
+
+CHANNELS = ("SMS", "Zalo")
+
+
+class TransientError(Exception):
+	"""A failure worth retrying: network errors, throttling and 5xx responses"""
+
+
+class RateLimiter:
+	"""Spaces requests evenly to at most `rate` per second"""
+	
+	def __init__(self, rate):
+		self.interval = 1 / rate if rate else 0
+		self.next_at = 0
+		self.lock = asyncio.Lock()
+	
+	async def wait(self):
+		if not self.interval:
+			return
+		
+		loop = asyncio.get_running_loop()
+		async with self.lock:
+			now = loop.time()
+			delay = self.next_at - now
+			self.next_at = max(now, self.next_at) + self.interval
+		
+		if delay > 0:
+			await asyncio.sleep(delay)
+
+
+class Provider:
+	"""
+	Generic JSON-over-HTTP SMS provider
+	
+	Posts {"to", "text", "sender"} to the configured url with the API key as a
+	bearer token and the idempotency key in an Idempotency-Key header, and
+	reads the provider message id from "id" or "message_id".
+	"""
+	
+	def __init__(self, channel, config):
+		self.channel = channel
+		self.config = frappe._dict(config)
+		self.limiter = RateLimiter(self.config.get("rate_limit") or 10)
+		self.session = None
+	
+	async def open(self):
+		import aiohttp
+		
+		self.session = aiohttp.ClientSession(
+			connector=aiohttp.TCPConnector(limit=self.config.get("max_connections") or 10),
+			timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+		)
+	
+	async def close(self):
+		if self.session:
+			await self.session.close()
+			self.session = None
+	
+	def build_request(self, row):
+		headers = {"Idempotency-Key": row.idempotency_key}
+		if self.config.get("api_key"):
+			headers["Authorization"] = f"Bearer {self.config.api_key}"
+		
+		payload = {"to": row.recipient, "text": row.message, "sender": self.config.get("sender")}
+		return self.config.url, payload, headers
+	
+	def get_message_id(self, body):
+		return body.get("id") or body.get("message_id")
+	
+	async def send(self, row):
+		"""Send one message and return the provider message id"""
+		import aiohttp
+		
+		url, payload, headers = self.build_request(row)
+		
+		await self.limiter.wait()
+		try:
+			async with self.session.post(url, json=payload, headers=headers) as response:
+				# Throttling and gateway errors often come with an HTML or plain text body
+				if response.status == 429 or response.status >= 500:
+					raise TransientError(f"HTTP {response.status}")
+				if response.status >= 400:
+					raise frappe.ValidationError(f"HTTP {response.status}: {await response.text()}")
+				
+				body = await response.json(content_type=None) if response.content_length != 0 else {}
+		
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			raise TransientError(str(e) or type(e).__name__)
+		
+		except ValueError as e:
+			# An accepted request with an unreadable body, resending under the same key is safe
+			raise TransientError(f"Invalid response body: {e}")
+		
+		return self.get_message_id(body or {})
+
+
+class ZaloProvider(Provider):
+	"""Zalo Notification Service (ZNS) template messages"""
+	
+	ZNS_URL = "https://business.openapi.zalo.me/message/template"
+	
+	def build_request(self, row):
+		headers = {"access_token": self.config.access_token}
+		payload = {
+			"phone": row.recipient,
+			"template_id": self.config.template_id,
+			"template_data": json.loads(row.template_data) if row.template_data else {"message": row.message},
+			# ZNS deduplicates on tracking_id
+			"tracking_id": row.idempotency_key
+		}
+		return self.config.get("url") or self.ZNS_URL, payload, headers
+	
+	def get_message_id(self, body):
+		if body.get("error"):
+			raise frappe.ValidationError(f"Zalo error {body.get('error')}: {body.get('message')}")
+		
+		return (body.get("data") or {}).get("msg_id")
+
+
+PROVIDER_TYPES = {
+	"http": Provider,
+	"zalo": ZaloProvider
+}
+
+
+def get_provider_config(channel):
+	return (frappe.conf.get("smspro_notification_providers") or {}).get(channel)
+
+
+def is_channel_enabled(channel):
+	return bool(get_provider_config(channel))
+
+
+def get_provider(channel):
+	config = get_provider_config(channel)
+	if not config:
+		frappe.throw(f"No notification provider configured for {channel}")
+	
+	return PROVIDER_TYPES[config.get("provider") or "http"](channel, config)
+
+
+def normalize_phone(phone):
+	"""Normalize a Vietnamese phone number to the international 84xxxxxxxxx form"""
+	digits = re.sub(r"\D", "", phone or "")
+	
+	if digits.startswith("0"):
+		digits = "84" + digits[1:]
+	
+	return digits or None
+
+
+def get_idempotency_key(message):
+	if message.get("idempotency_key"):
+		return message["idempotency_key"]
+	
+	source = "|".join(str(message.get(key) or "") for key in (
+		"channel", "recipient", "message", "reference_doctype", "reference_name"
+	))
+	return hashlib.sha256(source.encode()).hexdigest()
+
+
+def send_notifications(messages, queue="long"):
+	"""
+	Record SMS/Zalo messages and enqueue their delivery
+	
+	Args:
+		messages: List of dicts with channel, recipient and message, and
+			optionally student, template_data, reference_doctype,
+			reference_name and idempotency_key (derived from the content if
+			not given)
+		queue: Worker queue for the delivery jobs
+	
+	Returns the number of messages queued. Messages whose idempotency key
+	was already recorded are skipped.
+	"""
+	rows = {}
+	for message in messages:
+		recipient = normalize_phone(message.get("recipient"))
+		if not recipient or message.get("channel") not in CHANNELS:
+			continue
+		
+		message = dict(message, recipient=recipient)
+		rows[get_idempotency_key(message)] = message
+	
+	if not rows:
+		return 0
+	
+	# The unique idempotency key turns repeated sends into no-ops
+	existing = set(frappe.db.sql_list("""
+		SELECT idempotency_key
+		FROM `tabSMS Notification Log`
+		WHERE idempotency_key IN %(keys)s
+	""", {"keys": tuple(rows)}))
+	
+	timestamp = now_datetime()
+	user = frappe.session.user
+	names = []
+	values = []
+	for key, message in rows.items():
+		if key in existing:
+			continue
+		
+		name = frappe.generate_hash(length=10)
+		names.append(name)
+		
+		template_data = message.get("template_data")
+		values.append((
+			name, timestamp, timestamp, user, user, message["channel"], message["recipient"],
+			message.get("student"), message.get("message"),
+			json.dumps(template_data) if template_data else None,
+			"Queued", key, 0, message.get("reference_doctype"), message.get("reference_name")
+		))
+	
+	if values:
+		frappe.db.bulk_insert(
+			"SMS Notification Log",
+			fields=["name", "creation", "modified", "owner", "modified_by", "channel", "recipient",
+					"student", "message", "template_data", "status", "idempotency_key", "attempts",
+					"reference_doctype", "reference_name"],
+			values=values,
+			ignore_duplicates=True
+		)
+	
+	enqueue_delivery(names, queue=queue)
+	return len(names)
+
+
+def enqueue_delivery(names, queue="long"):
+	for i in range(0, len(names), NOTIFICATION_BATCH_SIZE):
+		frappe.enqueue(
+			"smspro.sms_pro.notification_gateway.send_batch",
+			queue=queue,
+			enqueue_after_commit=True,
+			names=names[i:i + NOTIFICATION_BATCH_SIZE]
+		)
+
+
+def send_batch(names):
+	"""Background job: send a batch of logged notifications"""
+	rows = frappe.db.sql("""
+		SELECT name, channel, recipient, message, template_data, idempotency_key, attempts
+		FROM `tabSMS Notification Log`
+		WHERE name IN %(names)s
+		AND status IN ('Queued', 'Failed')
+		AND attempts < %(max_attempts)s
+	""", {"names": tuple(names), "max_attempts": NOTIFICATION_MAX_ATTEMPTS}, as_dict=True)
+	
+	if not rows:
+		return
+	
+	# Claim the rows so an overlapping retry run leaves them alone
+	frappe.db.sql("""
+		UPDATE `tabSMS Notification Log`
+		SET status = 'Sending', modified = NOW()
+		WHERE name IN %(names)s
+	""", {"names": tuple(row.name for row in rows)})
+	frappe.db.commit()
+	
+	providers = {}
+	for channel in {row.channel for row in rows}:
+		if is_channel_enabled(channel):
+			providers[channel] = get_provider(channel)
+	
+	results = asyncio.run(dispatch(rows, providers))
+	
+	sent_on = now_datetime()
+	for row, (status, provider_message_id, error, attempts) in zip(rows, results, strict=True):
+		frappe.db.sql("""
+			UPDATE `tabSMS Notification Log`
+			SET status = %s, provider_message_id = %s, error = %s, attempts = %s, sent_on = %s, modified = NOW()
+			WHERE name = %s
+		""", (status, provider_message_id, error, attempts, sent_on if status == "Sent" else None, row.name))
+	
+	frappe.db.commit()
+
+
+async def dispatch(rows, providers):
+	"""Send rows concurrently, each provider bounded by its pool size and rate limit"""
+	for provider in providers.values():
+		await provider.open()
+	
+	try:
+		return await asyncio.gather(*(send_with_retry(providers.get(row.channel), row) for row in rows))
+	finally:
+		for provider in providers.values():
+			await provider.close()
+
+
+async def send_with_retry(provider, row):
+	"""Send one row, returning (status, provider_message_id, error, attempts)"""
+	attempts = row.attempts or 0
+	
+	if not provider:
+		return "Failed", None, f"No notification provider configured for {row.channel}", NOTIFICATION_MAX_ATTEMPTS
+	
+	for retry in range(NOTIFICATION_INLINE_RETRIES + 1):
+		attempts += 1
+		try:
+			return "Sent", await provider.send(row), None, attempts
+		
+		except TransientError as e:
+			error = str(e)
+		
+		except Exception as e:
+			# Rejected by the provider, retrying will not help
+			return "Failed", None, str(e), NOTIFICATION_MAX_ATTEMPTS
+		
+		if retry < NOTIFICATION_INLINE_RETRIES and attempts < NOTIFICATION_MAX_ATTEMPTS:
+			await asyncio.sleep(NOTIFICATION_RETRY_BACKOFF * 2 ** retry)
+		else:
+			break
+	
+	return "Failed", None, error, attempts
+
+
+@scheduled_job()
+def retry_notifications():
+	"""Re-enqueue notifications that failed transiently or were left Queued or Sending (hourly via scheduler)"""
+	# Rows stuck in Sending belong to a job that died mid-batch
+	frappe.db.sql("""
+		UPDATE `tabSMS Notification Log`
+		SET status = 'Failed'
+		WHERE status = 'Sending'
+		AND modified < NOW() - INTERVAL 1 HOUR
+	""")
+	
+	# Recently queued rows still have a delivery job pending
+	names = frappe.db.sql_list("""
+		SELECT name
+		FROM `tabSMS Notification Log`
+		WHERE (status = 'Failed' OR (status = 'Queued' AND modified < NOW() - INTERVAL 1 HOUR))
+		AND attempts < %s
+		ORDER BY creation
+	""", (NOTIFICATION_MAX_ATTEMPTS,))
+	
+	if not names:
+		return
+	
+	# Mark them queued again so the next run leaves them to the job enqueued here
+	frappe.db.sql("""
+		UPDATE `tabSMS Notification Log`
+		SET status = 'Queued', modified = NOW()
+		WHERE name IN %(names)s
+	""", {"names": tuple(names)})
+	
+	enqueue_delivery(names)
+
+
+def run_stub_provider(port=8765, fail_rate=0.0):
+	"""
+	Run a local stub SMS provider for testing
+	
+	Accepts the generic provider's requests on POST /send, answers with a
+	message id that is stable per Idempotency-Key, and fails a share of
+	requests with 503 to exercise retries.
+	"""
+	import random
+	import uuid
+	
+	import click
+	from aiohttp import web
+	
+	sent = {}
+	
+	async def send(request):
+		if fail_rate and random.random() < fail_rate:
+			return web.json_response({"error": "unavailable"}, status=503)
+		
+		payload = await request.json()
+		key = request.headers.get("Idempotency-Key") or str(uuid.uuid4())
+		if key not in sent:
+			sent[key] = str(uuid.uuid4())
+			click.echo(f"{payload.get('to')}: {payload.get('text')}")
+		
+		return web.json_response({"id": sent[key]})
+	
+	app = web.Application()
+	app.router.add_post("/send", send)
+	web.run_app(app, port=port)
@@ -0,0 +1,162 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+"""
+Read-replica routing for read-only entry points
+
+Dashboard, summary and report functions are marked with `@read_only()`. When
+`read_from_replica` and `replica_host` are set in site config, their queries
+run on the replica connection instead of the primary:
+
+	{"read_from_replica": 1, "replica_host": "10.0.0.12", "replica_db_port": 3307,
+		"replica_max_lag": 30}
+
+The replica connection is opened on first use and shared by all read-only
+calls of the request or job, and closed by the after_request and after_job
+hooks. The replica is checked with SHOW SLAVE STATUS at most every
+REPLICA_CHECK_TTL seconds. Reads stay on the primary while the replica is
+unreachable, not replicating, or more than `replica_max_lag` seconds behind.
+The database user needs the REPLICATION CLIENT (SLAVE MONITOR on MariaDB
+10.5+) privilege on the replica for the check.
+"""
+
+import functools
+from contextlib import contextmanager
+
+import frappe
+
+# Seconds of replication lag above which reads go to the primary
+REPLICA_MAX_LAG = 30
+
+# Seconds a replica check result is reused
+REPLICA_CHECK_TTL = 10
+
+REPLICA_STATUS_KEY = "smspro:replica_status"
+
+
+def read_only():
+	"""Run the decorated function's queries on the replica when it is healthy"""
+	def decorator(fn):
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs):
+			with replica_reads():
+				return fn(*args, **frappe.get_newargs(fn, kwargs))
+		
+		return wrapper
+	
+	return decorator
+
+
+@contextmanager
+def replica_reads():
+	"""Point frappe.db at the replica for the block, or keep the primary"""
+	if not frappe.conf.read_from_replica or not frappe.conf.replica_host or frappe.flags.smspro_replica_routed:
+		yield
+		return
+	
+	current = frappe.local.db
+	# Frappe's own read_only (query reports) may already have swapped to its replica
+	primary = getattr(frappe.local, "primary_db", None) or current
+	read_only = frappe.flags.read_only
+	
+	replica = None
+	if get_replica_status().get("healthy"):
+		replica = current if current is not primary else get_replica_db()
+	
+	frappe.local.db = replica or primary
+	frappe.flags.smspro_replica_routed = True
+	# Errors logged on the replica are inserted later instead of written to it
+	frappe.flags.read_only = bool(replica) or read_only
+	
+	try:
+		yield
+	finally:
+		frappe.flags.smspro_replica_routed = False
+		frappe.flags.read_only = read_only
+		frappe.local.db = current
+
+
+def get_replica_db():
+	"""Get the replica connection of the current request or job, connecting on first use"""
+	db = getattr(frappe.local, "smspro_replica_db", None)
+	if db is None:
+		db = frappe.local.smspro_replica_db = connect_replica()
+	
+	return db
+
+
+def close_replica():
+	"""Close the replica connection of the request or job (after_request and after_job hook)"""
+	db = getattr(frappe.local, "smspro_replica_db", None)
+	if db is None:
+		return
+	
+	frappe.local.smspro_replica_db = None
+	try:
+		db.close()
+	except Exception:
+		pass
+
+
+def connect_replica():
+	"""Open a connection to the replica, or return None if it is unreachable"""
+	from frappe.database import get_db
+	
+	conf = frappe.conf
+	user, password = conf.db_name, conf.db_password
+	if conf.different_credentials_for_replica:
+		user, password = conf.replica_db_name, conf.replica_db_password
+	
+	try:
+		db = get_db(host=conf.replica_host, port=conf.replica_db_port, user=user, password=password)
+		db.connect()
+		return db
+	except Exception:
+		# Don't try again until the next check
+		frappe.cache.set_value(
+			REPLICA_STATUS_KEY,
+			{"healthy": False, "lag": None, "reason": "unreachable"},
+			expires_in_sec=REPLICA_CHECK_TTL
+		)
+		return None
+
+
+def get_replica_status():
+	"""Get the cached replica health, checking the replica when it has expired"""
+	status = frappe.cache.get_value(REPLICA_STATUS_KEY)
+	
+	if status is None:
+		status = check_replica()
+		frappe.cache.set_value(REPLICA_STATUS_KEY, status, expires_in_sec=REPLICA_CHECK_TTL)
+	
+	return status
+
+
+def check_replica():
+	"""Check the replica's replication state and lag"""
+	max_lag = frappe.conf.get("replica_max_lag") or REPLICA_MAX_LAG
+	
+	db = connect_replica()
+	if not db:
+		return {"healthy": False, "lag": None, "reason": "unreachable"}
+	
+	try:
+		status = db.sql("SHOW SLAVE STATUS", as_dict=True)
+	except Exception as e:
+		return {"healthy": False, "lag": None, "reason": str(e)}
+	finally:
+		db.close()
+	
+	if not status:
+		return {"healthy": False, "lag": None, "reason": "not a replica"}
+	
+	status = status[0]
+	lag = status.get("Seconds_Behind_Master")
+	
+	if status.get("Slave_IO_Running") != "Yes" or status.get("Slave_SQL_Running") != "Yes" or lag is None:
+		return {"healthy": False, "lag": lag, "reason": "replication stopped"}
+	
+	if lag > max_lag:
+		return {"healthy": False, "lag": lag, "reason": f"lag over {max_lag}s"}
+	
+	return {"healthy": True, "lag": lag, "reason": None}
@@ -3,10 +3,21 @@
 
 import frappe
 from frappe import _
+from frappe.utils import flt
 
+from smspro.sms_pro.api.prepared_report import get_prepared_result
+from smspro.sms_pro.doctype.attendance_archive.attendance_archive import get_attendance_source
+from smspro.sms_pro.replica import read_only
 
+
+@read_only()
 def execute(filters=None):
 	columns = get_columns()
+	
+	# Prepared mode answers from the cached result or queues a background run
+	if filters and filters.get("prepared"):
+		return get_prepared_result("Attendance Report", filters, columns)
+	
 	data = get_data(filters)
 	
 	chart = get_chart_data(data)
@@ -95,7 +106,25 @@ def get_columns():
 
 
 def get_data(filters):
-	conditions = get_conditions(filters)
+	query, values = get_query(filters)
+	
+	return frappe.db.sql(query, values, as_dict=True)
+
+
+def iter_data(filters):
+	"""Stream report rows from an unbuffered server-side cursor"""
+	query, values = get_query(filters)
+	
+	with frappe.db.unbuffered_cursor():
+		yield from frappe.db.sql(query, values, as_dict=True, as_iterator=True)
+
+
+def get_query(filters):
+	filters = filters or {}
+	conditions, having, values = get_conditions(filters)
+	
+	# Archived attendance is only read when the date range or batch reaches it
+	source = get_attendance_source(filters.get("from_date"), filters.get("batch"))
 	
 	# Get unique students with their attendance summary
 	query = f"""
@@ -114,38 +143,41 @@ def get_data(filters):
 			ROUND(
 				(SUM(CASE WHEN a.status = 'Present' THEN 1 ELSE 0 END) / COUNT(a.name)) * 100, 2
 			) as attendance_rate
-		FROM `tabAttendance` a
+		FROM {source} a
 		WHERE a.docstatus != 2
 		{conditions}
 		GROUP BY a.student, a.batch, a.course
+		{having}
 		ORDER BY attendance_rate DESC, a.student_name
 	"""
 	
-	return frappe.db.sql(query, as_dict=True)
+	return query, values
 
 
 def get_conditions(filters):
 	conditions = ""
+	having = ""
+	values = {}
 	
-	if filters.get("student"):
-		conditions += f" AND a.student = '{filters['student']}'"
-	
-	if filters.get("batch"):
-		conditions += f" AND a.batch = '{filters['batch']}'"
-	
-	if filters.get("course"):
-		conditions += f" AND a.course = '{filters['course']}'"
+	for field in ("student", "batch", "course"):
+		if filters.get(field):
+			conditions += f" AND a.{field} = %({field})s"
+			values[field] = filters[field]
 	
 	if filters.get("from_date"):
-		conditions += f" AND a.attendance_date >= '{filters['from_date']}'"
+		conditions += " AND a.attendance_date >= %(from_date)s"
+		values["from_date"] = filters["from_date"]
 	
 	if filters.get("to_date"):
-		conditions += f" AND a.attendance_date <= '{filters['to_date']}'"
+		conditions += " AND a.attendance_date <= %(to_date)s"
+		values["to_date"] = filters["to_date"]
 	
+	# Aggregate filters belong in HAVING
 	if filters.get("min_attendance_rate"):
-		conditions += f" AND ROUND((SUM(CASE WHEN a.status = 'Present' THEN 1 ELSE 0 END) / COUNT(a.name)) * 100, 2) >= {filters['min_attendance_rate']}"
+		having = "HAVING attendance_rate >= %(min_attendance_rate)s"
+		values["min_attendance_rate"] = flt(filters["min_attendance_rate"])
 	
-	return conditions
+	return conditions, having, values
 
 
 def get_chart_data(data):
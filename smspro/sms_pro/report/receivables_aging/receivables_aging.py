@@ -0,0 +1,168 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, flt, getdate, today
+
+from smspro.sms_pro.doctype.receivables_aging_snapshot.receivables_aging_snapshot import get_snapshot_date
+from smspro.sms_pro.replica import read_only
+
+BUCKETS = [
+	("not_due", "Not Due"),
+	("bucket_0_30", "0-30"),
+	("bucket_31_60", "31-60"),
+	("bucket_61_90", "61-90"),
+	("bucket_90_plus", "90+")
+]
+
+GROUP_FIELDS = {
+	"Student": ("student", "student_name", "Student"),
+	"Batch": ("batch", "batch_name", "Batch"),
+	"Course": ("course", "course_name", "Course")
+}
+
+
+@read_only()
+def execute(filters=None):
+	filters = frappe._dict(filters or {})
+	
+	snapshot_date = get_snapshot_date(filters.get("snapshot_date") or today())
+	if not snapshot_date:
+		frappe.msgprint(_("No aging snapshot has been built yet"))
+		return get_columns(filters), []
+	
+	columns = get_columns(filters)
+	data = get_data(filters, snapshot_date)
+	
+	if filters.get("compare_previous_week"):
+		add_previous_week(data, filters, snapshot_date)
+	
+	chart = get_chart_data(data)
+	
+	return columns, data, None, chart
+
+
+def get_columns(filters):
+	group_field, name_field, doctype = GROUP_FIELDS[filters.get("group_by") or "Student"]
+	
+	columns = [
+		{
+			"fieldname": group_field,
+			"label": _(doctype),
+			"fieldtype": "Link",
+			"options": doctype,
+			"width": 150
+		},
+		{
+			"fieldname": name_field,
+			"label": _("{0} Name").format(_(doctype)),
+			"fieldtype": "Data",
+			"width": 180
+		}
+	]
+	
+	for fieldname, label in BUCKETS:
+		columns.append({
+			"fieldname": fieldname,
+			"label": _(label),
+			"fieldtype": "Currency",
+			"width": 120
+		})
+	
+	columns.append({
+		"fieldname": "total_outstanding",
+		"label": _("Total Outstanding"),
+		"fieldtype": "Currency",
+		"width": 140
+	})
+	
+	if filters.get("compare_previous_week"):
+		columns.extend([
+			{
+				"fieldname": "previous_week_outstanding",
+				"label": _("Previous Week"),
+				"fieldtype": "Currency",
+				"width": 140
+			},
+			{
+				"fieldname": "change",
+				"label": _("Change"),
+				"fieldtype": "Currency",
+				"width": 120
+			}
+		])
+	
+	return columns
+
+
+def get_data(filters, snapshot_date):
+	group_field, name_field, _doctype = GROUP_FIELDS[filters.get("group_by") or "Student"]
+	conditions, values = get_conditions(filters)
+	values["snapshot_date"] = snapshot_date
+	
+	bucket_columns = ",\n".join(
+		f"SUM(CASE WHEN aging_bucket = '{label}' THEN outstanding_amount ELSE 0 END) as {fieldname}"
+		for fieldname, label in BUCKETS
+	)
+	
+	return frappe.db.sql(f"""
+		SELECT
+			{group_field},
+			MAX({name_field}) as {name_field},
+			{bucket_columns},
+			SUM(outstanding_amount) as total_outstanding
+		FROM `tabReceivables Aging Snapshot`
+		WHERE snapshot_date = %(snapshot_date)s
+		{conditions}
+		GROUP BY {group_field}
+		ORDER BY total_outstanding DESC
+	""", values, as_dict=True)
+
+
+def get_conditions(filters):
+	conditions = ""
+	values = {}
+	
+	for field in ("student", "batch", "course"):
+		if filters.get(field):
+			conditions += f" AND {field} = %({field})s"
+			values[field] = filters[field]
+	
+	return conditions, values
+
+
+def add_previous_week(data, filters, snapshot_date):
+	"""Add the outstanding total from the retained snapshot a week earlier"""
+	previous_date = get_snapshot_date(add_days(getdate(snapshot_date), -7))
+	group_field = GROUP_FIELDS[filters.get("group_by") or "Student"][0]
+	
+	previous = {}
+	if previous_date:
+		previous = {
+			row[group_field]: row.total_outstanding
+			for row in get_data(filters, previous_date)
+		}
+	
+	for row in data:
+		row.previous_week_outstanding = flt(previous.get(row[group_field]))
+		row.change = flt(row.total_outstanding) - row.previous_week_outstanding
+
+
+def get_chart_data(data):
+	# Outstanding by aging bucket
+	totals = [sum(flt(row.get(fieldname)) for row in data) for fieldname, _label in BUCKETS]
+	
+	chart = {
+		"data": {
+			"labels": [label for _fieldname, label in BUCKETS],
+			"datasets": [{
+				"name": "Outstanding",
+				"values": totals
+			}]
+		},
+		"type": "bar",
+		"colors": ["#28a745", "#20c997", "#ffc107", "#fd7e14", "#dc3545"]
+	}
+	
+	return chart
@@ -4,9 +4,18 @@
 import frappe
 from frappe import _
 
+from smspro.sms_pro.api.prepared_report import get_prepared_result
+from smspro.sms_pro.replica import read_only
 
+
+@read_only()
 def execute(filters=None):
 	columns = get_columns()
+	
+	# Prepared mode answers from the cached result or queues a background run
+	if filters and filters.get("prepared"):
+		return get_prepared_result("Student Payment Report", filters, columns)
+	
 	data = get_data(filters)
 	
 	chart = get_chart_data(data)
@@ -95,7 +104,21 @@ def get_columns():
 
 
 def get_data(filters):
-	conditions = get_conditions(filters)
+	query, values = get_query(filters)
+	
+	return frappe.db.sql(query, values, as_dict=True)
+
+
+def iter_data(filters):
+	"""Stream report rows from an unbuffered server-side cursor"""
+	query, values = get_query(filters)
+	
+	with frappe.db.unbuffered_cursor():
+		yield from frappe.db.sql(query, values, as_dict=True, as_iterator=True)
+
+
+def get_query(filters):
+	conditions, values = get_conditions(filters or {})
 	
 	query = f"""
 		SELECT 
@@ -110,41 +133,49 @@ def get_data(filters):
 			se.paid_amount,
 			se.outstanding_amount,
 			se.payment_status,
-			se.last_payment_date
+			(
+				-- Same rule as get_payment_totals: only payments not reversed in full count
+				SELECT MAX(pl.posting_date)
+				FROM `tabSMS Payment Ledger` pl
+				WHERE pl.student_enrollment = se.name
+				AND pl.entry_type = 'Payment'
+				AND (
+					SELECT SUM(net.amount)
+					FROM `tabSMS Payment Ledger` net
+					WHERE net.student_enrollment = se.name
+					AND net.payment_entry = pl.payment_entry
+				) > 0
+			) as last_payment_date
 		FROM `tabStudent Enrollment` se
 		WHERE se.docstatus != 2
 		{conditions}
 		ORDER BY se.enrollment_date DESC
 	"""
 	
-	return frappe.db.sql(query, as_dict=True)
+	return query, values
 
 
 def get_conditions(filters):
 	conditions = ""
+	values = {}
 	
-	if filters.get("student"):
-		conditions += f" AND se.student = '{filters['student']}'"
-	
-	if filters.get("course"):
-		conditions += f" AND se.course = '{filters['course']}'"
-	
-	if filters.get("batch"):
-		conditions += f" AND se.batch = '{filters['batch']}'"
-	
-	if filters.get("payment_status"):
-		conditions += f" AND se.payment_status = '{filters['payment_status']}'"
+	for field in ("student", "course", "batch", "payment_status"):
+		if filters.get(field):
+			conditions += f" AND se.{field} = %({field})s"
+			values[field] = filters[field]
 	
 	if filters.get("from_date"):
-		conditions += f" AND se.enrollment_date >= '{filters['from_date']}'"
+		conditions += " AND se.enrollment_date >= %(from_date)s"
+		values["from_date"] = filters["from_date"]
 	
 	if filters.get("to_date"):
-		conditions += f" AND se.enrollment_date <= '{filters['to_date']}'"
+		conditions += " AND se.enrollment_date <= %(to_date)s"
+		values["to_date"] = filters["to_date"]
 	
 	if filters.get("outstanding_only"):
 		conditions += " AND se.outstanding_amount > 0"
 	
-	return conditions
+	return conditions, values
 
 
 def get_chart_data(data):
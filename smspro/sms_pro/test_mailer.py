@@ -0,0 +1,163 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import smtplib
+from typing import ClassVar
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from smspro.sms_pro import mailer
+
+SINK_SETTINGS = frappe._dict({"host": "localhost", "port": 1025, "sender": "SMS Pro <noreply@localhost>"})
+LOGIN_SETTINGS = frappe._dict({**SINK_SETTINGS, "login": "mailer", "password": "secret"})
+
+
+class SinkSMTP:
+	"""SMTP sink recording connections and messages, failing on marked recipients"""
+	
+	connections: ClassVar[list] = []
+	dropped: ClassVar[set] = set()
+	requires_login = False
+	login_failures = 0
+	
+	def __init__(self, host, port, timeout=None):
+		self.host = host
+		self.port = port
+		self.sent = []
+		self.closed = False
+		self.logged_in = False
+		SinkSMTP.connections.append(self)
+	
+	def login(self, user, password):
+		if SinkSMTP.login_failures:
+			SinkSMTP.login_failures -= 1
+			raise smtplib.SMTPAuthenticationError(535, b"Authentication failed")
+		
+		self.logged_in = True
+	
+	def send_message(self, email):
+		recipient = email["To"]
+		
+		if SinkSMTP.requires_login and not self.logged_in:
+			raise smtplib.SMTPSenderRefused(530, b"Authentication required", email["From"])
+		if recipient.startswith("refused"):
+			raise smtplib.SMTPRecipientsRefused({recipient: (550, b"No such user")})
+		if recipient.startswith("rejected"):
+			raise smtplib.SMTPDataError(554, b"Message rejected")
+		if recipient.startswith("flaky") and recipient not in SinkSMTP.dropped:
+			SinkSMTP.dropped.add(recipient)
+			raise smtplib.SMTPServerDisconnected("Connection dropped")
+		if recipient.startswith("down"):
+			raise smtplib.SMTPServerDisconnected("Connection dropped")
+		
+		self.sent.append(recipient)
+	
+	def quit(self):
+		self.closed = True
+
+
+def make_messages(*recipients):
+	return [
+		{"communication": f"COMM-{i}", "recipient": recipient, "subject": "Reminder", "content": "Due"}
+		for i, recipient in enumerate(recipients)
+	]
+
+
+@patch("smspro.sms_pro.mailer.time.sleep", MagicMock())
+@patch("smspro.sms_pro.mailer.smtplib.SMTP", SinkSMTP)
+class TestMailer(FrappeTestCase):
+	def setUp(self):
+		SinkSMTP.connections = []
+		SinkSMTP.dropped = set()
+		SinkSMTP.requires_login = False
+		SinkSMTP.login_failures = 0
+	
+	def send_batch(self, messages, concurrency=mailer.MAIL_CONCURRENCY, settings=SINK_SETTINGS):
+		db = MagicMock()
+		with patch("smspro.sms_pro.mailer.get_smtp_settings", return_value=settings), \
+				patch("smspro.sms_pro.mailer.frappe.db", db), \
+				patch("smspro.sms_pro.mailer.frappe.log_error") as log_error:
+			result = mailer.send_batch(messages, concurrency=concurrency)
+		
+		return result, db, log_error
+	
+	def test_connections_are_pooled(self):
+		messages = make_messages(*(f"student{i}@example.com" for i in range(10)))
+		
+		result, db, _log_error = self.send_batch(messages, concurrency=2)
+		
+		self.assertEqual(result, {"sent": 10, "failed": 0})
+		self.assertEqual(len(SinkSMTP.connections), 2)
+		self.assertEqual([len(c.sent) for c in SinkSMTP.connections], [5, 5])
+		self.assertTrue(all(c.closed for c in SinkSMTP.connections))
+		db.commit.assert_called_once()
+	
+	def test_pool_is_not_larger_than_the_batch(self):
+		self.send_batch(make_messages("a@example.com", "b@example.com"), concurrency=8)
+		
+		self.assertEqual(len(SinkSMTP.connections), 2)
+	
+	def test_permanent_failures_only_fail_their_message(self):
+		messages = make_messages("ok@example.com", "refused@example.com", "rejected@example.com", "ok2@example.com")
+		
+		result, db, log_error = self.send_batch(messages, concurrency=1)
+		
+		self.assertEqual(result, {"sent": 2, "failed": 2})
+		# Permanent errors are not retried and keep the connection open
+		self.assertEqual(len(SinkSMTP.connections), 1)
+		self.assertEqual(SinkSMTP.connections[0].sent, ["ok@example.com", "ok2@example.com"])
+		
+		sent_update, error_update = db.sql.call_args_list
+		self.assertIn("'Sent'", sent_update.args[0])
+		self.assertEqual(sent_update.args[1]["names"], ("COMM-0", "COMM-3"))
+		self.assertIn("'Error'", error_update.args[0])
+		self.assertEqual(error_update.args[1]["names"], ("COMM-1", "COMM-2"))
+		log_error.assert_called_once()
+	
+	def test_transient_failure_reconnects_and_retries(self):
+		result, _db, _log_error = self.send_batch(make_messages("flaky@example.com", "ok@example.com"), concurrency=1)
+		
+		self.assertEqual(result, {"sent": 2, "failed": 0})
+		self.assertEqual(len(SinkSMTP.connections), 2)
+		self.assertEqual(SinkSMTP.connections[1].sent, ["flaky@example.com", "ok@example.com"])
+	
+	def test_transient_failure_gives_up_after_max_retries(self):
+		result, _db, _log_error = self.send_batch(make_messages("down@example.com"), concurrency=1)
+		
+		self.assertEqual(result, {"sent": 0, "failed": 1})
+		self.assertEqual(len(SinkSMTP.connections), mailer.MAIL_MAX_RETRIES + 1)
+	
+	def test_failed_login_does_not_leave_the_connection_open(self):
+		SinkSMTP.requires_login = True
+		SinkSMTP.login_failures = 1
+		
+		result, _db, _log_error = self.send_batch(
+			make_messages("first@example.com", "second@example.com"), concurrency=1, settings=LOGIN_SETTINGS
+		)
+		
+		# The authentication error fails its message, the next one logs in again
+		self.assertEqual(result, {"sent": 1, "failed": 1})
+		self.assertEqual(len(SinkSMTP.connections), 2)
+		self.assertTrue(SinkSMTP.connections[0].closed)
+		self.assertEqual(SinkSMTP.connections[1].sent, ["second@example.com"])
+	
+	def test_queue_emails_enqueues_batches(self):
+		messages = [
+			{"recipient": f"student{i}@example.com", "subject": "Reminder", "content": "Due"}
+			for i in range(mailer.MAIL_BATCH_SIZE * 2 + 50)
+		]
+		
+		with patch("smspro.sms_pro.mailer.frappe.db") as db, \
+				patch("smspro.sms_pro.mailer.frappe.enqueue") as enqueue:
+			queued = mailer.queue_emails(messages)
+		
+		self.assertEqual(queued, len(messages))
+		db.bulk_insert.assert_called_once()
+		self.assertEqual(len(db.bulk_insert.call_args.kwargs["values"]), len(messages))
+		self.assertEqual(
+			[len(call.kwargs["messages"]) for call in enqueue.call_args_list],
+			[mailer.MAIL_BATCH_SIZE, mailer.MAIL_BATCH_SIZE, 50]
+		)
+		self.assertTrue(all(call.kwargs["enqueue_after_commit"] for call in enqueue.call_args_list))
@@ -0,0 +1,148 @@
+# Copyright (c) 2024, Mr Linh Vu and contributors
+# For license information, please see license.txt
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from smspro.sms_pro import notification_gateway as gateway
+
+
+class StubResponse:
+	"""aiohttp response with a fixed status and raw body"""
+	
+	def __init__(self, status, body):
+		self.status = status
+		self.body = body
+		self.content_length = len(body)
+	
+	async def json(self, content_type="application/json"):
+		return json.loads(self.body)
+	
+	async def text(self):
+		return self.body
+	
+	async def __aenter__(self):
+		return self
+	
+	async def __aexit__(self, *exc):
+		return False
+
+
+class StubSession:
+	"""aiohttp session answering each post with the next response"""
+	
+	def __init__(self, *responses):
+		self.responses = list(responses)
+		self.requests = []
+	
+	def post(self, url, json=None, headers=None):
+		self.requests.append((url, json, headers))
+		return self.responses.pop(0)
+
+
+def make_row(attempts=0):
+	return frappe._dict({
+		"name": "LOG-1",
+		"channel": "SMS",
+		"recipient": "84901234567",
+		"message": "Hello",
+		"idempotency_key": "key-1",
+		"attempts": attempts
+	})
+
+
+def make_provider(*responses):
+	provider = gateway.Provider("SMS", {"url": "http://stub/send", "api_key": "secret", "rate_limit": 0})
+	provider.session = StubSession(*responses)
+	return provider
+
+
+@patch("smspro.sms_pro.notification_gateway.asyncio.sleep", AsyncMock())
+class TestNotificationGateway(FrappeTestCase):
+	def send(self, provider, row=None):
+		return asyncio.run(provider.send(row or make_row()))
+	
+	def send_with_retry(self, provider, row=None):
+		return asyncio.run(gateway.send_with_retry(provider, row or make_row()))
+	
+	def test_success_returns_provider_message_id(self):
+		provider = make_provider(StubResponse(200, '{"id": "MSG-1"}'))
+		
+		self.assertEqual(self.send(provider), "MSG-1")
+		
+		_url, payload, headers = provider.session.requests[0]
+		self.assertEqual(payload["to"], "84901234567")
+		self.assertEqual(headers["Idempotency-Key"], "key-1")
+		self.assertEqual(headers["Authorization"], "Bearer secret")
+	
+	def test_server_errors_with_html_body_are_transient(self):
+		for status in (502, 503):
+			provider = make_provider(StubResponse(status, "<html><body>Bad Gateway</body></html>"))
+			
+			with self.assertRaises(gateway.TransientError):
+				self.send(provider)
+	
+	def test_throttling_is_transient(self):
+		provider = make_provider(StubResponse(429, "Too Many Requests"))
+		
+		with self.assertRaises(gateway.TransientError):
+			self.send(provider)
+	
+	def test_client_errors_are_permanent(self):
+		provider = make_provider(StubResponse(400, "invalid phone number"))
+		
+		with self.assertRaises(frappe.ValidationError):
+			self.send(provider)
+	
+	def test_unreadable_success_body_is_transient(self):
+		provider = make_provider(StubResponse(200, "OK"))
+		
+		with self.assertRaises(gateway.TransientError):
+			self.send(provider)
+	
+	def test_throttled_message_is_retried_under_the_same_key(self):
+		provider = make_provider(StubResponse(429, "Too Many Requests"), StubResponse(200, '{"id": "MSG-1"}'))
+		
+		self.assertEqual(self.send_with_retry(provider), ("Sent", "MSG-1", None, 2))
+		keys = {headers["Idempotency-Key"] for _url, _payload, headers in provider.session.requests}
+		self.assertEqual(keys, {"key-1"})
+	
+	def test_transient_failures_stop_after_inline_retries(self):
+		provider = make_provider(*(StubResponse(503, "") for _i in range(gateway.NOTIFICATION_INLINE_RETRIES + 1)))
+		
+		status, message_id, error, attempts = self.send_with_retry(provider)
+		
+		self.assertEqual((status, message_id, error), ("Failed", None, "HTTP 503"))
+		self.assertEqual(attempts, gateway.NOTIFICATION_INLINE_RETRIES + 1)
+		# Left below the limit, so the hourly retry picks the row up again
+		self.assertLess(attempts, gateway.NOTIFICATION_MAX_ATTEMPTS)
+	
+	def test_attempts_continue_from_earlier_runs(self):
+		provider = make_provider(StubResponse(503, ""), StubResponse(503, ""))
+		
+		_status, _message_id, _error, attempts = self.send_with_retry(
+			provider, make_row(attempts=gateway.NOTIFICATION_MAX_ATTEMPTS - 1)
+		)
+		
+		self.assertEqual(attempts, gateway.NOTIFICATION_MAX_ATTEMPTS)
+		self.assertEqual(len(provider.session.requests), 1)
+	
+	def test_permanent_failure_is_not_retried(self):
+		provider = make_provider(StubResponse(400, "invalid phone number"), StubResponse(200, '{"id": "MSG-1"}'))
+		
+		status, _message_id, error, attempts = self.send_with_retry(provider)
+		
+		self.assertEqual(status, "Failed")
+		self.assertIn("HTTP 400", error)
+		self.assertEqual(attempts, gateway.NOTIFICATION_MAX_ATTEMPTS)
+		self.assertEqual(len(provider.session.requests), 1)
+	
+	def test_missing_provider_fails_without_retry(self):
+		status, _message_id, _error, attempts = self.send_with_retry(None)
+		
+		self.assertEqual(status, "Failed")
+		self.assertEqual(attempts, gateway.NOTIFICATION_MAX_ATTEMPTS)